@@ -0,0 +1,161 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了CTA策略中常用的K线序列管理工具ArrayManager。
+
+策略中通常会缓存最近N根K线的开高低收，每根K线到来时用
+arr[0:n-1] = arr[1:n]的方式整体平移数组，再对整个数组调用talib计算指标。
+ArrayManager使用环形缓冲区保存K线数据，每根K线只写入一次，
+需要计算时才返回连续的numpy数组视图（不复制数据），
+同时在同一根K线内缓存已经计算过的指标结果，避免重复计算。
+
+使用方法：
+self.am = ArrayManager(100)         # 在策略的__init__中创建
+self.am.updateBar(bar)              # 在onBar中更新K线
+if not self.am.inited:              # 数据量不足时不计算指标
+    return
+atr = self.am.atr(22)               # 计算指标
+'''
+
+from __future__ import division
+
+import talib
+
+from ctaRingBuffer import RingBuffer
+
+
+########################################################################
+class ArrayManager(object):
+    """K线序列管理工具，负责保存K线数据和计算技术指标"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, size=100):
+        """Constructor"""
+        self.size = size        # 缓存的K线数量
+        self.count = 0          # 已经更新的K线数量
+        self.inited = False     # 缓存的K线数量是否已经达到size
+
+        self.openBuffer = RingBuffer(size)
+        self.highBuffer = RingBuffer(size)
+        self.lowBuffer = RingBuffer(size)
+        self.closeBuffer = RingBuffer(size)
+        self.volumeBuffer = RingBuffer(size)
+
+        # 当前K线已经计算过的指标结果，key为(指标名, 参数...)
+        self.cache = {}
+
+    #----------------------------------------------------------------------
+    def updateBar(self, bar):
+        """更新K线"""
+        self.openBuffer.append(bar.open)
+        self.highBuffer.append(bar.high)
+        self.lowBuffer.append(bar.low)
+        self.closeBuffer.append(bar.close)
+        self.volumeBuffer.append(bar.volume)
+
+        self.count += 1
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+
+        # 新的K线到来后，之前缓存的指标结果失效
+        self.cache.clear()
+
+    #----------------------------------------------------------------------
+    @property
+    def open(self):
+        """开盘价序列"""
+        return self.openBuffer.array
+
+    #----------------------------------------------------------------------
+    @property
+    def high(self):
+        """最高价序列"""
+        return self.highBuffer.array
+
+    #----------------------------------------------------------------------
+    @property
+    def low(self):
+        """最低价序列"""
+        return self.lowBuffer.array
+
+    #----------------------------------------------------------------------
+    @property
+    def close(self):
+        """收盘价序列"""
+        return self.closeBuffer.array
+
+    #----------------------------------------------------------------------
+    @property
+    def volume(self):
+        """成交量序列"""
+        return self.volumeBuffer.array
+
+    #----------------------------------------------------------------------
+    def getResult(self, key, func, array):
+        """
+        从缓存中读取指标结果，没有则调用func计算后缓存
+        array为True时返回整个指标序列，否则返回最新的数值
+        """
+        result = self.cache.get(key)
+        if result is None:
+            result = func()
+            self.cache[key] = result
+
+        if array:
+            return result
+        return result[-1]
+
+    #----------------------------------------------------------------------
+    def sma(self, n, array=False):
+        """简单移动平均"""
+        return self.getResult(('sma', n),
+                              lambda: talib.SMA(self.close, n),
+                              array)
+
+    #----------------------------------------------------------------------
+    def ema(self, n, array=False):
+        """指数移动平均"""
+        return self.getResult(('ema', n),
+                              lambda: talib.EMA(self.close, n),
+                              array)
+
+    #----------------------------------------------------------------------
+    def std(self, n, array=False):
+        """标准差"""
+        return self.getResult(('std', n),
+                              lambda: talib.STDDEV(self.close, n),
+                              array)
+
+    #----------------------------------------------------------------------
+    def atr(self, n, array=False):
+        """平均真实波幅"""
+        return self.getResult(('atr', n),
+                              lambda: talib.ATR(self.high, self.low, self.close, n),
+                              array)
+
+    #----------------------------------------------------------------------
+    def rsi(self, n, array=False):
+        """相对强弱指数"""
+        return self.getResult(('rsi', n),
+                              lambda: talib.RSI(self.close, n),
+                              array)
+
+    #----------------------------------------------------------------------
+    def boll(self, n, dev, array=False):
+        """布林通道，返回(上轨, 下轨)"""
+        mid = self.sma(n, array)
+        std = self.std(n, array)
+
+        up = mid + std * dev
+        down = mid - std * dev
+        return up, down
+
+    #----------------------------------------------------------------------
+    def keltner(self, n, dev, array=False):
+        """肯特纳通道，返回(上轨, 下轨)"""
+        mid = self.sma(n, array)
+        atr = self.atr(n, array)
+
+        up = mid + atr * dev
+        down = mid - atr * dev
+        return up, down
@@ -10,12 +10,20 @@ from datetime import datetime, timedelta
 from collections import OrderedDict
 from itertools import product
 import multiprocessing
+import tempfile
+import shutil
+import os
 import pymongo
+import numpy as np
 
 from ctaBase import *
 from vtConstant import *
 from vtGateway import VtOrderData, VtTradeData
 from vtFunction import loadMongoSetting
+from ctaDataArray import CtaDataArray, loadDataArray
+from ctaDataCache import CtaDataCache
+from ctaTickStore import TickStore
+from ctaOrderBook import OrderBook
 
 
 ########################################################################
@@ -40,6 +48,7 @@ class BacktestingEngine(object):
         # key为stopOrderID，value为stopOrder对象
         self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
+        self.stopOrderBook = OrderBook(stop=True)   # 按价格排序的停止单簿，用于撮合
 
         # 引擎类型为回测
         self.engineType = ENGINETYPE_BACKTESTING
@@ -62,7 +71,12 @@ class BacktestingEngine(object):
         
         #self.historyData = []       # 历史数据的列表，回测用
         self.initData = []          # 初始化用的数据
-        #self.backtestingData = []   # 回测用的数据
+        self.backtestingData = None # 回测用的数据（列式数组模式下使用）
+        
+        self.arrayMode = False      # 是否使用列式数组载入历史数据
+        self.dataCache = None       # 本地历史数据缓存（列式数组模式下使用）
+        self.tickStore = None       # 本地压缩Tick存储（列式数组的Tick模式下使用）
+        self.dataPreset = False     # 历史数据是否已经由外部设置（多进程优化时使用）
         
         self.dbName = ''            # 回测数据库名
         self.symbol = ''            # 回测集合名
@@ -73,6 +87,7 @@ class BacktestingEngine(object):
         
         self.limitOrderDict = OrderedDict()         # 限价单字典
         self.workingLimitOrderDict = OrderedDict()  # 活动限价单字典，用于进行撮合用
+        self.limitOrderBook = OrderBook()           # 按价格排序的限价单簿，用于撮合
         self.limitOrderCount = 0                    # 限价单编号
         
         self.tradeCount = 0             # 成交编号
@@ -110,6 +125,42 @@ class BacktestingEngine(object):
         """设置回测模式"""
         self.mode = mode
     
+    #----------------------------------------------------------------------
+    def setArrayMode(self, arrayMode=True):
+        """设置是否使用列式数组载入历史数据（只投影所需字段，批量读取）"""
+        self.arrayMode = arrayMode
+    
+    #----------------------------------------------------------------------
+    def setCachePath(self, cachePath=''):
+        """
+        设置本地历史数据缓存，设置后会自动使用列式数组模式
+        cachePath：缓存目录，为空则使用默认目录
+        """
+        self.dataCache = CtaDataCache(cachePath)
+        self.arrayMode = True
+    
+    #----------------------------------------------------------------------
+    def setTickStore(self, storePath=''):
+        """
+        设置本地压缩Tick存储，Tick模式回测时直接从存储中读取，不再查询数据库，
+        设置后会自动使用列式数组模式
+        storePath：存储目录，为空则使用默认目录
+        """
+        self.tickStore = TickStore(storePath)
+        self.arrayMode = True
+    
+    #----------------------------------------------------------------------
+    def setHistoryData(self, initData, backtestingData):
+        """
+        直接设置列式历史数据，回测时不再从数据库载入
+        initData：初始化用的数据，CtaDataArray
+        backtestingData：回测用的数据，CtaDataArray
+        """
+        self.initData = initData
+        self.backtestingData = backtestingData
+        self.arrayMode = True
+        self.dataPreset = True
+    
     #----------------------------------------------------------------------
     def setDatabase(self, dbName, symbol):
         """设置历史数据所用的数据库"""
@@ -119,6 +170,15 @@ class BacktestingEngine(object):
     #----------------------------------------------------------------------
     def loadHistoryData(self):
         """载入历史数据"""
+        # 历史数据已经设置好时无需再次载入
+        if self.dataPreset:
+            return
+        
+        # 列式数组模式
+        if self.arrayMode:
+            self.loadHistoryArray()
+            return
+        
         host, port, logging = loadMongoSetting()
         
         self.dbClient = pymongo.MongoClient(host, port)
@@ -137,13 +197,14 @@ class BacktestingEngine(object):
         # 载入初始化需要用的数据
         flt = {'datetime':{'$gte':self.dataStartDate,
                            '$lt':self.strategyStartDate}}        
+        
         initCursor = collection.find(flt)
         
         # 将数据从查询指针中读取出，并生成列表
         self.initData = []              # 清空initData列表
         for d in initCursor:
             data = dataClass()
-            data.__dict__ = d
+            data.fromDict(d)
             self.initData.append(data)      
         
         # 载入回测数据
@@ -156,6 +217,65 @@ class BacktestingEngine(object):
         
         self.output(u'载入完成，数据量：%s' %(initCursor.count() + self.dbCursor.count()))
         
+    #----------------------------------------------------------------------
+    def loadHistoryArray(self):
+        """以列式数组的方式载入历史数据"""
+        # 设置了本地Tick存储时，Tick数据直接从存储中读取
+        if self.tickStore and self.mode == self.TICK_MODE:
+            self.loadTickStore()
+            return
+        
+        host, port, logging = loadMongoSetting()
+        
+        self.dbClient = pymongo.MongoClient(host, port)
+        collection = self.dbClient[self.dbName][self.symbol]          
+
+        self.output(u'开始载入数据')
+        
+        # 设置了本地缓存时，从缓存中读取，缺失的部分才查询数据库
+        if self.dataCache:
+            self.initData = self.dataCache.loadData(collection, self.dataStartDate,
+                                                    self.strategyStartDate, self.mode)
+            
+            # 缓存的时间段为左闭右开，结束日期加1微秒以包含dataEndDate当时的数据
+            if not self.dataEndDate:
+                dataEndDate = None
+            else:
+                dataEndDate = self.dataEndDate + timedelta(microseconds=1)
+            self.backtestingData = self.dataCache.loadData(collection, self.strategyStartDate,
+                                                           dataEndDate, self.mode)
+        else:
+            flt = {'datetime':{'$gte':self.dataStartDate,
+                               '$lt':self.strategyStartDate}}
+            self.initData = loadDataArray(collection, flt, self.mode)
+            
+            if not self.dataEndDate:
+                flt = {'datetime':{'$gte':self.strategyStartDate}}
+            else:
+                flt = {'datetime':{'$gte':self.strategyStartDate,
+                                   '$lte':self.dataEndDate}}
+            self.backtestingData = loadDataArray(collection, flt, self.mode)
+            
+        self.output(u'载入完成，数据量：%s' %(len(self.initData) + len(self.backtestingData)))
+        
+    #----------------------------------------------------------------------
+    def loadTickStore(self):
+        """从本地压缩Tick存储中载入历史数据"""
+        self.output(u'开始从Tick存储载入数据')
+        
+        self.initData = self.tickStore.read(self.dbName, self.symbol, 
+                                            self.dataStartDate, self.strategyStartDate)
+        
+        # 存储的时间段为左闭右开，结束日期加1微秒以包含dataEndDate当时的数据
+        if not self.dataEndDate:
+            dataEndDate = None
+        else:
+            dataEndDate = self.dataEndDate + timedelta(microseconds=1)
+        self.backtestingData = self.tickStore.read(self.dbName, self.symbol,
+                                                   self.strategyStartDate, dataEndDate)
+        
+        self.output(u'载入完成，数据量：%s' %(len(self.initData) + len(self.backtestingData)))
+        
     #----------------------------------------------------------------------
     def runBacktesting(self):
         """运行回测"""
@@ -182,10 +302,15 @@ class BacktestingEngine(object):
         
         self.output(u'开始回放数据')
 
-        for d in self.dbCursor:
-            data = dataClass()
-            data.__dict__ = d
-            func(data)     
+        if self.arrayMode:
+            # 列式数组模式下推送的是行视图对象
+            for data in self.backtestingData:
+                func(data)
+        else:
+            for d in self.dbCursor:
+                data = dataClass()
+                data.fromDict(d)
+                func(data)     
             
         self.output(u'数据回放结束')
         
@@ -248,6 +373,7 @@ class BacktestingEngine(object):
         # 保存到限价单字典中
         self.workingLimitOrderDict[orderID] = order
         self.limitOrderDict[orderID] = order
+        self.limitOrderBook.addOrder(orderID, order.direction, order.price, order)
         
         return orderID
     
@@ -259,6 +385,7 @@ class BacktestingEngine(object):
             order.status = STATUS_CANCELLED
             order.cancelTime = str(self.dt)
             del self.workingLimitOrderDict[vtOrderID]
+            self.limitOrderBook.removeOrder(vtOrderID)
         
     #----------------------------------------------------------------------
     def sendStopOrder(self, vtSymbol, orderType, price, volume, strategy):
@@ -290,6 +417,7 @@ class BacktestingEngine(object):
         # 保存stopOrder对象到字典中
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
+        self.stopOrderBook.addOrder(stopOrderID, so.direction, so.price, so)
         
         return stopOrderID
     
@@ -301,6 +429,7 @@ class BacktestingEngine(object):
             so = self.workingStopOrderDict[stopOrderID]
             so.status = STOPORDER_CANCELLED
             del self.workingStopOrderDict[stopOrderID]
+            self.stopOrderBook.removeOrder(stopOrderID)
             
     #----------------------------------------------------------------------
     def crossLimitOrder(self):
@@ -317,57 +446,60 @@ class BacktestingEngine(object):
             buyBestCrossPrice = self.tick.askPrice1
             sellBestCrossPrice = self.tick.bidPrice1
         
-        # 遍历限价单字典中的所有限价单
-        for orderID, order in self.workingLimitOrderDict.items():
-            # 判断是否会成交
-            buyCross = (order.direction==DIRECTION_LONG and 
-                        order.price>=buyCrossPrice and
-                        buyCrossPrice > 0)      # 国内的tick行情在涨停时askPrice1为0，此时买无法成交
-            
-            sellCross = (order.direction==DIRECTION_SHORT and 
-                         order.price<=sellCrossPrice and
-                         sellCrossPrice > 0)    # 国内的tick行情在跌停时bidPrice1为0，此时卖无法成交
-            
-            # 如果发生了成交
-            if buyCross or sellCross:
-                # 推送成交数据
-                self.tradeCount += 1            # 成交编号自增1
-                tradeID = str(self.tradeCount)
-                trade = VtTradeData()
-                trade.vtSymbol = order.vtSymbol
-                trade.tradeID = tradeID
-                trade.vtTradeID = tradeID
-                trade.orderID = order.orderID
-                trade.vtOrderID = order.orderID
-                trade.direction = order.direction
-                trade.offset = order.offset
-                
-                # 以买入为例：
-                # 1. 假设当根K线的OHLC分别为：100, 125, 90, 110
-                # 2. 假设在上一根K线结束(也是当前K线开始)的时刻，策略发出的委托为限价105
-                # 3. 则在实际中的成交价会是100而不是105，因为委托发出时市场的最优价格是100
-                if buyCross:
-                    trade.price = min(order.price, buyBestCrossPrice)
-                    self.strategy.pos += order.totalVolume
-                else:
-                    trade.price = max(order.price, sellBestCrossPrice)
-                    self.strategy.pos -= order.totalVolume
-                
-                trade.volume = order.totalVolume
-                trade.tradeTime = str(self.dt)
-                trade.dt = self.dt
-                self.strategy.onTrade(trade)
-                
-                self.tradeDict[tradeID] = trade
-                
-                # 推送委托数据
-                order.tradedVolume = order.totalVolume
-                order.status = STATUS_ALLTRADED
-                self.strategy.onOrder(order)
-                
-                # 从字典中删除该限价单
-                del self.workingLimitOrderDict[orderID]
-                
+        # 国内的tick行情在涨停时askPrice1为0，此时买无法成交；跌停时bidPrice1为0，此时卖无法成交
+        if buyCrossPrice <= 0:
+            buyCrossPrice = None
+        if sellCrossPrice <= 0:
+            sellCrossPrice = None
+        
+        # 从限价单簿中取出会成交的限价单（买单价格>=buyCrossPrice，卖单价格<=sellCrossPrice），按委托顺序撮合
+        for order in self.limitOrderBook.popCrossed(buyCrossPrice, sellCrossPrice):
+            orderID = order.orderID
+            
+            # 在之前的成交推送中被策略撤销的委托不再成交
+            if orderID not in self.workingLimitOrderDict:
+                continue
+            
+            buyCross = order.direction==DIRECTION_LONG
+            
+            # 推送成交数据
+            self.tradeCount += 1            # 成交编号自增1
+            tradeID = str(self.tradeCount)
+            trade = VtTradeData()
+            trade.vtSymbol = order.vtSymbol
+            trade.tradeID = tradeID
+            trade.vtTradeID = tradeID
+            trade.orderID = order.orderID
+            trade.vtOrderID = order.orderID
+            trade.direction = order.direction
+            trade.offset = order.offset
+            
+            # 以买入为例：
+            # 1. 假设当根K线的OHLC分别为：100, 125, 90, 110
+            # 2. 假设在上一根K线结束(也是当前K线开始)的时刻，策略发出的委托为限价105
+            # 3. 则在实际中的成交价会是100而不是105，因为委托发出时市场的最优价格是100
+            if buyCross:
+                trade.price = min(order.price, buyBestCrossPrice)
+                self.strategy.pos += order.totalVolume
+            else:
+                trade.price = max(order.price, sellBestCrossPrice)
+                self.strategy.pos -= order.totalVolume
+            
+            trade.volume = order.totalVolume
+            trade.tradeTime = str(self.dt)
+            trade.dt = self.dt
+            self.strategy.onTrade(trade)
+            
+            self.tradeDict[tradeID] = trade
+            
+            # 推送委托数据
+            order.tradedVolume = order.totalVolume
+            order.status = STATUS_ALLTRADED
+            self.strategy.onOrder(order)
+            
+            # 从字典中删除该限价单
+            del self.workingLimitOrderDict[orderID]
+            
     #----------------------------------------------------------------------
     def crossStopOrder(self):
         """基于最新数据撮合停止单"""
@@ -381,65 +513,67 @@ class BacktestingEngine(object):
             sellCrossPrice = self.tick.lastPrice
             bestCrossPrice = self.tick.lastPrice
         
-        # 遍历停止单字典中的所有停止单
-        for stopOrderID, so in self.workingStopOrderDict.items():
-            # 判断是否会成交
-            buyCross = so.direction==DIRECTION_LONG and so.price<=buyCrossPrice
-            sellCross = so.direction==DIRECTION_SHORT and so.price>=sellCrossPrice
-            
-            # 如果发生了成交
-            if buyCross or sellCross:
-                # 推送成交数据
-                self.tradeCount += 1            # 成交编号自增1
-                tradeID = str(self.tradeCount)
-                trade = VtTradeData()
-                trade.vtSymbol = so.vtSymbol
-                trade.tradeID = tradeID
-                trade.vtTradeID = tradeID
-                
-                if buyCross:
-                    self.strategy.pos += so.volume
-                    trade.price = max(bestCrossPrice, so.price)
-                else:
-                    self.strategy.pos -= so.volume
-                    trade.price = min(bestCrossPrice, so.price)                
-                
-                self.limitOrderCount += 1
-                orderID = str(self.limitOrderCount)
-                trade.orderID = orderID
-                trade.vtOrderID = orderID
-                
-                trade.direction = so.direction
-                trade.offset = so.offset
-                trade.volume = so.volume
-                trade.tradeTime = str(self.dt)
-                trade.dt = self.dt
-                self.strategy.onTrade(trade)
-                
-                self.tradeDict[tradeID] = trade
-                
-                # 推送委托数据
-                so.status = STOPORDER_TRIGGERED
-                
-                order = VtOrderData()
-                order.vtSymbol = so.vtSymbol
-                order.symbol = so.vtSymbol
-                order.orderID = orderID
-                order.vtOrderID = orderID
-                order.direction = so.direction
-                order.offset = so.offset
-                order.price = so.price
-                order.totalVolume = so.volume
-                order.tradedVolume = so.volume
-                order.status = STATUS_ALLTRADED
-                order.orderTime = trade.tradeTime
-                self.strategy.onOrder(order)
-                
-                self.limitOrderDict[orderID] = order
-                
-                # 从字典中删除该限价单
-                if stopOrderID in self.workingStopOrderDict:
-                    del self.workingStopOrderDict[stopOrderID]        
+        # 从停止单簿中取出会触发的停止单（买单价格<=buyCrossPrice，卖单价格>=sellCrossPrice），按委托顺序撮合
+        for so in self.stopOrderBook.popCrossed(buyCrossPrice, sellCrossPrice):
+            stopOrderID = so.stopOrderID
+            
+            # 在之前的成交推送中被策略撤销的停止单不再触发
+            if stopOrderID not in self.workingStopOrderDict:
+                continue
+            
+            buyCross = so.direction==DIRECTION_LONG
+            
+            # 推送成交数据
+            self.tradeCount += 1            # 成交编号自增1
+            tradeID = str(self.tradeCount)
+            trade = VtTradeData()
+            trade.vtSymbol = so.vtSymbol
+            trade.tradeID = tradeID
+            trade.vtTradeID = tradeID
+            
+            if buyCross:
+                self.strategy.pos += so.volume
+                trade.price = max(bestCrossPrice, so.price)
+            else:
+                self.strategy.pos -= so.volume
+                trade.price = min(bestCrossPrice, so.price)                
+            
+            self.limitOrderCount += 1
+            orderID = str(self.limitOrderCount)
+            trade.orderID = orderID
+            trade.vtOrderID = orderID
+            
+            trade.direction = so.direction
+            trade.offset = so.offset
+            trade.volume = so.volume
+            trade.tradeTime = str(self.dt)
+            trade.dt = self.dt
+            self.strategy.onTrade(trade)
+            
+            self.tradeDict[tradeID] = trade
+            
+            # 推送委托数据
+            so.status = STOPORDER_TRIGGERED
+            
+            order = VtOrderData()
+            order.vtSymbol = so.vtSymbol
+            order.symbol = so.vtSymbol
+            order.orderID = orderID
+            order.vtOrderID = orderID
+            order.direction = so.direction
+            order.offset = so.offset
+            order.price = so.price
+            order.totalVolume = so.volume
+            order.tradedVolume = so.volume
+            order.status = STATUS_ALLTRADED
+            order.orderTime = trade.tradeTime
+            self.strategy.onOrder(order)
+            
+            self.limitOrderDict[orderID] = order
+            
+            # 从字典中删除该停止单
+            if stopOrderID in self.workingStopOrderDict:
+                del self.workingStopOrderDict[stopOrderID]
 
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
@@ -781,11 +915,13 @@ class BacktestingEngine(object):
         self.limitOrderCount = 0
         self.limitOrderDict.clear()
         self.workingLimitOrderDict.clear()        
+        self.limitOrderBook.clear()
         
         # 清空停止单相关
         self.stopOrderCount = 0
         self.stopOrderDict.clear()
         self.workingStopOrderDict.clear()
+        self.stopOrderBook.clear()
         
         # 清空成交相关
         self.tradeCount = 0
@@ -802,18 +938,34 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
         
-        # 多进程优化，启动一个对应CPU核心数量的进程池
-        pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        l = []
-
-        for setting in settingList:
-            l.append(pool.apply_async(optimize, (strategyClass, setting,
-                                                 targetName, self.mode, 
-                                                 self.startDate, self.initDays, self.endDate,
-                                                 self.slippage, self.rate, self.size,
-                                                 self.dbName, self.symbol)))
-        pool.close()
-        pool.join()
+        # 列式数组模式下，历史数据只在主进程中载入一次，各个子进程以只读内存映射的方式
+        # 打开同一个文件，共享操作系统的页缓存；否则和单进程优化相同，每个子进程自行载入
+        tempPath = ''
+        if self.arrayMode:
+            if not self.dataPreset:
+                self.loadHistoryArray()
+            
+            tempPath = tempfile.mkdtemp(prefix='ctaOptimization')
+            initSpec, backtestingSpec = self.getSharedDataSpec(tempPath)
+            pool = multiprocessing.Pool(multiprocessing.cpu_count(), initOptimizeProcess,
+                                        (initSpec, backtestingSpec, self.mode,
+                                         self.backtestingData.getSymbolDict()))
+        else:
+            pool = multiprocessing.Pool(multiprocessing.cpu_count())
+        
+        try:
+            l = []
+            for setting in settingList:
+                l.append(pool.apply_async(optimize, (strategyClass, setting,
+                                                     targetName, self.mode, 
+                                                     self.startDate, self.initDays, self.endDate,
+                                                     self.slippage, self.rate, self.size,
+                                                     self.dbName, self.symbol)))
+            pool.close()
+            pool.join()
+        finally:
+            if tempPath:
+                shutil.rmtree(tempPath, ignore_errors=True)
         
         # 显示结果
         resultList = [res.get() for res in l]
@@ -823,6 +975,41 @@ class BacktestingEngine(object):
         for result in resultList:
             self.output(u'%s: %s' %(result[0], result[1]))    
             
+    #----------------------------------------------------------------------
+    def getSharedDataSpec(self, tempPath):
+        """
+        获取多进程优化时子进程打开历史数据的方式，返回初始化数据和回测数据的
+        (文件路径, 开始时间, 结束时间)，开始和结束时间为None时表示使用整个文件
+        本地缓存中已有包含对应时间段所有数据的文件时直接使用，否则保存到tempPath下的临时文件
+        """
+        # 载入历史数据时使用的时间段，和loadHistoryArray一致
+        if self.dataEndDate:
+            dataEndDate = self.dataEndDate + timedelta(microseconds=1)
+        else:
+            dataEndDate = None
+        
+        useCache = (self.dataCache and not self.dataPreset and
+                    not (self.tickStore and self.mode == self.TICK_MODE))
+        
+        specList = []
+        for name, data, start, end in [('init', self.initData, 
+                                        self.dataStartDate, self.strategyStartDate),
+                                       ('backtesting', self.backtestingData,
+                                        self.strategyStartDate, dataEndDate)]:
+            # 不限结束时间时包含今天的数据，不在缓存文件中
+            if useCache and end:
+                fileName = self.dataCache.getCachedFile(self.dbName, self.symbol, self.mode,
+                                                        start, end, len(data))
+                if fileName:
+                    specList.append((fileName, start, end))
+                    continue
+            
+            fileName = os.path.join(tempPath, name + '.npy')
+            np.save(fileName, data.array)
+            specList.append((fileName, None, None))
+        
+        return specList
+    
     #----------------------------------------------------------------------
     def roundToPriceTick(self, price):
         """取整价格到合约最小价格变动"""
@@ -924,6 +1111,26 @@ def formatNumber(n):
     return format(rn, ',')  # 加上千分符
     
 
+# 多进程优化时子进程共享的历史数据，(initData, backtestingData)
+sharedHistoryData = None
+
+#----------------------------------------------------------------------
+def initOptimizeProcess(initSpec, backtestingSpec, mode, symbolDict):
+    """
+    多进程优化时子进程的初始化函数，以只读内存映射的方式打开历史数据
+    initSpec/backtestingSpec：(文件路径, 开始时间, 结束时间)，时间不为None时切出对应时间段
+    """
+    global sharedHistoryData
+    
+    l = []
+    for fileName, start, end in [initSpec, backtestingSpec]:
+        array = np.load(fileName, mmap_mode='r')
+        if start is not None:
+            array = CtaDataCache().sliceArray(array, start, end)
+        l.append(CtaDataArray(array, mode, **symbolDict))
+    
+    sharedHistoryData = tuple(l)
+
 #----------------------------------------------------------------------
 def optimize(strategyClass, setting, targetName,
              mode, startDate, initDays, endDate,
@@ -939,6 +1146,10 @@ def optimize(strategyClass, setting, targetName,
     engine.setSize(size)
     engine.setDatabase(dbName, symbol)
     
+    # 使用主进程共享的历史数据，无需再从数据库载入
+    if sharedHistoryData:
+        engine.setHistoryData(*sharedHistoryData)
+    
     engine.initStrategy(strategyClass, setting)
     engine.runBacktesting()
     d = engine.calculateBacktestingResult()
@@ -41,6 +41,7 @@ ENGINETYPE_TRADING = 'trading'          # 实盘
 
 # CTA引擎中涉及的数据类定义
 from vtConstant import EMPTY_UNICODE, EMPTY_STRING, EMPTY_FLOAT, EMPTY_INT
+from vtFunction import SlotsData
 
 
 ########################################################################
@@ -63,8 +64,11 @@ class StopOrder(object):
 
 
 ########################################################################
-class CtaBarData(object):
+class CtaBarData(SlotsData):
     """K线数据"""
+    __slots__ = ('vtSymbol', 'symbol', 'exchange', 'open', 'high', 'low', 'close', 'date',
+                 'time', 'datetime', 'volume', 'openInterest', 'color')
+    # color为CtaLineBar中使用的K线颜色，只在需要时赋值，不写入数据库
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -87,8 +91,14 @@ class CtaBarData(object):
 
 
 ########################################################################
-class CtaTickData(object):
+class CtaTickData(SlotsData):
     """Tick数据"""
+    __slots__ = ('vtSymbol', 'symbol', 'exchange', 'lastPrice', 'volume', 'openInterest',
+                 'upperLimit', 'lowerLimit', 'date', 'time', 'datetime', 'bidPrice1',
+                 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5', 'askPrice1', 'askPrice2',
+                 'askPrice3', 'askPrice4', 'askPrice5', 'bidVolume1', 'bidVolume2', 'bidVolume3',
+                 'bidVolume4', 'bidVolume5', 'askVolume1', 'askVolume2', 'askVolume3',
+                 'askVolume4', 'askVolume5')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -0,0 +1,562 @@
+# encoding: UTF-8
+
+'''
+本文件中包含了CTA模块相关的性能测试函数，直接运行本文件即可进行测试。
+部分测试需要MongoDB中已经导入了对应的历史数据。
+'''
+
+from __future__ import division
+
+import os
+import sys
+import time
+import random
+import copy
+import tempfile
+import shutil
+from datetime import datetime, timedelta
+
+import numpy as np
+import pymongo
+
+from ctaBase import *
+from vtFunction import loadMongoSetting, parseTickTime
+from ctaDataArray import CtaDataArray, loadDataArray, BAR_MODE, TICK_MODE, TICK_DTYPE
+from ctaTickStore import TickStore
+from ctaIndicator import (RollingSum, Ema, Atr, Rsi, WindowRsi, Boll,
+                          getTrueRange, getDirectionalMove)
+
+
+#----------------------------------------------------------------------
+def printResult(name, cost, count):
+    """打印测试结果"""
+    if cost:
+        speed = count / cost
+    else:
+        speed = 0
+    print u'%s：耗时%.3f秒，数据量%s，每秒%.0f条' %(name, cost, count, speed)
+
+
+#----------------------------------------------------------------------
+def benchmarkLoading(dbName=MINUTE_DB_NAME, symbol='IF0000',
+                     startDate='20120101', endDate='', mode=BAR_MODE):
+    """比较逐条创建对象和列式数组两种历史数据载入方式的速度"""
+    host, port, logging = loadMongoSetting()
+    client = pymongo.MongoClient(host, port)
+    collection = client[dbName][symbol]
+
+    flt = {'datetime': {'$gte': datetime.strptime(startDate, '%Y%m%d')}}
+    if endDate:
+        flt['datetime']['$lte'] = datetime.strptime(endDate, '%Y%m%d')
+
+    if mode == BAR_MODE:
+        dataClass = CtaBarData
+        fieldName = 'close'
+    else:
+        dataClass = CtaTickData
+        fieldName = 'lastPrice'
+
+    # 原有的逐条载入方式，遍历时读取一个价格字段和时间
+    start = time.time()
+    l = []
+    for d in collection.find(flt):
+        data = dataClass()
+        data.fromDict(d)
+        l.append(data)
+    for data in l:
+        data.__getattribute__(fieldName)
+        data.datetime
+    printResult(u'逐条对象载入', time.time()-start, len(l))
+
+    # 列式数组载入方式，遍历行视图读取相同的字段
+    start = time.time()
+    dataArray = loadDataArray(collection, flt, mode)
+    for data in dataArray:
+        getattr(data, fieldName)
+        data.datetime
+    printResult(u'列式数组载入', time.time()-start, len(dataArray))
+
+
+#----------------------------------------------------------------------
+def generateClose(count, seed=0):
+    """生成随机游走的收盘价序列"""
+    r = random.Random(seed)
+    price = 3000.0
+    l = []
+    for i in xrange(count):
+        price += r.choice([-2, -1, 0, 1, 2])
+        l.append(price)
+    return l
+
+
+#----------------------------------------------------------------------
+def benchmarkIndicator(count=20000, emaLen=21, rsiLen=7, bollLen=20, bollStdRate=2):
+    """比较每根K线调用talib和增量计算两种指标计算方式的速度"""
+    import talib as ta
+
+    closeList = generateClose(count)
+
+    # 原有的计算方式，每根K线取出窗口数据，转换为numpy数组后调用talib
+    start = time.time()
+    talibResult = []
+    for i in xrange(max(emaLen, rsiLen+1, bollLen)+1, count):
+        listClose = closeList[i-emaLen:i]
+        ema = ta.EMA(np.array(listClose, dtype=float), emaLen)[-1]
+
+        listClose = closeList[i-rsiLen-1:i+1]
+        rsi = ta.RSI(np.array(listClose, dtype=float), rsiLen)[-1]
+
+        listClose = closeList[i-bollLen:i]
+        upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
+                                         timeperiod=bollLen, nbdevup=bollStdRate,
+                                         nbdevdn=bollStdRate, matype=0)
+        talibResult.append((ema, rsi, upper[-1]))
+    talibCost = time.time() - start
+    printResult(u'talib窗口计算', talibCost, len(talibResult))
+
+    # 增量计算方式，每根K线只更新一次中间状态
+    start = time.time()
+    emaSum = RollingSum(emaLen)
+    rsi = WindowRsi(rsiLen)
+    boll = Boll(bollLen, bollStdRate)
+    streamResult = []
+    for i in xrange(count):
+        if i > max(emaLen, rsiLen+1, bollLen):
+            upper, middle, lower = boll.getValue()
+            streamResult.append((emaSum.mean(), rsi.getValue(closeList[i]), upper))
+
+        close = closeList[i]
+        emaSum.update(close)
+        rsi.update(close)
+        boll.update(close)
+    streamCost = time.time() - start
+    printResult(u'增量计算', streamCost, len(streamResult))
+
+    # 检查两种方式的结果差异
+    diff = 0
+    for talibValues, streamValues in zip(talibResult, streamResult):
+        for x, y in zip(talibValues, streamValues):
+            diff = max(diff, abs(x - y))
+    print u'单根K线耗时：talib %.2f微秒，增量 %.2f微秒，最大差异：%s' %(talibCost / len(talibResult) * 1000000,
+                                                         streamCost / len(streamResult) * 1000000,
+                                                         diff)
+
+
+#----------------------------------------------------------------------
+def generateBars(count, seed=0):
+    """生成随机游走的1分钟K线"""
+    r = random.Random(seed)
+    start = datetime(2015, 10, 9, 9, 15)
+    l = []
+    for i, close in enumerate(generateClose(count, seed)):
+        bar = CtaBarData()
+        bar.datetime = start + timedelta(minutes=i)
+        bar.open = close + r.choice([-1, 0, 1])
+        bar.high = max(bar.open, close) + r.choice([0, 1, 2])
+        bar.low = min(bar.open, close) - r.choice([0, 1, 2])
+        bar.close = close
+        bar.volume = r.randint(1, 100)
+        l.append(bar)
+    return l
+
+
+#----------------------------------------------------------------------
+def benchmarkStreamIndicator(count=20000, emaLen=21, atrLen=14, rsiLen=14, size=100):
+    """
+    比较ArrayManager方式（每根K线对最近size根K线调用talib）和增量计算的Ema、Atr、Rsi的速度，
+    并检查增量计算的结果和对全部数据调用talib的结果一致
+    """
+    import talib as ta
+
+    bars = generateBars(count)
+    highArray = np.array([bar.high for bar in bars], dtype=float)
+    lowArray = np.array([bar.low for bar in bars], dtype=float)
+    closeArray = np.array([bar.close for bar in bars], dtype=float)
+
+    # 每根K线对最近size根K线调用talib
+    start = time.time()
+    for i in xrange(size, count+1):
+        ta.EMA(closeArray[i-size:i], emaLen)[-1]
+        ta.ATR(highArray[i-size:i], lowArray[i-size:i], closeArray[i-size:i], atrLen)[-1]
+        ta.RSI(closeArray[i-size:i], rsiLen)[-1]
+    talibCost = time.time() - start
+    printResult(u'talib窗口计算', talibCost, count-size+1)
+
+    # 增量计算，每根K线只更新一次中间状态
+    ema = Ema(emaLen)
+    atr = Atr(atrLen)
+    rsi = Rsi(rsiLen)
+    streamResult = []
+    start = time.time()
+    for bar in bars:
+        streamResult.append((ema.update(bar.close),
+                             atr.update(bar.high, bar.low, bar.close),
+                             rsi.update(bar.close)))
+    streamCost = time.time() - start
+    printResult(u'增量计算', streamCost, count)
+
+    # 和对全部数据调用talib的结果比较（数据不足时talib返回nan，增量计算返回None）
+    talibResult = zip(ta.EMA(closeArray, emaLen), ta.ATR(highArray, lowArray, closeArray, atrLen),
+                      ta.RSI(closeArray, rsiLen))
+    diff = 0
+    for talibValues, streamValues in zip(talibResult, streamResult):
+        for x, y in zip(talibValues, streamValues):
+            if y is None:
+                if not np.isnan(x):
+                    diff = float('inf')
+            else:
+                diff = max(diff, abs(x - y))
+    print u'单根K线耗时：talib %.2f微秒，增量 %.2f微秒，最大差异：%s' %(talibCost / (count-size+1) * 1000000,
+                                                         streamCost / count * 1000000,
+                                                         diff)
+
+
+########################################################################
+class TalibIndicator(object):
+    """
+    CtaLineBar原有的指标计算方式，用于性能对比：
+    不保存中间状态，每根K线从lineBar中取出窗口数据，转换为numpy数组后调用talib
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, lineBar, period, func=None):
+        """Constructor"""
+        self.lineBar = lineBar
+        self.period = period
+        self.func = func
+        self.trSum = self       # 兼容Dmi的trSum.isFull()
+
+    #----------------------------------------------------------------------
+    def update(self, *args):
+        """原有方式不保存中间状态"""
+        pass
+
+    #----------------------------------------------------------------------
+    def isFull(self):
+        """原有方式不区分首次计算"""
+        return True
+
+    #----------------------------------------------------------------------
+    def getArray(self, field, start, end=None):
+        """取出lineBar中某个字段的窗口数据"""
+        return np.array([getattr(bar, field) for bar in self.lineBar.lineBar[start:end]],
+                        dtype=float)
+
+
+########################################################################
+class TalibEma(TalibIndicator):
+    """原有的EMA计算方式（不包含当前K线）"""
+
+    #----------------------------------------------------------------------
+    def mean(self):
+        """计算EMA"""
+        import talib as ta
+        return ta.EMA(self.getArray('close', -self.period-1, -1), self.period)[-1]
+
+
+########################################################################
+class TalibVolSum(TalibIndicator):
+    """原有的成交量求和方式（不包含当前K线）"""
+
+    #----------------------------------------------------------------------
+    @property
+    def sum(self):
+        """计算成交量之和"""
+        import talib as ta
+        return ta.SUM(self.getArray('volume', -self.period-1, -1), timeperiod=self.period)[-1]
+
+
+########################################################################
+class TalibRsi(TalibIndicator):
+    """原有的RSI计算方式（包含当前K线）"""
+
+    #----------------------------------------------------------------------
+    def getValue(self, close):
+        """计算RSI"""
+        import talib as ta
+        return ta.RSI(self.getArray('close', -self.period-2), self.period)[-1]
+
+
+########################################################################
+class TalibBoll(TalibIndicator):
+    """原有的布林带计算方式（不包含当前K线）"""
+
+    #----------------------------------------------------------------------
+    def getValue(self):
+        """计算(上轨, 中轨, 下轨)"""
+        import talib as ta
+
+        l = len(self.lineBar.lineBar)
+        if l < self.period+2:
+            bollLen = l-1
+        else:
+            bollLen = self.period
+
+        rate = self.lineBar.inputBollStdRate
+        upper, middle, lower = ta.BBANDS(self.getArray('close', -bollLen-1, -1),
+                                         timeperiod=bollLen, nbdevup=rate,
+                                         nbdevdn=rate, matype=0)
+        return upper[-1], middle[-1], lower[-1]
+
+
+########################################################################
+class TalibDmi(TalibIndicator):
+    """原有的DMI计算方式，每根K线对窗口内的真实波幅和动向重新求和"""
+
+    #----------------------------------------------------------------------
+    def getValue(self, *args):
+        """计算(上升动向, 下降动向, 趋向指标)"""
+        lineBar = self.lineBar.lineBar
+        tr = pdm = mdm = 0.0
+
+        for i in range(len(lineBar)-2, len(lineBar)-2-self.period, -1):
+            bar = lineBar[i]
+            preBar = lineBar[i-1]
+            tr += getTrueRange(bar.high, bar.low, preBar.close)
+            up, down = getDirectionalMove(bar.high, bar.low, preBar.high, preBar.low)
+            pdm += up
+            mdm += down
+
+        if tr == 0:
+            pdi = mdi = 0
+        else:
+            pdi = pdm * 100 / tr
+            mdi = mdm * 100 / tr
+
+        if pdi + mdi == 0:
+            dx = 0
+        else:
+            dx = 100 * abs(mdi - pdi) / (mdi + pdi)
+
+        return pdi, mdi, dx
+
+
+########################################################################
+class TalibAdx(TalibIndicator):
+    """原有的ADX计算方式，对lineDx调用talib.EMA"""
+
+    #----------------------------------------------------------------------
+    def getValue(self):
+        """计算ADX"""
+        import talib as ta
+        return ta.EMA(np.array(self.lineBar.lineDx[:], dtype=float), self.period)[-1]
+
+
+########################################################################
+class TalibExtreme(TalibIndicator):
+    """原有的最高、最低价计算方式，每根K线遍历窗口"""
+
+    #----------------------------------------------------------------------
+    def getValue(self, value=None):
+        """计算窗口内的最高或最低值"""
+        lineBar = self.lineBar.lineBar
+        field, func = self.func
+
+        # 前inputPreLen根K线（不包含当前K线）
+        if value is None:
+            return func([getattr(lineBar[i], field)
+                         for i in range(len(lineBar)-2, len(lineBar)-2-self.period, -1)])
+
+        # CMI：最近inputCmiLen根K线（包含当前K线）
+        return func([getattr(bar, field) for bar in lineBar[-self.period-1:]])
+
+
+#----------------------------------------------------------------------
+def benchmarkLineBar(count=20000):
+    """比较CtaLineBar.onBar使用增量指标和原有talib计算方式时每根K线的耗时"""
+    sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'tools'))
+    from ctaLineBar import CtaLineBar
+
+    class TalibLineBar(CtaLineBar):
+        """把增量计算的指标替换为原有计算方式的CtaLineBar"""
+
+        def _CtaLineBar__initIndicator(self):
+            """创建原有计算方式的指标"""
+            self.highMax = TalibExtreme(self, self.inputPreLen, ('high', max))
+            self.lowMin = TalibExtreme(self, self.inputPreLen, ('low', min))
+            self.ema1Sum = TalibEma(self, self.inputEma1Len)
+            self.ema2Sum = TalibEma(self, self.inputEma2Len)
+            self.dmi = TalibDmi(self, self.inputDmiLen)
+            self.adx = TalibAdx(self, self.inputDmiLen)
+            self.volSum = TalibVolSum(self, self.inputVolLen)
+            self.rsi = TalibRsi(self, self.inputRsiLen)
+            self.boll = TalibBoll(self, self.inputBollLen)
+            self.closeMax = TalibExtreme(self, self.inputCmiLen-1, ('close', max))
+            self.closeMin = TalibExtreme(self, self.inputCmiLen-1, ('close', min))
+
+    class Strategy(object):
+        """不输出日志的策略"""
+        def writeCtaLog(self, content):
+            pass
+
+    setting = {
+        'name': u'M1',
+        'barTimeInterval': 60,
+        'inputPreLen': 20,
+        'inputEma1Len': 7,
+        'inputEma2Len': 21,
+        'inputDmiLen': 14,
+        'inputDmiMax': 30,
+        'inputAtr1Len': 10,
+        'inputAtr2Len': 26,
+        'inputAtr3Len': 50,
+        'inputVolLen': 14,
+        'inputRsiLen': 7,
+        'inputCmiLen': 30,
+        'inputBollLen': 20,
+        'inputBollStdRate': 2
+    }
+
+    bars = generateBars(count)
+    resultList = []
+
+    for name, cls in [(u'原有talib计算', TalibLineBar), (u'增量计算', CtaLineBar)]:
+        lineBar = cls(Strategy(), lambda bar: None, setting)
+
+        start = time.time()
+        for bar in bars:
+            lineBar.curTick = bar
+            lineBar.addBar(copy.copy(bar))
+        cost = time.time() - start
+
+        print u'%s：每根K线%.2f微秒' %(name, cost / count * 1000000)
+        resultList.append(lineBar)
+
+    # 检查两种方式计算的指标序列差异
+    diff = 0
+    for key in ['preHigh', 'preLow', 'lineEma1', 'lineEma2', 'lineAdx', 'lineAtr1', 'lineAvgVol',
+                'lineRsi', 'lineCmi', 'lineUpperBand', 'lineLowerBand']:
+        for x, y in zip(getattr(resultList[0], key), getattr(resultList[1], key)):
+            diff = max(diff, abs(x - y))
+    print u'指标序列最大差异：%s' %diff
+
+
+#----------------------------------------------------------------------
+def getObjectSize(obj):
+    """对象本身和__dict__占用的内存（不包括属性值本身）"""
+    size = sys.getsizeof(obj)
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    return size
+
+
+#----------------------------------------------------------------------
+def benchmarkDataClass(count=200000):
+    """比较使用__slots__和使用__dict__的数据类的创建速度和内存占用"""
+    for dataClass in [CtaTickData, CtaBarData]:
+        # 使用相同的构造函数生成一个基于__dict__的对照类
+        dictClass = type('Dict' + dataClass.__name__, (object,),
+                         {'__init__': dataClass.__init__.im_func})
+
+        for cls in [dictClass, dataClass]:
+            start = time.time()
+            l = [cls() for i in xrange(count)]
+            cost = time.time() - start
+
+            print u'%s：创建耗时%.3f秒，每个对象%.2f微秒，占用内存%s字节' %(cls.__name__, cost,
+                                                             cost / count * 1000000,
+                                                             getObjectSize(l[0]))
+
+#----------------------------------------------------------------------
+def benchmarkTimestamp(count=200000):
+    """比较datetime.strptime和带缓存的parseTickTime解析tick时间的速度"""
+    date = '20151009'
+    timeList = ['%02d:%02d:%02d.%d' %(9 + i // 3600 % 6, i // 60 % 60, i % 60, i % 10)
+                for i in xrange(count)]
+    
+    start = time.time()
+    l1 = [datetime.strptime(' '.join([date, t]), '%Y%m%d %H:%M:%S.%f') for t in timeList]
+    printResult(u'strptime', time.time() - start, count)
+    
+    start = time.time()
+    l2 = [parseTickTime(date, t) for t in timeList]
+    printResult(u'parseTickTime', time.time() - start, count)
+    
+    # 检查两种方法的结果一致，纳秒时间戳的先后顺序和datetime相同
+    for dt, (fastDt, epochNs) in zip(l1, l2):
+        delta = dt - l1[0]
+        deltaNs = ((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds) * 1000
+        if dt != fastDt or epochNs != l2[0][1] + deltaNs:
+            print u'解析结果不一致：%s %s' %(dt, fastDt)
+            break
+
+#----------------------------------------------------------------------
+def generateTickArray(count, seed=0, priceTick=0.2):
+    """生成随机游走的Tick数据（每0.5秒一个Tick，价格按最小变动单位变化）"""
+    r = np.random.RandomState(seed)
+    array = np.zeros(count, dtype=TICK_DTYPE)
+    
+    start = np.datetime64(datetime(2015, 10, 9, 9, 15), 'us')
+    array['datetime'] = start + np.arange(count) * 500000
+    
+    steps = r.choice([-1, 0, 0, 0, 1], count)
+    lastPrice = 3000 + np.cumsum(steps) * priceTick
+    array['lastPrice'] = lastPrice
+    array['upperLimit'] = 3300.0
+    array['lowerLimit'] = 2700.0
+    array['volume'] = np.cumsum(r.poisson(5, count))
+    array['openInterest'] = 100000 + np.cumsum(r.randint(-3, 4, count))
+    
+    for i in range(1, 6):
+        array['bidPrice%s' %i] = lastPrice - i * priceTick
+        array['askPrice%s' %i] = lastPrice + i * priceTick
+        array['bidVolume%s' %i] = r.randint(1, 50, count)
+        array['askVolume%s' %i] = r.randint(1, 50, count)
+    
+    return CtaDataArray(array, TICK_MODE, 'IF1510', 'IF1510', 'CFFEX')
+
+
+#----------------------------------------------------------------------
+def benchmarkTickStore(count=200000):
+    """测试压缩Tick存储的压缩率，以及全部读取和按时间段读取的速度"""
+    import bson
+    
+    dataArray = generateTickArray(count)
+    path = tempfile.mkdtemp()
+    
+    try:
+        store = TickStore(path)
+        
+        start = time.time()
+        store.write(TICK_DB_NAME, 'IF1510', dataArray)
+        printResult(u'压缩写入', time.time() - start, count)
+        
+        # 和MongoDB中同样数据的BSON文档大小对比（按前1000条估算）
+        sample = [dataArray[i].toData().toDict() for i in range(1000)]
+        bsonSize = sum(len(bson.BSON.encode(d)) for d in sample) / len(sample) * count
+        
+        stats = store.getStats(TICK_DB_NAME, 'IF1510')
+        print u'压缩后%.0f字节，numpy数组%.0f字节（压缩率%.1f），BSON文档约%.0f字节（压缩率%.1f）' %(
+            stats['size'], stats['rawSize'], stats['ratio'], bsonSize, bsonSize / stats['size'])
+        
+        start = time.time()
+        result = store.read(TICK_DB_NAME, 'IF1510')
+        printResult(u'全部读取', time.time() - start, count)
+        
+        if not np.array_equal(result.array, dataArray.array):
+            print u'读取的数据和写入的数据不一致'
+        
+        # 随机读取100个10分钟的时间段
+        times = dataArray.column('datetime')
+        r = random.Random(0)
+        rangeCount = 0
+        start = time.time()
+        for i in range(100):
+            n = r.randint(0, count - 1200)
+            result = store.read(TICK_DB_NAME, 'IF1510', times[n].astype(datetime),
+                                times[n + 1200].astype(datetime))
+            rangeCount += len(result)
+        printResult(u'按时间段读取', time.time() - start, rangeCount)
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    benchmarkLoading()
+    benchmarkIndicator()
+    benchmarkStreamIndicator()
+    benchmarkLineBar()
+    benchmarkDataClass()
+    benchmarkTimestamp()
+    benchmarkTickStore()
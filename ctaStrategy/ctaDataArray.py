@@ -0,0 +1,274 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了回测用的列式历史数据，将MongoDB中的K线或者Tick数据
+按字段读取为numpy数组，并通过轻量级的行视图对象推送给策略使用。
+
+和逐条创建CtaBarData/CtaTickData对象相比：
+1. 查询时只投影需要的字段（不读取_id等无用字段）
+2. 使用较大的batch_size批量读取
+3. 数据保存在类型固定的numpy结构化数组中，内存占用小
+4. 行视图只保存数组和行号，访问字段时才读取数值
+'''
+
+from __future__ import division
+
+import numpy as np
+
+from ctaBase import *
+
+
+# 默认的数据库批量读取大小
+DEFAULT_BATCH_SIZE = 10000
+
+# K线数据的字段和类型
+BAR_FIELDS = [('datetime', 'M8[us]'),
+              ('open', 'f8'),
+              ('high', 'f8'),
+              ('low', 'f8'),
+              ('close', 'f8'),
+              ('volume', 'i8'),
+              ('openInterest', 'i8')]
+
+# Tick数据的字段和类型
+TICK_FIELDS = [('datetime', 'M8[us]'),
+               ('lastPrice', 'f8'),
+               ('volume', 'i8'),
+               ('openInterest', 'i8'),
+               ('upperLimit', 'f8'),
+               ('lowerLimit', 'f8')]
+TICK_FIELDS.extend([('bidPrice%s' %i, 'f8') for i in range(1, 6)])
+TICK_FIELDS.extend([('askPrice%s' %i, 'f8') for i in range(1, 6)])
+TICK_FIELDS.extend([('bidVolume%s' %i, 'i8') for i in range(1, 6)])
+TICK_FIELDS.extend([('askVolume%s' %i, 'i8') for i in range(1, 6)])
+
+BAR_DTYPE = np.dtype(BAR_FIELDS)
+TICK_DTYPE = np.dtype(TICK_FIELDS)
+
+# 合约相关的字段，在同一个集合中通常不变，只保存一份
+SYMBOL_FIELDS = ['vtSymbol', 'symbol', 'exchange']
+
+# 数据模式，和BacktestingEngine中的定义保持一致
+BAR_MODE = 'bar'
+TICK_MODE = 'tick'
+
+
+########################################################################
+class CtaDataView(object):
+    """
+    列式数据中一行的只读视图
+
+    字段访问的写法和CtaBarData/CtaTickData相同（如bar.close），
+    返回的是python原生的float、int和datetime对象。
+    如果策略需要修改数据，请先调用toData转换为普通的数据对象。
+    """
+    __slots__ = ('_owner', '_array', '_index')
+
+    dataClass = None
+
+    #----------------------------------------------------------------------
+    def __init__(self, owner, index):
+        """Constructor"""
+        self._owner = owner
+        self._array = owner.array
+        self._index = index
+
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        """按字段名读取当前行的数值"""
+        try:
+            return self._array[name].item(self._index)
+        except ValueError:
+            raise AttributeError(name)
+
+    #----------------------------------------------------------------------
+    @property
+    def vtSymbol(self):
+        """vt系统代码"""
+        return self._owner.vtSymbol
+
+    #----------------------------------------------------------------------
+    @property
+    def symbol(self):
+        """合约代码"""
+        return self._owner.symbol
+
+    #----------------------------------------------------------------------
+    @property
+    def exchange(self):
+        """交易所代码"""
+        return self._owner.exchange
+
+    #----------------------------------------------------------------------
+    @property
+    def date(self):
+        """日期字符串，由datetime生成"""
+        return self.datetime.strftime('%Y%m%d')
+
+    #----------------------------------------------------------------------
+    @property
+    def time(self):
+        """时间字符串，由datetime生成"""
+        return self.datetime.strftime('%H:%M:%S.%f')
+
+    #----------------------------------------------------------------------
+    def toData(self):
+        """转换为普通的数据对象（CtaBarData或者CtaTickData）"""
+        data = self.dataClass()
+        for name in self._array.dtype.names:
+            data.__setattr__(name, self.__getattr__(name))
+        data.vtSymbol = self.vtSymbol
+        data.symbol = self.symbol
+        data.exchange = self.exchange
+        data.date = self.date
+        data.time = self.time
+        return data
+
+    #----------------------------------------------------------------------
+    def __copy__(self):
+        """复制时返回可修改的数据对象"""
+        return self.toData()
+
+    #----------------------------------------------------------------------
+    def __deepcopy__(self, memo):
+        """深度复制时返回可修改的数据对象"""
+        return self.toData()
+
+
+########################################################################
+class CtaBarView(CtaDataView):
+    """K线数据的行视图"""
+    __slots__ = ()
+
+    dataClass = CtaBarData
+
+
+########################################################################
+class CtaTickView(CtaDataView):
+    """Tick数据的行视图"""
+    __slots__ = ()
+
+    dataClass = CtaTickData
+
+
+########################################################################
+class CtaDataArray(object):
+    """
+    列式保存的历史数据
+
+    array：numpy结构化数组，每个字段对应一列
+    遍历时返回行视图对象，可以直接推送给策略
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, array, mode=BAR_MODE, vtSymbol=EMPTY_STRING,
+                 symbol=EMPTY_STRING, exchange=EMPTY_STRING):
+        """Constructor"""
+        self.array = array
+        self.mode = mode
+
+        self.vtSymbol = vtSymbol
+        self.symbol = symbol
+        self.exchange = exchange
+
+        if mode == BAR_MODE:
+            self.viewClass = CtaBarView
+        else:
+            self.viewClass = CtaTickView
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """数据条数"""
+        return len(self.array)
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, index):
+        """获取某一行的视图"""
+        if index < 0:
+            index += len(self.array)
+        if not 0 <= index < len(self.array):
+            raise IndexError(index)
+        return self.viewClass(self, index)
+
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        """按顺序遍历所有行的视图"""
+        viewClass = self.viewClass
+        for index in xrange(len(self.array)):
+            yield viewClass(self, index)
+
+    #----------------------------------------------------------------------
+    def column(self, name):
+        """获取某个字段的整列数据（numpy数组，不复制）"""
+        return self.array[name]
+
+    #----------------------------------------------------------------------
+    def getSymbolDict(self):
+        """获取合约相关字段的字典"""
+        return {'vtSymbol': self.vtSymbol,
+                'symbol': self.symbol,
+                'exchange': self.exchange}
+
+
+#----------------------------------------------------------------------
+def getDataDtype(mode):
+    """根据数据模式获取对应的numpy数据类型"""
+    if mode == BAR_MODE:
+        return BAR_DTYPE
+    else:
+        return TICK_DTYPE
+
+
+#----------------------------------------------------------------------
+def loadDataArray(collection, flt, mode=BAR_MODE, batchSize=DEFAULT_BATCH_SIZE):
+    """
+    从MongoDB集合中读取数据，生成列式数据CtaDataArray
+    collection：pymongo的集合对象
+    flt：查询过滤条件
+    mode：数据模式，bar或者tick
+    batchSize：数据库批量读取大小
+    """
+    dtype = getDataDtype(mode)
+    names = dtype.names
+
+    # 只投影需要的字段
+    projection = dict.fromkeys(names, True)
+    projection['_id'] = False
+
+    # 缺失字段时使用的默认值，和数据类中的默认值一致
+    defaultDict = {}
+    for name in names:
+        if dtype[name].kind == 'f':
+            defaultDict[name] = EMPTY_FLOAT
+        elif dtype[name].kind == 'i':
+            defaultDict[name] = EMPTY_INT
+        else:
+            defaultDict[name] = None
+
+    # 逐列收集数据，最后一次性转换为numpy数组
+    columnDict = {}
+    appendList = []
+    for name in names:
+        l = []
+        columnDict[name] = l
+        appendList.append((name, l.append, defaultDict[name]))
+
+    cursor = collection.find(flt, projection).batch_size(batchSize)
+    for d in cursor:
+        for name, append, default in appendList:
+            append(d.get(name, default))
+
+    array = np.empty(len(columnDict[names[0]]), dtype=dtype)
+    for name in names:
+        array[name] = columnDict[name]
+
+    # 读取合约相关字段，只需要查询一条数据
+    symbolDict = dict.fromkeys(SYMBOL_FIELDS, EMPTY_STRING)
+    if len(array):
+        symbolProjection = dict.fromkeys(SYMBOL_FIELDS, True)
+        symbolProjection['_id'] = False
+        d = collection.find_one(flt, symbolProjection)
+        if d:
+            symbolDict.update(d)
+
+    return CtaDataArray(array, mode, **symbolDict)
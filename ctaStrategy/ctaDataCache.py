@@ -0,0 +1,331 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了回测用的本地历史数据缓存，位于MongoDB之前。
+
+缓存以(数据库名, 集合名, 开始时间, 结束时间, 数据模式)为键，
+数据以numpy的.npy二进制格式保存在硬盘上，读取时使用内存映射（mmap），
+重复回测以及多进程优化时直接从系统页缓存中读取，无需再次查询数据库。
+
+当请求的时间段只有部分已经缓存时，只从数据库中读取缺失的时间段，
+和与之重叠或相邻的已有缓存合并后保存为一个新的缓存文件，并删除被合并的旧文件，
+因此每段连续的数据只保存一份，缓存大小不会随着回测次数增长。
+缓存的时间段只到实际读取到的第一条和最后一条数据为止，并且不超过今天零点，
+两端数据库中没有数据的时间段（如尚未导入的日期、今天及之后）不会被缓存，
+之后在这些时间段补充导入的数据可以被读取到。
+已缓存的时间段内部补充导入的数据需要调用clear清除缓存后才能读取到。
+
+注意：缓存的时间段为左闭右开区间[start, end)。
+'''
+
+from __future__ import division
+
+import os
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from vtFunction import todayDate
+from ctaDataArray import CtaDataArray, loadDataArray, getDataDtype, SYMBOL_FIELDS
+
+
+# 缓存文件中时间的格式
+CACHE_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+# 缓存文件的后缀
+CACHE_FILE_SUFFIX = '.npy'
+
+# 保存合约代码等信息的文件名
+SYMBOL_FILENAME = 'symbol.json'
+
+
+########################################################################
+class CtaDataCache(object):
+    """回测历史数据的本地缓存"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, path=''):
+        """Constructor"""
+        if not path:
+            path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'dataCache')
+        self.path = path
+
+    #----------------------------------------------------------------------
+    def getFolder(self, dbName, collectionName):
+        """获取某个集合对应的缓存目录"""
+        return os.path.join(self.path, dbName, collectionName)
+
+    #----------------------------------------------------------------------
+    def getFileName(self, mode, start, end):
+        """生成缓存文件名"""
+        return '_'.join([mode, start.strftime(CACHE_TIME_FORMAT),
+                         end.strftime(CACHE_TIME_FORMAT)]) + CACHE_FILE_SUFFIX
+
+    #----------------------------------------------------------------------
+    def getEntries(self, dbName, collectionName, mode):
+        """获取某个集合已有的缓存，返回(start, end, 文件路径)的列表"""
+        folder = self.getFolder(dbName, collectionName)
+        if not os.path.isdir(folder):
+            return []
+
+        l = []
+        for name in os.listdir(folder):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+
+            try:
+                entryMode, start, end = name[:-len(CACHE_FILE_SUFFIX)].split('_')
+                start = datetime.strptime(start, CACHE_TIME_FORMAT)
+                end = datetime.strptime(end, CACHE_TIME_FORMAT)
+            except ValueError:
+                continue
+
+            if entryMode == mode:
+                l.append((start, end, os.path.join(folder, name)))
+
+        l.sort()
+        return l
+
+    #----------------------------------------------------------------------
+    def loadData(self, collection, start, end=None, mode='bar'):
+        """
+        读取[start, end)时间段的数据，返回CtaDataArray
+        collection：pymongo的集合对象，缓存缺失时从中读取
+        end为None时表示不限结束时间，今天之前的数据会被缓存，今天及之后的数据每次从数据库读取
+        """
+        dbName = collection.database.name
+        collectionName = collection.name
+
+        # 只缓存到今天零点
+        cacheEnd = todayDate()
+        if end is not None and end < cacheEnd:
+            cacheEnd = end
+
+        if start < cacheEnd:
+            array = self.loadCachedArray(collection, dbName, collectionName,
+                                         start, cacheEnd, mode)
+        else:
+            array = np.empty(0, dtype=getDataDtype(mode))
+            cacheEnd = start
+
+        # 今天及之后的数据直接从数据库读取，只保存在内存中
+        if end is None or cacheEnd < end:
+            flt = {'datetime': {'$gte': cacheEnd}}
+            if end is not None:
+                flt['datetime']['$lt'] = end
+            tail = loadDataArray(collection, flt, mode)
+            if len(tail):
+                array = np.concatenate([array, self.sortArray(tail.array)])
+                self.saveSymbol(dbName, collectionName, tail.getSymbolDict())
+
+        symbolDict = self.loadSymbol(dbName, collectionName)
+        return CtaDataArray(array, mode, **symbolDict)
+
+    #----------------------------------------------------------------------
+    def loadCachedArray(self, collection, dbName, collectionName, start, end, mode):
+        """读取缓存中[start, end)时间段的数组，缺失的部分从数据库补充"""
+        entries = self.getEntries(dbName, collectionName, mode)
+
+        # 已有覆盖整个时间段的缓存，则直接映射后切片
+        fileName = self.findEntry(entries, start, end)
+        if fileName:
+            return self.sliceArray(np.load(fileName, mmap_mode='r'), start, end)
+
+        # 和请求的时间段重叠或相邻的缓存，会被合并为一个文件
+        related = [entry for entry in entries if entry[0] <= end and entry[1] >= start]
+        mergeStart = min([start] + [entry[0] for entry in related])
+        mergeEnd = max([end] + [entry[1] for entry in related])
+
+        # 逐段拼接，每段为(开始时间, 结束时间, 数组, 是否来自缓存)：
+        # 已缓存的部分从缓存文件中切片，缺失的部分查询数据库
+        segments = []
+        current = mergeStart
+
+        while current < mergeEnd:
+            # 查找覆盖当前时间点且结束最晚的缓存
+            best = None
+            for entry in related:
+                if entry[0] <= current < entry[1]:
+                    if not best or entry[1] > best[1]:
+                        best = entry
+
+            if best:
+                pieceEnd = best[1]
+                cached = np.load(best[2], mmap_mode='r')
+                segments.append((current, pieceEnd, self.sliceArray(cached, current, pieceEnd), True))
+            else:
+                # 缺失的时间段到下一段缓存开始为止
+                pieceEnd = mergeEnd
+                for entry in related:
+                    if current < entry[0] < pieceEnd:
+                        pieceEnd = entry[0]
+
+                flt = {'datetime': {'$gte': current, '$lt': pieceEnd}}
+                data = loadDataArray(collection, flt, mode)
+                array = self.sortArray(data.array)
+
+                if len(array):
+                    self.saveSymbol(dbName, collectionName, data.getSymbolDict())
+
+                    # 第一条数据之前和最后一条数据之后的部分按没有数据处理，
+                    # 位于两端时不缓存，之后在这些部分补充导入的数据可以被读取到
+                    dataStart = array['datetime'][0].astype(datetime)
+                    dataEnd = array['datetime'][-1].astype(datetime) + timedelta(microseconds=1)
+
+                    if current < dataStart:
+                        segments.append((current, dataStart, array[:0], False))
+                    segments.append((dataStart, dataEnd, array, False))
+                    if dataEnd < pieceEnd:
+                        segments.append((dataEnd, pieceEnd, array[:0], False))
+                else:
+                    segments.append((current, pieceEnd, array, False))
+
+            current = pieceEnd
+
+        # 只缓存第一条到最后一条数据之间的部分，两端数据库中没有数据的时间段不缓存，
+        # 中间的部分（如节假日）和已有的缓存合并保存为一个缓存文件，删除被合并的旧文件
+        kept = [i for i, segment in enumerate(segments) if segment[3] or len(segment[2])]
+        if kept:
+            run = segments[kept[0]:kept[-1]+1]
+
+            if not (len(run) == 1 and run[0][3]):       # 只有一个已有的缓存时无需重新保存
+                runStart = run[0][0]
+                runEnd = run[-1][1]
+                fileName = self.saveArray(dbName, collectionName, mode, runStart, runEnd,
+                                          np.concatenate([segment[2] for segment in run]))
+
+                if fileName:
+                    for entry in related:
+                        if runStart <= entry[0] and entry[1] <= runEnd and entry[2] != fileName:
+                            self.removeFile(entry[2])
+
+        # 请求的时间段内的数据都在一个缓存文件中时，重新以内存映射的方式打开
+        count = sum([len(self.sliceArray(segment[2], start, end)) for segment in segments])
+        fileName = self.getCachedFile(dbName, collectionName, mode, start, end, count)
+        if fileName:
+            return self.sliceArray(np.load(fileName, mmap_mode='r'), start, end)
+
+        array = np.concatenate([segment[2] for segment in segments])
+        return self.sliceArray(array, start, end)
+
+    #----------------------------------------------------------------------
+    def findEntry(self, entries, start, end):
+        """在缓存列表中查找覆盖[start, end)时间段的缓存文件，没有则返回空字符串"""
+        for entryStart, entryEnd, fileName in entries:
+            if entryStart <= start and end <= entryEnd:
+                return fileName
+        return ''
+
+    #----------------------------------------------------------------------
+    def getCachedFile(self, dbName, collectionName, mode, start, end, count=None):
+        """
+        获取包含[start, end)时间段数据的缓存文件路径，没有则返回空字符串
+        count为None时要求缓存覆盖整个时间段，否则为该时间段实际的数据数量：
+        缓存只保存到第一条和最后一条数据，只要缓存文件中该时间段有count条数据即可
+        """
+        entries = self.getEntries(dbName, collectionName, mode)
+        fileName = self.findEntry(entries, start, end)
+        if fileName or not count:
+            return fileName
+
+        for entryStart, entryEnd, fileName in entries:
+            if entryStart < end and start < entryEnd:
+                array = np.load(fileName, mmap_mode='r')
+                if len(self.sliceArray(array, start, end)) == count:
+                    return fileName
+        return ''
+
+    #----------------------------------------------------------------------
+    def removeFile(self, fileName):
+        """删除被合并的缓存文件"""
+        try:
+            os.remove(fileName)
+        except OSError:
+            # Windows下其他进程正在映射的文件无法删除，留待下次合并时删除
+            pass
+
+    #----------------------------------------------------------------------
+    def saveArray(self, dbName, collectionName, mode, start, end, array):
+        """保存数组到缓存文件，返回文件路径"""
+        folder = self.getFolder(dbName, collectionName)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # 多进程同时创建目录时可能出错，检查目录是否已存在
+                if not os.path.isdir(folder):
+                    return ''
+
+        fileName = os.path.join(folder, self.getFileName(mode, start, end))
+
+        # 先写入临时文件再重命名，防止其他进程读取到不完整的文件
+        tmpFileName = '%s.%s.tmp' %(fileName, os.getpid())
+        with open(tmpFileName, 'wb') as f:
+            np.save(f, array)
+
+        try:
+            os.rename(tmpFileName, fileName)
+        except OSError:
+            # Windows下目标文件已存在时无法重命名，说明其他进程已经写入了同样的缓存
+            os.remove(tmpFileName)
+
+        return fileName
+
+    #----------------------------------------------------------------------
+    def saveSymbol(self, dbName, collectionName, symbolDict):
+        """保存合约代码等信息"""
+        if not symbolDict.get('vtSymbol'):
+            return
+
+        fileName = os.path.join(self.getFolder(dbName, collectionName), SYMBOL_FILENAME)
+        if os.path.isfile(fileName):
+            return
+
+        folder = os.path.dirname(fileName)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                return
+
+        with open(fileName, 'w') as f:
+            json.dump(symbolDict, f)
+
+    #----------------------------------------------------------------------
+    def loadSymbol(self, dbName, collectionName):
+        """读取合约代码等信息"""
+        symbolDict = dict.fromkeys(SYMBOL_FIELDS, '')
+
+        fileName = os.path.join(self.getFolder(dbName, collectionName), SYMBOL_FILENAME)
+        try:
+            with open(fileName) as f:
+                symbolDict.update(json.load(f))
+        except (IOError, ValueError):
+            pass
+
+        return symbolDict
+
+    #----------------------------------------------------------------------
+    def sliceArray(self, array, start, end):
+        """从按时间排序的数组中切出[start, end)时间段（不复制数据）"""
+        dt = array['datetime']
+        startIndex = np.searchsorted(dt, np.datetime64(start, 'us'), side='left')
+        endIndex = np.searchsorted(dt, np.datetime64(end, 'us'), side='left')
+        return array[startIndex:endIndex]
+
+    #----------------------------------------------------------------------
+    def sortArray(self, array):
+        """将数组按时间排序（保持相同时间数据的原有顺序）"""
+        index = np.argsort(array['datetime'], kind='mergesort')
+        return array[index]
+
+    #----------------------------------------------------------------------
+    def clear(self, dbName, collectionName):
+        """删除某个集合的所有缓存文件"""
+        folder = self.getFolder(dbName, collectionName)
+        if not os.path.isdir(folder):
+            return
+
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
@@ -22,9 +22,12 @@ import json
 import os
 import traceback
 from collections import OrderedDict
+from itertools import chain
 from datetime import datetime, timedelta
 
 from ctaBase import *
+from ctaOrderBook import OrderBook
+from ctaTickStore import TickStore
 from strategy import STRATEGY_CLASS
 from eventEngine import *
 from vtConstant import *
@@ -70,6 +73,10 @@ class CtaEngine(object):
         self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
 
+        # 按合约分开的停止单簿，每个方向的停止单按触发价格排序
+        # key为vtSymbol，value为OrderBook对象
+        self.stopOrderBookDict = {}
+
         # 持仓缓存字典
         # key为vtSymbol，value为PositionBuffer对象
         self.posBufferDict = {}
@@ -77,6 +84,9 @@ class CtaEngine(object):
         # 成交号集合，用来过滤已经收到过的成交推送
         self.tradeSet = set()
 
+        # 本地压缩Tick存储，已经存储的Tick数据优先从本地读取
+        self.tickStore = TickStore()
+
         # 引擎类型为实盘
         self.engineType = ENGINETYPE_TRADING
 
@@ -206,6 +216,11 @@ class CtaEngine(object):
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
 
+        # 添加到对应合约的停止单簿中
+        if vtSymbol not in self.stopOrderBookDict:
+            self.stopOrderBookDict[vtSymbol] = OrderBook(stop=True)
+        self.stopOrderBookDict[vtSymbol].addOrder(stopOrderID, so.direction, price, so)
+
         return stopOrderID
 
     #----------------------------------------------------------------------
@@ -216,30 +231,32 @@ class CtaEngine(object):
             so = self.workingStopOrderDict[stopOrderID]
             so.status = STOPORDER_CANCELLED
             del self.workingStopOrderDict[stopOrderID]
+            self.stopOrderBookDict[so.vtSymbol].removeOrder(stopOrderID)
 
     #----------------------------------------------------------------------
     def processStopOrder(self, tick):
         """收到行情后处理本地停止单（检查是否要立即发出）"""
         vtSymbol = tick.vtSymbol
 
-        # 首先检查是否有策略交易该合约
-        if vtSymbol in self.tickStrategyDict:
-            # 遍历等待中的停止单，检查是否会被触发
-            for so in self.workingStopOrderDict.values():
-                if so.vtSymbol == vtSymbol:
-                    longTriggered = so.direction==DIRECTION_LONG and tick.lastPrice>=so.price        # 多头停止单被触发
-                    shortTriggered = so.direction==DIRECTION_SHORT and tick.lastPrice<=so.price     # 空头停止单被触发
-
-                    if longTriggered or shortTriggered:
-                        # 买入和卖出分别以涨停跌停价发单（模拟市价单）
-                        if so.direction==DIRECTION_LONG:
-                            price = tick.upperLimit
-                        else:
-                            price = tick.lowerLimit
-
-                        so.status = STOPORDER_TRIGGERED
-                        self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
-                        del self.workingStopOrderDict[so.stopOrderID]
+        # 首先检查是否有策略交易该合约，以及该合约是否有等待中的停止单
+        book = self.stopOrderBookDict.get(vtSymbol)
+        if vtSymbol in self.tickStrategyDict and book:
+            # 从停止单簿中取出会被触发的停止单（多头价格<=最新价，空头价格>=最新价），
+            # 只访问会被触发的停止单，而不用遍历所有等待中的停止单
+            for so in book.popCrossed(tick.lastPrice, tick.lastPrice):
+                # 在之前的发单过程中被策略撤销的停止单不再触发
+                if so.stopOrderID not in self.workingStopOrderDict:
+                    continue
+
+                # 买入和卖出分别以涨停跌停价发单（模拟市价单）
+                if so.direction==DIRECTION_LONG:
+                    price = tick.upperLimit
+                else:
+                    price = tick.lowerLimit
+
+                so.status = STOPORDER_TRIGGERED
+                del self.workingStopOrderDict[so.stopOrderID]
+                self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
 
     #----------------------------------------------------------------------
     def processTickEvent(self, event):
@@ -250,19 +267,15 @@ class CtaEngine(object):
 
         # 推送tick到对应的策略实例进行处理
         if tick.vtSymbol in self.tickStrategyDict:
-            # 将vtTickData数据转化为ctaTickData
-            ctaTick = CtaTickData()
-            d = ctaTick.__dict__
-            for key in d.keys():
-                if key != 'datetime':
-                    d[key] = tick.__getattribute__(key)
-            # 添加datetime字段
-            ctaTick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+            # VtTickData包含了CtaTickData的所有字段，直接推送给策略而不再逐个复制，
+            # 同一个tick对象由所有策略和其他模块共享，接口推送时已经设为只读，
+            # 这里处理不是由接口推送的tick（已经只读时不做任何操作）
+            tick.freeze()
 
             # 逐个推送到策略实例中
             l = self.tickStrategyDict[tick.vtSymbol]
             for strategy in l:
-                self.callStrategyFunc(strategy, strategy.onTick, ctaTick)
+                self.callStrategyFunc(strategy, strategy.onTick, tick)
 
     #----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -329,37 +342,46 @@ class CtaEngine(object):
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
         """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.mainEngine.dbInsert(dbName, collectionName, data.__dict__)
+        self.mainEngine.dbInsertAsync(dbName, collectionName, data.toDict())
 
     #----------------------------------------------------------------------
     def loadBar(self, dbName, collectionName, days):
-        """从数据库中读取Bar数据，startDate是datetime对象"""
+        """
+        从数据库中读取Bar数据，返回生成器，遍历时才从数据库按批读取，
+        策略初始化时可以逐根回放而不用把所有数据读入内存
+        """
         startDate = self.today - timedelta(days)
 
         d = {'datetime':{'$gte':startDate}}
-        barData = self.mainEngine.dbQuery(dbName, collectionName, d)
-
-        l = []
-        for d in barData:
-            bar = CtaBarData()
-            bar.__dict__ = d
-            l.append(bar)
-        return l
+        return self.mainEngine.dbQueryIter(dbName, collectionName, d, dataClass=CtaBarData)
 
     #----------------------------------------------------------------------
     def loadTick(self, dbName, collectionName, days):
-        """从数据库中读取Tick数据，startDate是datetime对象"""
+        """
+        读取Tick数据，返回生成器，遍历时才从数据库按批读取
+        本地Tick存储覆盖的时间段从本地读取，之前和之后的数据再查询数据库
+        """
         startDate = self.today - timedelta(days)
 
-        d = {'datetime':{'$gte':startDate}}
-        tickData = self.mainEngine.dbQuery(dbName, collectionName, d)
+        storeStart, storeEnd = self.tickStore.getRange(dbName, collectionName)
+        if not storeEnd or storeEnd < startDate:
+            d = {'datetime':{'$gte':startDate}}
+            return self.mainEngine.dbQueryIter(dbName, collectionName, d, dataClass=CtaTickData)
 
         l = []
-        for d in tickData:
-            tick = CtaTickData()
-            tick.__dict__ = d
-            l.append(tick)
-        return l    
+
+        # 存储开始之前的数据从数据库读取
+        if startDate < storeStart:
+            d = {'datetime':{'$gte':startDate, '$lt':storeStart}}
+            l.append(self.mainEngine.dbQueryIter(dbName, collectionName, d, dataClass=CtaTickData))
+
+        dataArray = self.tickStore.read(dbName, collectionName, startDate)
+        l.append(view.toData() for view in dataArray)
+
+        # 存储结束之后的数据从数据库读取
+        d = {'datetime':{'$gt':storeEnd}}
+        l.append(self.mainEngine.dbQueryIter(dbName, collectionName, d, dataClass=CtaTickData))
+        return chain(*l)
 
     #----------------------------------------------------------------------
     def writeCtaLog(self, content):
@@ -573,7 +595,8 @@ class CtaEngine(object):
         for strategy in self.strategyDict.values():
             flt = {'name': strategy.name,
                    'vtSymbol': strategy.vtSymbol}
-            posData = self.mainEngine.dbQuery(POSITION_DB_NAME, strategy.className, flt)
+            posData = self.mainEngine.dbQueryIter(POSITION_DB_NAME, strategy.className, flt,
+                                                  projection={'pos': True, '_id': False})
 
             for d in posData:
                 strategy.pos = d['pos']
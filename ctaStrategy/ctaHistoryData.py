@@ -151,7 +151,7 @@ class HistoryDataEngine(object):
                     print d
 
                 flt = {'datetime': bar.datetime}
-                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)
+                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.toDict()}, upsert=True)
                 print u'%s下载完成' %symbol
         else:
             print u'找不到合约%s' %symbol
@@ -217,7 +217,7 @@ class HistoryDataEngine(object):
                     print d
 
                 flt = {'datetime': bar.datetime}
-                self.dbClient[MINUTE_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)
+                self.dbClient[MINUTE_DB_NAME][symbol].update_one(flt, {'$set':bar.toDict()}, upsert=True)
 
             print u'%s下载完成' %symbol
         else:
@@ -296,7 +296,7 @@ class HistoryDataEngine(object):
                     print d
 
                 flt = {'datetime': bar.datetime}
-                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)            
+                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.toDict()}, upsert=True)            
 
             print u'%s下载完成' %symbol
         else:
@@ -345,7 +345,7 @@ def downloadEquityDailyBarts(self, symbol):
                     print d
 
                 flt = {'datetime': bar.datetime}
-                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)
+                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.toDict()}, upsert=True)
 
             print u'%s下载完成' %symbol
         else:
@@ -382,7 +382,7 @@ def loadMcCsv(fileName, dbName, symbol):
         bar.volume = d['TotalVolume']
 
         flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
+        collection.update_one(flt, {'$set':bar.toDict()}, upsert=True)  
         print bar.date, bar.time
 
     print u'插入完毕，耗时：%s' % (time()-start)
@@ -419,7 +419,7 @@ def loadTdxCsv(fileName, dbName, symbol):
         bar.openInterest = d[7]
 
         flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
+        collection.update_one(flt, {'$set':bar.toDict()}, upsert=True)  
         print bar.date, bar.time
 
     print u'插入完毕，耗时：%s' % (time()-start)
@@ -464,7 +464,7 @@ def loadTBCsv(fileName, dbName, symbol):
             bar.openInterest = float(d[6])
 
             flt = {'datetime': bar.datetime}
-            collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)
+            collection.update_one(flt, {'$set':bar.toDict()}, upsert=True)
             print '%s \t %s' % (bar.date, bar.time)
 
     print u'插入完毕，耗时：%s' % (time()-start)
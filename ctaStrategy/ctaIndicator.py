@@ -0,0 +1,507 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了增量计算的技术指标，除WindowEma外每根K线只需O(1)的计算量。
+
+和每次取出历史数据切片、转换为numpy数组后调用talib相比，
+这里的指标只保存计算需要的中间状态（滚动求和、上一期的均值等），
+每次更新只处理最新的一个数据。
+
+计算方法和talib保持一致：
+1. Ema：前N个数据的简单平均作为初始值，之后按2/(N+1)的系数平滑
+2. Atr：前N个真实波幅的简单平均作为初始值，之后按Wilder的方法平滑
+3. Rsi：前N个涨跌幅的平均作为初始值，之后按Wilder的方法平滑
+4. Boll：中轨为简单平均，标准差为总体标准差
+
+另外提供了WindowEma和WindowRsi，对应的是在固定长度的滑动窗口上调用talib的结果
+（每次都在窗口内重新初始化），用于兼容CtaLineBar中原有的计算方式。
+WindowEma每次计算需要从初始值开始平滑窗口中最后steps个数据，计算量为O(steps)，
+只有steps很小时（CtaLineBar中计算ADX时steps为2）才接近O(1)，
+不需要和原有结果保持一致时应使用Ema。
+
+滚动求和每隔一个周期按顺序重新求和一次，避免浮点数累计误差。
+'''
+
+from __future__ import division
+
+from collections import deque
+from math import sqrt
+
+
+# talib中判断为0的阈值
+TA_EPSILON = 0.00000001
+
+
+#----------------------------------------------------------------------
+def getTrueRange(high, low, preClose):
+    """计算真实波幅"""
+    return max(high - low, abs(high - preClose), abs(low - preClose))
+
+
+#----------------------------------------------------------------------
+def getDirectionalMove(high, low, preHigh, preLow):
+    """计算上升动向和下降动向，返回(pdm, mdm)"""
+    upMove = high - preHigh
+    downMove = preLow - low
+
+    if upMove > 0 and upMove > downMove:
+        pdm = upMove
+    else:
+        pdm = 0
+
+    if downMove > 0 and downMove > upMove:
+        mdm = downMove
+    else:
+        mdm = 0
+
+    return pdm, mdm
+
+
+#----------------------------------------------------------------------
+def calculateRsi(gain, loss):
+    """根据平均涨幅和平均跌幅计算RSI"""
+    total = gain + loss
+    if -TA_EPSILON < total < TA_EPSILON:
+        return 0.0
+    return 100 * (gain / total)
+
+
+########################################################################
+class RollingSum(object):
+    """最近N个数据的滚动求和"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.sum = 0.0
+        self.count = 0          # 已经更新的次数
+
+    #----------------------------------------------------------------------
+    def update(self, value):
+        """更新数据，返回最新的求和结果"""
+        window = self.window
+        if len(window) == self.period:
+            self.sum -= window[0]
+        window.append(value)
+        self.count += 1
+
+        # 每隔一个周期重新求和，避免累计误差
+        if self.count % self.period:
+            self.sum += value
+        else:
+            self.sum = float(sum(window))
+
+        return self.sum
+
+    #----------------------------------------------------------------------
+    def isFull(self):
+        """数据是否已经达到N个"""
+        return len(self.window) == self.period
+
+    #----------------------------------------------------------------------
+    def mean(self):
+        """当前窗口内数据的平均值"""
+        if not self.window:
+            return 0.0
+        return self.sum / len(self.window)
+
+
+########################################################################
+class RollingMax(object):
+    """
+    最近N个数据的最大值
+    使用单调队列，队列中只保留之后没有出现更大值的数据，每次更新的均摊复杂度为O(1)
+    """
+
+    # 最小值通过对数据取负后求最大值实现
+    sign = 1
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+        self.queue = deque()    # 元素为(序号, 取符号后的数值)，数值单调递减
+        self.count = 0          # 已经更新的次数
+
+    #----------------------------------------------------------------------
+    def update(self, value):
+        """更新数据"""
+        queue = self.queue
+        key = self.sign * value
+
+        # 移除队尾所有不大于新数据的元素，它们不可能再成为最大值
+        while queue and queue[-1][1] <= key:
+            queue.pop()
+        queue.append((self.count, key))
+
+        self.count += 1
+
+        # 移除已经离开窗口的元素
+        if queue[0][0] <= self.count - 1 - self.period:
+            queue.popleft()
+
+    #----------------------------------------------------------------------
+    def isFull(self):
+        """数据是否已经达到N个"""
+        return self.count >= self.period
+
+    #----------------------------------------------------------------------
+    def getValue(self, value=None):
+        """
+        当前窗口内的最大值，窗口为空时返回None
+        value不为None时，返回窗口数据和value一起的最大值（不更新窗口）
+        """
+        queue = self.queue
+
+        if value is None:
+            if not queue:
+                return None
+            return self.sign * queue[0][1]
+
+        if queue and queue[0][1] > self.sign * value:
+            return self.sign * queue[0][1]
+        return value
+
+
+########################################################################
+class RollingMin(RollingMax):
+    """最近N个数据的最小值"""
+
+    sign = -1
+
+
+########################################################################
+class Ema(object):
+    """指数移动平均，和talib.EMA一致"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+        self.k = 2 / (period + 1)
+
+        self.seedSum = 0.0
+        self.count = 0
+        self.value = None       # 数据不足N个时为None
+
+    #----------------------------------------------------------------------
+    def update(self, value):
+        """更新数据，返回最新的EMA值"""
+        self.count += 1
+
+        if self.count < self.period:
+            self.seedSum += value
+        elif self.count == self.period:
+            self.seedSum += value
+            self.value = self.seedSum / self.period
+        else:
+            self.value = (value - self.value) * self.k + self.value
+
+        return self.value
+
+
+########################################################################
+class WindowEma(object):
+    """
+    滑动窗口内的指数移动平均
+    结果和对最近(period+steps)个数据调用talib.EMA后取最后一个值相同：
+    以窗口中最早的N个数据的简单平均作为初始值，再用之后的数据平滑
+    update为O(1)，getValue需要平滑steps个数据，为O(steps)
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, period, steps):
+        """Constructor"""
+        self.period = period
+        self.k = 2 / (period + 1)
+
+        self.window = deque(maxlen=period+steps)
+        self.seed = RollingSum(period)      # 窗口中最早的N个数据
+
+    #----------------------------------------------------------------------
+    def update(self, value):
+        """更新数据"""
+        window = self.window
+        period = self.period
+
+        # 窗口已满时，最早的数据移出，第N+1个数据移入初始化部分
+        if len(window) < period:
+            self.seed.update(value)
+        elif len(window) == window.maxlen:
+            if len(window) > period:
+                self.seed.update(window[period])
+            else:
+                self.seed.update(value)
+
+        window.append(value)
+
+    #----------------------------------------------------------------------
+    def getValue(self):
+        """计算当前窗口的EMA值，数据不足N个时返回None"""
+        window = self.window
+        period = self.period
+
+        if len(window) < period:
+            return None
+
+        value = self.seed.mean()
+        k = self.k
+        for i in range(period, len(window)):
+            value = (window[i] - value) * k + value
+
+        return value
+
+
+########################################################################
+class Atr(object):
+    """平均真实波幅，和talib.ATR一致"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+
+        self.preClose = None
+        self.trSum = 0.0
+        self.count = 0          # 真实波幅的数量
+        self.value = None
+
+    #----------------------------------------------------------------------
+    def update(self, high, low, close):
+        """更新K线数据，返回最新的ATR值"""
+        preClose = self.preClose
+        self.preClose = close
+
+        # 第一根K线没有昨收价，不计算真实波幅
+        if preClose is None:
+            return self.value
+
+        tr = getTrueRange(high, low, preClose)
+        self.count += 1
+
+        if self.count < self.period:
+            self.trSum += tr
+        elif self.count == self.period:
+            self.trSum += tr
+            self.value = self.trSum / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + tr) / self.period
+
+        return self.value
+
+
+########################################################################
+class Rsi(object):
+    """相对强弱指数，和talib.RSI一致"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+
+        self.preClose = None
+        self.gain = 0.0         # 平均涨幅
+        self.loss = 0.0         # 平均跌幅
+        self.count = 0          # 涨跌幅的数量
+        self.value = None
+
+    #----------------------------------------------------------------------
+    def update(self, close):
+        """更新收盘价，返回最新的RSI值"""
+        preClose = self.preClose
+        self.preClose = close
+
+        if preClose is None:
+            return self.value
+
+        diff = close - preClose
+        period = self.period
+        self.count += 1
+
+        if self.count <= period:
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+
+            if self.count < period:
+                return self.value
+
+            self.loss /= period
+            self.gain /= period
+        else:
+            self.loss *= (period - 1)
+            self.gain *= (period - 1)
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+            self.loss /= period
+            self.gain /= period
+
+        self.value = calculateRsi(self.gain, self.loss)
+        return self.value
+
+
+########################################################################
+class WindowRsi(object):
+    """
+    滑动窗口内的相对强弱指数
+    结果和对最近(period+2)个收盘价调用talib.RSI后取最后一个值相同：
+    以窗口中前N个涨跌幅的平均作为初始值，再用最后一个涨跌幅平滑一次
+
+    update传入的是已经完成的K线收盘价，getValue传入窗口中最后一个收盘价
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+
+        self.preClose = None
+        self.gainSum = RollingSum(period)
+        self.lossSum = RollingSum(period)
+
+    #----------------------------------------------------------------------
+    def update(self, close):
+        """更新收盘价"""
+        preClose = self.preClose
+        self.preClose = close
+
+        if preClose is None:
+            return
+
+        diff = close - preClose
+        if diff < 0:
+            self.gainSum.update(0)
+            self.lossSum.update(-diff)
+        else:
+            self.gainSum.update(diff)
+            self.lossSum.update(0)
+
+    #----------------------------------------------------------------------
+    def isReady(self):
+        """数据是否足够计算"""
+        return self.gainSum.isFull()
+
+    #----------------------------------------------------------------------
+    def getValue(self, close):
+        """计算加上最新收盘价后的RSI值"""
+        period = self.period
+
+        gain = self.gainSum.sum / period
+        loss = self.lossSum.sum / period
+
+        diff = close - self.preClose
+        loss *= (period - 1)
+        gain *= (period - 1)
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+        loss /= period
+        gain /= period
+
+        return calculateRsi(gain, loss)
+
+
+########################################################################
+class Boll(object):
+    """
+    布林带，和talib.BBANDS（matype=0）一致
+    数据不足N个时使用已有的全部数据计算
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, period, nbdevUp=2, nbdevDn=None):
+        """Constructor"""
+        if nbdevDn is None:
+            nbdevDn = nbdevUp
+
+        self.period = period
+        self.nbdevUp = nbdevUp
+        self.nbdevDn = nbdevDn
+
+        self.closeSum = RollingSum(period)
+        self.squareSum = RollingSum(period)
+
+    #----------------------------------------------------------------------
+    def update(self, close):
+        """更新收盘价"""
+        self.closeSum.update(close)
+        self.squareSum.update(close * close)
+
+    #----------------------------------------------------------------------
+    def getValue(self):
+        """计算当前的(上轨, 中轨, 下轨)"""
+        middle = self.closeSum.mean()
+        variance = self.squareSum.mean() - middle * middle
+
+        if variance < TA_EPSILON:
+            std = 0.0
+        else:
+            std = sqrt(variance)
+
+        upper = middle + std * self.nbdevUp
+        lower = middle - std * self.nbdevDn
+        return upper, middle, lower
+
+
+########################################################################
+class Dmi(object):
+    """
+    动向指标，N周期内真实波幅、上升动向和下降动向的滚动求和
+    和CtaLineBar中原有的计算方式一致（求和而不是Wilder平滑）
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, period):
+        """Constructor"""
+        self.period = period
+
+        self.preHigh = None
+        self.preLow = None
+        self.preClose = None
+
+        self.trSum = RollingSum(period)
+        self.pdmSum = RollingSum(period)
+        self.mdmSum = RollingSum(period)
+
+    #----------------------------------------------------------------------
+    def update(self, high, low, close):
+        """更新K线数据"""
+        if self.preClose is not None:
+            pdm, mdm = getDirectionalMove(high, low, self.preHigh, self.preLow)
+            self.trSum.update(getTrueRange(high, low, self.preClose))
+            self.pdmSum.update(pdm)
+            self.mdmSum.update(mdm)
+
+        self.preHigh = high
+        self.preLow = low
+        self.preClose = close
+
+    #----------------------------------------------------------------------
+    def getValue(self, tr=0, pdm=0, mdm=0):
+        """
+        计算当前的(pdi, mdi, dx)
+        tr/pdm/mdm为额外计入求和的一期数据（窗口未满时使用）
+        """
+        trSum = self.trSum.sum + tr
+        pdmSum = self.pdmSum.sum + pdm
+        mdmSum = self.mdmSum.sum + mdm
+
+        if trSum == 0:
+            pdi = 0
+            mdi = 0
+        else:
+            pdi = pdmSum * 100 / trSum
+            mdi = mdmSum * 100 / trSum
+
+        if pdi + mdi == 0:
+            dx = 0
+        else:
+            dx = 100 * abs(mdi - pdi) / (mdi + pdi)
+
+        return pdi, mdi, dx
@@ -0,0 +1,162 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了按价格排序的委托簿，用于回测引擎中限价单和停止单的撮合。
+
+每个方向的委托保存在一个堆中，堆顶是最容易成交的委托，
+撮合时只需要从堆顶开始弹出已经满足成交条件的委托，
+而不用在每根K线（或每个Tick）上遍历所有活动委托。
+
+撤单时采用延迟删除：委托只从字典中移除，堆中的记录在弹出时再丢弃，
+当堆中已失效的记录过多时重建整个堆。
+'''
+
+from heapq import heappush, heappop, heapify
+
+from vtConstant import *
+
+
+# 堆中失效记录的数量超过该值，且超过有效委托数量时重建堆
+COMPACT_THRESHOLD = 64
+
+
+########################################################################
+class OrderHeap(object):
+    """
+    单个方向的委托堆
+
+    reverse为False时价格低的委托在堆顶，成交条件为：委托价格 <= 成交判断价格
+    reverse为True时价格高的委托在堆顶，成交条件为：委托价格 >= 成交判断价格
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, reverse=False):
+        """Constructor"""
+        if reverse:
+            self.sign = -1
+        else:
+            self.sign = 1
+
+        self.heap = []          # 堆，元素为(排序价格, 序号, 委托编号)
+        self.orderDict = {}     # 有效委托字典，key为委托编号，value为(序号, 委托对象)
+        self.deadCount = 0      # 堆中已失效的记录数量
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """有效委托数量"""
+        return len(self.orderDict)
+
+    #----------------------------------------------------------------------
+    def push(self, orderID, price, seq, order):
+        """添加委托"""
+        if orderID in self.orderDict:
+            self.remove(orderID)
+
+        heappush(self.heap, (self.sign * price, seq, orderID))
+        self.orderDict[orderID] = (seq, order)
+
+    #----------------------------------------------------------------------
+    def remove(self, orderID):
+        """移除委托（延迟删除）"""
+        if orderID not in self.orderDict:
+            return
+
+        del self.orderDict[orderID]
+        self.deadCount += 1
+
+        if self.deadCount > COMPACT_THRESHOLD and self.deadCount > len(self.orderDict):
+            self.compact()
+
+    #----------------------------------------------------------------------
+    def compact(self):
+        """丢弃堆中所有失效的记录并重建堆"""
+        orderDict = self.orderDict
+        self.heap = [item for item in self.heap
+                     if item[2] in orderDict and orderDict[item[2]][0] == item[1]]
+        heapify(self.heap)
+        self.deadCount = 0
+
+    #----------------------------------------------------------------------
+    def popCrossed(self, crossPrice, l):
+        """弹出所有满足成交条件的委托，以(序号, 委托对象)的形式添加到列表l中"""
+        heap = self.heap
+        orderDict = self.orderDict
+        crossKey = self.sign * crossPrice
+
+        while heap and heap[0][0] <= crossKey:
+            key, seq, orderID = heappop(heap)
+
+            value = orderDict.get(orderID)
+            if value and value[0] == seq:
+                l.append(value)
+                del orderDict[orderID]
+            else:
+                self.deadCount -= 1
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空"""
+        self.heap = []
+        self.orderDict.clear()
+        self.deadCount = 0
+
+
+########################################################################
+class OrderBook(object):
+    """
+    按方向分开的委托簿
+
+    限价单：买单价格高的先成交，卖单价格低的先成交
+    停止单：买单价格低的先触发，卖单价格高的先触发
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, stop=False):
+        """Constructor"""
+        self.longHeap = OrderHeap(reverse=not stop)
+        self.shortHeap = OrderHeap(reverse=stop)
+
+        self.seq = 0        # 委托序号，用于保持原有的委托顺序
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """有效委托数量"""
+        return len(self.longHeap) + len(self.shortHeap)
+
+    #----------------------------------------------------------------------
+    def addOrder(self, orderID, direction, price, order):
+        """添加委托"""
+        self.seq += 1
+
+        if direction == DIRECTION_LONG:
+            self.longHeap.push(orderID, price, self.seq, order)
+        elif direction == DIRECTION_SHORT:
+            self.shortHeap.push(orderID, price, self.seq, order)
+
+    #----------------------------------------------------------------------
+    def removeOrder(self, orderID):
+        """移除委托"""
+        self.longHeap.remove(orderID)
+        self.shortHeap.remove(orderID)
+
+    #----------------------------------------------------------------------
+    def popCrossed(self, longCrossPrice, shortCrossPrice):
+        """
+        弹出所有满足成交条件的委托，按委托的先后顺序返回委托对象列表
+        longCrossPrice/shortCrossPrice为None时表示该方向无法成交
+        """
+        l = []
+        if longCrossPrice is not None:
+            self.longHeap.popCrossed(longCrossPrice, l)
+        if shortCrossPrice is not None:
+            self.shortHeap.popCrossed(shortCrossPrice, l)
+
+        l.sort()
+        return [order for seq, order in l]
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空"""
+        self.longHeap.clear()
+        self.shortHeap.clear()
+        self.seq = 0
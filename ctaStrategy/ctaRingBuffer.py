@@ -0,0 +1,121 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了固定容量的环形缓冲区，用于保存K线、指标等时间序列。
+
+数据保存在预先分配的numpy数组中，超出容量时自动覆盖最早的数据，
+不需要像list那样通过del list[0]移动所有元素。
+
+数组的长度为容量的两倍，每个数据同时写入两个位置，
+因此任意最近N个数据在内存中都是连续的，可以直接返回numpy视图而不用复制。
+注意：返回的视图在下一次append之后可能会被覆盖，需要长期保存时请复制。
+'''
+
+import numpy as np
+
+
+########################################################################
+class RingBuffer(object):
+    """
+    固定容量的环形缓冲区
+    读取的写法和list相同（len、下标、负数下标、切片、遍历），
+    切片和last返回的是numpy数组视图
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, capacity, dtype=float):
+        """Constructor"""
+        if capacity <= 0:
+            raise ValueError(u'环形缓冲区的容量必须大于0')
+
+        self.capacity = capacity
+        self.data = np.zeros(capacity * 2, dtype=dtype)
+
+        self.index = 0      # 下一个数据的写入位置
+        self.count = 0      # 当前数据量
+
+    #----------------------------------------------------------------------
+    def append(self, value):
+        """添加数据，超出容量时覆盖最早的数据"""
+        index = self.index
+        capacity = self.capacity
+
+        self.data[index] = value
+        self.data[index + capacity] = value
+
+        index += 1
+        if index == capacity:
+            index = 0
+        self.index = index
+
+        if self.count < capacity:
+            self.count += 1
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空数据"""
+        self.index = 0
+        self.count = 0
+
+    #----------------------------------------------------------------------
+    def last(self, n):
+        """最近n个数据的视图，数据不足n个时返回全部数据"""
+        if n > self.count:
+            n = self.count
+        end = self.index + self.capacity
+        return self.data[end-n:end]
+
+    #----------------------------------------------------------------------
+    @property
+    def array(self):
+        """全部数据的视图，按时间从早到晚排列"""
+        return self.last(self.count)
+
+    #----------------------------------------------------------------------
+    def isFull(self):
+        """是否已经达到容量上限"""
+        return self.count == self.capacity
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """数据量"""
+        return self.count
+
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        """按时间从早到晚遍历"""
+        return iter(self.array)
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, key):
+        """下标读取，切片返回视图"""
+        if isinstance(key, slice):
+            return self.array[key]
+
+        return self.data[self.getPosition(key)]
+
+    #----------------------------------------------------------------------
+    def __setitem__(self, key, value):
+        """下标修改"""
+        position = self.getPosition(key)
+        if position >= self.capacity:
+            position -= self.capacity
+
+        self.data[position] = value
+        self.data[position + self.capacity] = value
+
+    #----------------------------------------------------------------------
+    def getPosition(self, key):
+        """将list的下标转换为数组中的位置"""
+        count = self.count
+        if key < 0:
+            key += count
+        if not 0 <= key < count:
+            raise IndexError(u'环形缓冲区下标越界')
+
+        return self.index + self.capacity - count + key
+
+    #----------------------------------------------------------------------
+    def __repr__(self):
+        """显示内容"""
+        return 'RingBuffer(%s)' % list(self.array)
@@ -147,12 +147,12 @@ class CtaTemplate(object):
 
     #----------------------------------------------------------------------
     def loadTick(self, days):
-        """读取tick数据"""
+        """读取tick数据，返回可以遍历的对象（实盘中为生成器，只能遍历一次）"""
         return self.ctaEngine.loadTick(self.tickDbName, self.vtSymbol, days)
 
     #----------------------------------------------------------------------
     def loadBar(self, days):
-        """读取bar数据"""
+        """读取bar数据，返回可以遍历的对象（实盘中为生成器，只能遍历一次）"""
         return self.ctaEngine.loadBar(self.barDbName, self.vtSymbol, days)
 
     #----------------------------------------------------------------------
@@ -0,0 +1,375 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了压缩的列式Tick存储，用于长期保存大量的Tick历史数据。
+
+MongoDB中每条Tick都是一个完整的文档，重复保存字段名、合约代码、日期字符串
+以及涨跌停价等几乎不变的字段。列式存储按块（默认每块2048条）保存数据，
+块内每个字段单独编码：
+1. 时间、成交量、持仓量等整数：保存和上一条的差值（delta），
+   时间间隔和成交量变化通常很小
+2. 价格等浮点数：保存和上一条浮点数二进制位的异或（XOR），
+   价格不变时为0，小幅变化时只有少数低位不为0
+3. 编码后的数据按字节重排（所有数值的第1个字节在一起，第2个字节在一起……），
+   使高位的大量0连续排列，再用zlib压缩
+合约代码等信息只在meta.json中保存一份。
+
+每个集合一个目录，数据文件中依次保存所有的块，索引文件中保存每个块的
+时间范围和位置，按时间段读取时通过二分查找只解压需要的块。
+数据只能按时间顺序追加，读取的时间段为左闭右开区间[start, end)。
+'''
+
+from __future__ import division
+
+import os
+import json
+import zlib
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ctaBase import *
+from ctaDataArray import CtaDataArray, loadDataArray, TICK_DTYPE, TICK_MODE, SYMBOL_FIELDS
+
+
+# 文件名
+DATA_FILENAME = 'tick.dat'
+INDEX_FILENAME = 'index.npy'
+INDEX_BACKUP_FILENAME = 'index.npy.bak'     # Windows下替换索引文件时的备份
+META_FILENAME = 'meta.json'
+
+# 存储格式版本
+STORE_VERSION = 1
+
+# 默认每块的数据量和zlib压缩级别
+DEFAULT_BLOCK_SIZE = 2048
+DEFAULT_COMPRESS_LEVEL = 6
+
+# 块索引：开始时间、结束时间（微秒，包含）、数据文件中的位置、长度、数据量
+INDEX_DTYPE = np.dtype([('start', 'i8'),
+                        ('end', 'i8'),
+                        ('offset', 'i8'),
+                        ('size', 'i8'),
+                        ('count', 'i8')])
+
+# 块内每个字段压缩后长度的格式
+COLUMN_SIZE_STRUCT = struct.Struct('<%sI' %len(TICK_DTYPE.names))
+
+
+#----------------------------------------------------------------------
+def encodeColumn(column):
+    """编码单个字段，返回字节重排后的uint8数组"""
+    kind = column.dtype.kind
+
+    # 浮点数按二进制位异或，整数和时间保存差值
+    if kind == 'f':
+        values = column.view('u8')
+        encoded = np.empty_like(values)
+        encoded[0] = values[0]
+        np.bitwise_xor(values[1:], values[:-1], encoded[1:])
+    else:
+        values = column.view('i8')
+        encoded = np.empty_like(values)
+        encoded[0] = values[0]
+        np.subtract(values[1:], values[:-1], encoded[1:])
+
+    # 按字节重排
+    return encoded.view('u1').reshape(-1, 8).T.copy()
+
+#----------------------------------------------------------------------
+def decodeColumn(data, count, dtype):
+    """解码单个字段"""
+    shuffled = np.frombuffer(data, 'u1').reshape(8, count)
+    encoded = shuffled.T.copy()
+
+    if dtype.kind == 'f':
+        values = np.bitwise_xor.accumulate(encoded.view('u8').ravel())
+    else:
+        values = np.cumsum(encoded.view('i8').ravel())
+
+    return values.view(dtype)
+
+#----------------------------------------------------------------------
+def encodeBlock(array, level=DEFAULT_COMPRESS_LEVEL):
+    """编码并压缩一块数据，返回字节串"""
+    compressedList = [zlib.compress(encodeColumn(np.ascontiguousarray(array[name])).tostring(), level)
+                      for name in TICK_DTYPE.names]
+
+    sizeList = [len(data) for data in compressedList]
+    return COLUMN_SIZE_STRUCT.pack(*sizeList) + ''.join(compressedList)
+
+#----------------------------------------------------------------------
+def decodeBlock(data, count):
+    """解压并解码一块数据，返回numpy结构化数组"""
+    sizeList = COLUMN_SIZE_STRUCT.unpack_from(data)
+    offset = COLUMN_SIZE_STRUCT.size
+
+    array = np.empty(count, dtype=TICK_DTYPE)
+    for name, size in zip(TICK_DTYPE.names, sizeList):
+        raw = zlib.decompress(data[offset:offset+size])
+        array[name] = decodeColumn(raw, count, TICK_DTYPE[name])
+        offset += size
+
+    return array
+
+#----------------------------------------------------------------------
+def toMicroseconds(dt):
+    """datetime转换为numpy时间对应的微秒整数"""
+    return np.datetime64(dt, 'us').astype('i8')
+
+#----------------------------------------------------------------------
+def replaceFile(src, dst, backup):
+    """
+    用src文件替换dst文件
+    POSIX下rename会原子地覆盖已有文件；Windows下rename不能覆盖，
+    先把dst改名为backup，src重命名成功后再删除backup，
+    中途崩溃时backup仍然保留旧的文件
+    """
+    if os.name != 'nt':
+        os.rename(src, dst)
+        return
+
+    if os.path.isfile(dst):
+        if os.path.isfile(backup):
+            os.remove(backup)
+        os.rename(dst, backup)
+
+    try:
+        os.rename(src, dst)
+    except OSError:
+        if os.path.isfile(backup):
+            os.rename(backup, dst)
+        raise
+
+    if os.path.isfile(backup):
+        os.remove(backup)
+
+
+########################################################################
+class TickStore(object):
+    """压缩的列式Tick存储"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, path='', blockSize=DEFAULT_BLOCK_SIZE, level=DEFAULT_COMPRESS_LEVEL):
+        """
+        path：存储目录，为空则使用默认目录
+        blockSize：每块的数据量，越大压缩率越高，按时间段读取时需要多解压的数据也越多
+        level：zlib压缩级别
+        """
+        if not path:
+            path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'tickStore')
+        self.path = path
+        self.blockSize = blockSize
+        self.level = level
+
+        self.indexDict = {}     # 已读取的块索引，key为(数据库名, 集合名)，value为(修改时间, 索引)
+
+    #----------------------------------------------------------------------
+    def getFolder(self, dbName, collectionName):
+        """获取某个集合对应的存储目录"""
+        return os.path.join(self.path, dbName, collectionName)
+
+    #----------------------------------------------------------------------
+    def exists(self, dbName, collectionName):
+        """某个集合是否已经有存储的数据"""
+        return len(self.loadIndex(dbName, collectionName)) > 0
+
+    #----------------------------------------------------------------------
+    def loadIndex(self, dbName, collectionName):
+        """读取块索引，索引文件被其他进程更新后会重新读取"""
+        key = (dbName, collectionName)
+        folder = self.getFolder(dbName, collectionName)
+        fileName = os.path.join(folder, INDEX_FILENAME)
+
+        # 替换索引文件的过程中崩溃时，从备份中恢复旧的索引
+        backupFileName = os.path.join(folder, INDEX_BACKUP_FILENAME)
+        if not os.path.isfile(fileName) and os.path.isfile(backupFileName):
+            os.rename(backupFileName, fileName)
+
+        try:
+            mtime = os.path.getmtime(fileName)
+        except OSError:
+            return np.empty(0, dtype=INDEX_DTYPE)
+
+        cached = self.indexDict.get(key)
+        if not cached or cached[0] != mtime:
+            cached = (mtime, np.load(fileName))
+            self.indexDict[key] = cached
+        return cached[1]
+
+    #----------------------------------------------------------------------
+    def loadMeta(self, dbName, collectionName):
+        """读取合约代码等信息"""
+        meta = dict.fromkeys(SYMBOL_FIELDS, '')
+
+        fileName = os.path.join(self.getFolder(dbName, collectionName), META_FILENAME)
+        try:
+            with open(fileName) as f:
+                meta.update(json.load(f))
+        except (IOError, ValueError):
+            pass
+
+        return meta
+
+    #----------------------------------------------------------------------
+    def getRange(self, dbName, collectionName):
+        """获取已存储数据的时间范围，返回(开始时间, 结束时间)，没有数据时返回(None, None)"""
+        index = self.loadIndex(dbName, collectionName)
+        if not len(index):
+            return None, None
+
+        start = np.datetime64(int(index['start'][0]), 'us').astype(datetime)
+        end = np.datetime64(int(index['end'][-1]), 'us').astype(datetime)
+        return start, end
+
+    #----------------------------------------------------------------------
+    def write(self, dbName, collectionName, dataArray):
+        """
+        追加写入Tick数据，dataArray为Tick模式的CtaDataArray
+        数据不能早于已存储的最后一条数据（可以和最后一条时间相同），返回写入的数据量
+        """
+        array = dataArray.array
+        if not len(array):
+            return 0
+
+        # 按时间排序（保持相同时间数据的原有顺序）
+        array = array[np.argsort(array['datetime'], kind='mergesort')]
+
+        index = self.loadIndex(dbName, collectionName)
+        if len(index) and array['datetime'][0].astype('i8') < index['end'][-1]:
+            raise ValueError(u'写入的数据早于已存储的数据：%s' %collectionName)
+
+        folder = self.getFolder(dbName, collectionName)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # 保存合约代码等信息
+        metaFileName = os.path.join(folder, META_FILENAME)
+        if not os.path.isfile(metaFileName):
+            meta = dataArray.getSymbolDict()
+            meta['version'] = STORE_VERSION
+            with open(metaFileName, 'w') as f:
+                json.dump(meta, f)
+
+        # 逐块编码后追加到数据文件
+        dataFileName = os.path.join(folder, DATA_FILENAME)
+        l = []
+        with open(dataFileName, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+
+            for i in xrange(0, len(array), self.blockSize):
+                block = array[i:i+self.blockSize]
+                data = encodeBlock(block, self.level)
+                f.write(data)
+
+                times = block['datetime'].astype('i8')
+                l.append((times[0], times[-1], offset, len(data), len(block)))
+                offset += len(data)
+
+        # 数据写入完成后再更新索引，先写入临时文件再替换
+        index = np.concatenate([index, np.array(l, dtype=INDEX_DTYPE)])
+        indexFileName = os.path.join(folder, INDEX_FILENAME)
+        tmpFileName = '%s.%s.tmp' %(indexFileName, os.getpid())
+        with open(tmpFileName, 'wb') as f:
+            np.save(f, index)
+        replaceFile(tmpFileName, indexFileName, os.path.join(folder, INDEX_BACKUP_FILENAME))
+
+        self.indexDict[(dbName, collectionName)] = (os.path.getmtime(indexFileName), index)
+        return len(array)
+
+    #----------------------------------------------------------------------
+    def read(self, dbName, collectionName, start=None, end=None):
+        """
+        读取[start, end)时间段的Tick数据，返回Tick模式的CtaDataArray
+        start/end为None时表示不限制
+        """
+        index = self.loadIndex(dbName, collectionName)
+        meta = self.loadMeta(dbName, collectionName)
+
+        # 二分查找和时间段有交集的块：块的结束时间>=start，块的开始时间<end
+        first = 0
+        last = len(index)
+        if start is not None:
+            first = np.searchsorted(index['end'], toMicroseconds(start), side='left')
+        if end is not None:
+            last = np.searchsorted(index['start'], toMicroseconds(end), side='left')
+
+        pieces = []
+        if first < last:
+            fileName = os.path.join(self.getFolder(dbName, collectionName), DATA_FILENAME)
+            with open(fileName, 'rb') as f:
+                # 需要的块在文件中是连续的，一次读取
+                begin = index['offset'][first]
+                f.seek(begin)
+                data = f.read(index['offset'][last-1] + index['size'][last-1] - begin)
+
+            for i in xrange(first, last):
+                offset = index['offset'][i] - begin
+                pieces.append(decodeBlock(data[offset:offset+index['size'][i]],
+                                          index['count'][i]))
+
+        if pieces:
+            array = np.concatenate(pieces)
+        else:
+            array = np.empty(0, dtype=TICK_DTYPE)
+
+        # 首尾的块中可能有时间段之外的数据
+        dt = array['datetime']
+        startIndex = 0
+        endIndex = len(array)
+        if start is not None:
+            startIndex = np.searchsorted(dt, np.datetime64(start, 'us'), side='left')
+        if end is not None:
+            endIndex = np.searchsorted(dt, np.datetime64(end, 'us'), side='left')
+        array = array[startIndex:endIndex]
+
+        return CtaDataArray(array, TICK_MODE, meta['vtSymbol'], meta['symbol'], meta['exchange'])
+
+    #----------------------------------------------------------------------
+    def importFromDb(self, collection, dbName, collectionName, start, end=None):
+        """
+        从MongoDB集合中按天读取Tick数据并追加写入存储，返回写入的数据量
+        已经存储的时间段会被跳过，每次只读取一天的数据以限制内存占用
+        """
+        storeStart, storeEnd = self.getRange(dbName, collectionName)
+        if storeEnd and storeEnd >= start:
+            start = storeEnd + timedelta(microseconds=1)
+
+        if not end:
+            end = datetime.now()
+
+        count = 0
+        while start < end:
+            dayEnd = min(start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(1), end)
+            flt = {'datetime': {'$gte': start, '$lt': dayEnd}}
+            count += self.write(dbName, collectionName, loadDataArray(collection, flt, TICK_MODE))
+            start = dayEnd
+
+        return count
+
+    #----------------------------------------------------------------------
+    def getStats(self, dbName, collectionName):
+        """
+        获取存储统计，返回字典：
+        count：数据量，blocks：块数量，size：压缩后的字节数，
+        rawSize：未压缩的numpy数组字节数，ratio：压缩率（rawSize / size）
+        """
+        index = self.loadIndex(dbName, collectionName)
+        count = int(index['count'].sum())
+        size = int(index['size'].sum())
+        rawSize = count * TICK_DTYPE.itemsize
+
+        if size:
+            ratio = rawSize / size
+        else:
+            ratio = 0
+
+        return {
+            'count': count,
+            'blocks': len(index),
+            'size': size,
+            'rawSize': rawSize,
+            'ratio': ratio
+        }
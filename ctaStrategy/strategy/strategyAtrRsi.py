@@ -11,10 +11,11 @@
 """
 
 import talib
-import numpy as np
 
 from ctaBase import *
 from ctaTemplate import CtaTemplate
+from ctaArrayManager import ArrayManager
+from ctaRingBuffer import RingBuffer
 
 
 ########################################################################
@@ -37,13 +38,10 @@ class AtrRsiStrategy(CtaTemplate):
     barMinute = EMPTY_STRING    # K线当前的分钟
 
     bufferSize = 100                    # 需要缓存的数据的大小
-    bufferCount = 0                     # 目前已经缓存了的数据的计数
-    highArray = np.zeros(bufferSize)    # K线最高价的数组
-    lowArray = np.zeros(bufferSize)     # K线最低价的数组
-    closeArray = np.zeros(bufferSize)   # K线收盘价的数组
+    am = None                           # K线序列管理工具
 
     atrCount = 0                        # 目前已经缓存了的ATR的计数
-    atrArray = np.zeros(bufferSize)     # ATR指标的数组
+    atrArray = None                     # ATR指标的环形缓冲区
     atrValue = 0                        # 最新的ATR指标数值
     atrMa = 0                           # ATR移动平均的数值
 
@@ -85,6 +83,8 @@ class AtrRsiStrategy(CtaTemplate):
         # 否则会出现多个策略实例之间数据共享的情况，有可能导致潜在的策略逻辑错误风险，
         # 策略类中的这些可变对象属性可以选择不写，全都放在__init__下面，写主要是为了阅读
         # 策略时方便（更多是个编程习惯的选择）        
+        self.am = ArrayManager(self.bufferSize)
+        self.atrArray = RingBuffer(self.bufferSize)
 
     #----------------------------------------------------------------------
     def onInit(self):
@@ -156,34 +156,22 @@ class AtrRsiStrategy(CtaTemplate):
         self.orderList = []
 
         # 保存K线数据
-        self.closeArray[0:self.bufferSize-1] = self.closeArray[1:self.bufferSize]
-        self.highArray[0:self.bufferSize-1] = self.highArray[1:self.bufferSize]
-        self.lowArray[0:self.bufferSize-1] = self.lowArray[1:self.bufferSize]
-
-        self.closeArray[-1] = bar.close
-        self.highArray[-1] = bar.high
-        self.lowArray[-1] = bar.low
-
-        self.bufferCount += 1
-        if self.bufferCount < self.bufferSize:
+        am = self.am
+        am.updateBar(bar)
+        if not am.inited:
             return
 
         # 计算指标数值
-        self.atrValue = talib.ATR(self.highArray, 
-                                  self.lowArray, 
-                                  self.closeArray,
-                                  self.atrLength)[-1]
-        self.atrArray[0:self.bufferSize-1] = self.atrArray[1:self.bufferSize]
-        self.atrArray[-1] = self.atrValue
+        self.atrValue = am.atr(self.atrLength)
+        self.atrArray.append(self.atrValue)
 
         self.atrCount += 1
         if self.atrCount < self.bufferSize:
             return
 
-        self.atrMa = talib.MA(self.atrArray, 
+        self.atrMa = talib.MA(self.atrArray.array, 
                               self.atrMaLength)[-1]
-        self.rsiValue = talib.RSI(self.closeArray, 
-                                  self.rsiLength)[-1]
+        self.rsiValue = am.rsi(self.rsiLength)
 
         # 判断是否要进行交易
 
@@ -14,9 +14,7 @@ from __future__ import division
 
 from ctaBase import *
 from ctaTemplate import CtaTemplate
-
-import talib
-import numpy as np
+from ctaArrayManager import ArrayManager
 
 
 ########################################################################
@@ -38,10 +36,7 @@ class KkStrategy(CtaTemplate):
     fiveBar = None              # 1分钟K线对象
 
     bufferSize = 100                    # 需要缓存的数据的大小
-    bufferCount = 0                     # 目前已经缓存了的数据的计数
-    highArray = np.zeros(bufferSize)    # K线最高价的数组
-    lowArray = np.zeros(bufferSize)     # K线最低价的数组
-    closeArray = np.zeros(bufferSize)   # K线收盘价的数组
+    am = None                           # K线序列管理工具
 
     atrValue = 0                        # 最新的ATR指标数值
     kkMid = 0                           # KK通道中轨
@@ -76,6 +71,8 @@ class KkStrategy(CtaTemplate):
         """Constructor"""
         super(KkStrategy, self).__init__(ctaEngine, setting)
 
+        self.am = ArrayManager(self.bufferSize)
+
     #----------------------------------------------------------------------
     def onInit(self):
         """初始化策略（必须由用户继承实现）"""
@@ -185,24 +182,14 @@ class KkStrategy(CtaTemplate):
         self.orderList = []
 
         # 保存K线数据
-        self.closeArray[0:self.bufferSize-1] = self.closeArray[1:self.bufferSize]
-        self.highArray[0:self.bufferSize-1] = self.highArray[1:self.bufferSize]
-        self.lowArray[0:self.bufferSize-1] = self.lowArray[1:self.bufferSize]
-
-        self.closeArray[-1] = bar.close
-        self.highArray[-1] = bar.high
-        self.lowArray[-1] = bar.low
-
-        self.bufferCount += 1
-        if self.bufferCount < self.bufferSize:
+        am = self.am
+        am.updateBar(bar)
+        if not am.inited:
             return
 
         # 计算指标数值
-        self.atrValue = talib.ATR(self.highArray, 
-                                  self.lowArray, 
-                                  self.closeArray,
-                                  self.kkLength)[-1]
-        self.kkMid = talib.MA(self.closeArray, self.kkLength)[-1]
+        self.atrValue = am.atr(self.kkLength)
+        self.kkMid = am.sma(self.kkLength)
         self.kkUp = self.kkMid + self.atrValue * self.kkDev
         self.kkDown = self.kkMid - self.atrValue * self.kkDev
 
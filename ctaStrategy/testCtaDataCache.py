@@ -0,0 +1,155 @@
+# encoding: UTF-8
+
+'''
+回测历史数据缓存的测试，在ctaStrategy目录下运行：python testCtaDataCache.py
+使用内存中的集合代替MongoDB，不需要数据库
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from vtFunction import todayDate
+from ctaDataCache import CtaDataCache
+
+
+########################################################################
+class FakeDatabase(object):
+    """测试用的数据库"""
+    name = 'VnTrader_1Min_Db'
+
+
+########################################################################
+class FakeCollection(object):
+    """测试用的集合，只支持按datetime的范围查询"""
+    name = 'IF0000'
+    database = FakeDatabase()
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.data = []
+        self.queryCount = 0
+
+    #----------------------------------------------------------------------
+    def insertBars(self, start, count):
+        """插入从start开始的count根小时K线"""
+        for i in range(count):
+            self.data.append({'datetime': start + timedelta(hours=i), 'open': 1.0, 'high': 1.0,
+                              'low': 1.0, 'close': 1.0, 'volume': 1, 'openInterest': 1,
+                              'vtSymbol': 'IF0000', 'symbol': 'IF0000', 'exchange': 'CFFEX'})
+
+    #----------------------------------------------------------------------
+    def find(self, flt, projection=None):
+        """查询"""
+        self.queryCount += 1
+        start = flt['datetime']['$gte']
+        end = flt['datetime'].get('$lt')
+        return FakeCursor([dict(d) for d in self.data
+                           if start <= d['datetime'] and (end is None or d['datetime'] < end)])
+
+    #----------------------------------------------------------------------
+    def find_one(self, flt, projection=None):
+        """查询一条数据"""
+        l = self.find(flt)
+        self.queryCount -= 1
+        if not l:
+            return None
+        return dict([(key, l[0].get(key)) for key in projection if key != '_id'])
+
+
+########################################################################
+class FakeCursor(list):
+    """测试用的查询结果"""
+
+    #----------------------------------------------------------------------
+    def batch_size(self, batchSize):
+        """忽略"""
+        return self
+
+
+########################################################################
+class CtaDataCacheTest(unittest.TestCase):
+    """历史数据缓存的测试"""
+
+    #----------------------------------------------------------------------
+    def setUp(self):
+        """创建临时缓存目录"""
+        self.path = tempfile.mkdtemp()
+        self.cache = CtaDataCache(self.path)
+        self.collection = FakeCollection()
+
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        """删除临时缓存目录"""
+        shutil.rmtree(self.path)
+
+    #----------------------------------------------------------------------
+    def getFiles(self):
+        """缓存文件列表"""
+        folder = self.cache.getFolder(FakeDatabase.name, FakeCollection.name)
+        return [name for name in os.listdir(folder) if name.endswith('.npy')]
+
+    #----------------------------------------------------------------------
+    def testBackfillAfterCachedData(self):
+        """请求的时间段只导入了前一部分，之后补充导入的数据可以被读取到"""
+        self.collection.insertBars(datetime(2017, 1, 2), 24)
+        data = self.cache.loadData(self.collection, datetime(2017, 1, 1), datetime(2017, 1, 10))
+        self.assertEqual(len(data), 24)
+
+        self.collection.insertBars(datetime(2017, 1, 5), 24)
+        data = self.cache.loadData(self.collection, datetime(2017, 1, 1), datetime(2017, 1, 10))
+        self.assertEqual(len(data), 48)
+
+        # 已读取的数据合并为一个缓存文件
+        self.assertEqual(len(self.getFiles()), 1)
+
+    #----------------------------------------------------------------------
+    def testBackfillBeforeCachedData(self):
+        """在已缓存数据之前补充导入的数据可以被读取到"""
+        self.collection.insertBars(datetime(2017, 1, 5), 24)
+        self.cache.loadData(self.collection, datetime(2017, 1, 1), datetime(2017, 1, 10))
+
+        self.collection.insertBars(datetime(2017, 1, 2), 24)
+        data = self.cache.loadData(self.collection, datetime(2017, 1, 1), datetime(2017, 1, 10))
+        self.assertEqual(len(data), 48)
+        self.assertEqual(data.column('datetime')[0].astype(datetime), datetime(2017, 1, 2))
+
+    #----------------------------------------------------------------------
+    def testFutureEnd(self):
+        """结束时间在今天之后时只缓存到今天零点，之后导入的数据可以被读取到"""
+        today = todayDate()
+        end = today + timedelta(10)
+
+        self.collection.insertBars(today - timedelta(2), 24)
+        data = self.cache.loadData(self.collection, today - timedelta(5), end)
+        self.assertEqual(len(data), 24)
+
+        self.collection.insertBars(today, 24)
+        data = self.cache.loadData(self.collection, today - timedelta(5), end)
+        self.assertEqual(len(data), 48)
+
+        for start, fileEnd, fileName in self.cache.getEntries(FakeDatabase.name,
+                                                              FakeCollection.name, 'bar'):
+            self.assertTrue(fileEnd <= today)
+
+    #----------------------------------------------------------------------
+    def testCachedRequest(self):
+        """已缓存的数据不再查询数据库，直接使用内存映射"""
+        self.collection.insertBars(datetime(2017, 1, 2), 72)
+        self.cache.loadData(self.collection, datetime(2017, 1, 2), datetime(2017, 1, 5))
+
+        count = self.collection.queryCount
+        data = self.cache.loadData(self.collection, datetime(2017, 1, 3), datetime(2017, 1, 4))
+        self.assertEqual(len(data), 24)
+        self.assertEqual(self.collection.queryCount, count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,16 +5,20 @@
 
 from vtConstant import *
 from ctaBase import *
+from ctaIndicator import (RollingSum, RollingMax, RollingMin, WindowEma, WindowRsi, Boll, Dmi,
+                          getTrueRange, getDirectionalMove)
+from ctaRingBuffer import RingBuffer
 
 from datetime import datetime
 
-import talib as ta
-import numpy
 import copy,csv
 
 
 DEBUGCTALOG = True
 
+# lineBar中保留的K线数量，8个交易小时
+LINEBAR_CAPACITY = 60 * 8 + 1
+
 class CtaLineBar(object):
     """CTA K线"""
     """ 使用方法:
@@ -100,32 +104,32 @@ class CtaLineBar(object):
 
         # K线保存数据
         self.bar = None                # K线数据对象
-        self.lineBar = []              # K线缓存数据队列
+        self.lineBar = None            # K线缓存数据队列
         self.barFirstTick =False       # K线的第一条Tick数据
 
         # K 线的相关计算结果数据
 
-        self.preHigh = []               # K线的前inputPreLen的的最高
-        self.preLow = []                # K线的前inputPreLen的的最低
+        self.preHigh = None             # K线的前inputPreLen的的最高
+        self.preLow = None              # K线的前inputPreLen的的最低
 
-        self.lineEma1 = []              # K线的EMA1均线，周期是InputEmaLen1，包含当前bar
+        self.lineEma1 = None            # K线的EMA1均线，周期是InputEmaLen1，包含当前bar
         self.lineEma1MtmRate = []       # K线的EMA1均线 的momentum(3) 动能
 
-        self.lineEma2 = []              # K线的EMA2均线，周期是InputEmaLen2，包含当前bar
+        self.lineEma2 = None            # K线的EMA2均线，周期是InputEmaLen2，包含当前bar
         self.lineEma2MtmRate = []       # K线的EMA2均线 的momentum(3) 动能
 
         # K线的DMI( Pdi，Mdi，ADX，Adxr) 计算数据
         self.barPdi = EMPTY_FLOAT      # bar内的升动向指标，即做多的比率
         self.barMdi = EMPTY_FLOAT      # bar内的下降动向指标，即做空的比率
 
-        self.linePdi = []             # 升动向指标，即做多的比率
-        self.lineMdi = []             # 下降动向指标，即做空的比率
+        self.linePdi = None           # 升动向指标，即做多的比率
+        self.lineMdi = None           # 下降动向指标，即做空的比率
 
-        self.lineDx = []              # 趋向指标列表，最大长度为inputM*2
+        self.lineDx = None            # 趋向指标列表，最大长度为inputM*2
         self.barAdx = EMPTY_FLOAT     # Bar内计算的平均趋向指标
-        self.lineAdx = []             # 平均趋向指标
+        self.lineAdx = None           # 平均趋向指标
         self.barAdxr = EMPTY_FLOAT    # 趋向平均值，为当日ADX值与M日前的ADX值的均值
-        self.lineAdxr = []            # 平均趋向变化指标
+        self.lineAdxr = None          # 平均趋向变化指标
 
         # K线的基于DMI、ADX计算的结果
         self.barAdxTrend = EMPTY_FLOAT        # ADX值持续高于前一周期时，市场行情将维持原趋势
@@ -135,9 +139,9 @@ class CtaLineBar(object):
         self.sellFilterCond = False         # 空过滤器条件,做空趋势的判断，ADXR高于前一天，下降动向> inputMM
 
         # K线的ATR技术数据
-        self.lineAtr1 = []              # K线的ATR1,周期为inputAtr1Len
-        self.lineAtr2 = []              # K线的ATR2,周期为inputAtr2Len
-        self.lineAtr3 = []              # K线的ATR3,周期为inputAtr3Len
+        self.lineAtr1 = None            # K线的ATR1,周期为inputAtr1Len
+        self.lineAtr2 = None            # K线的ATR2,周期为inputAtr2Len
+        self.lineAtr3 = None            # K线的ATR3,周期为inputAtr3Len
 
         self.barAtr1 = EMPTY_FLOAT
         self.barAtr2 = EMPTY_FLOAT
@@ -147,18 +151,18 @@ class CtaLineBar(object):
         self.lineAvgVol = []        # K 线的交易量平均
 
         # K线的RSI计算数据
-        self.lineRsi = []           # 记录K线对应的RSI数值，只保留inputRsiLen*8
+        self.lineRsi = None         # 记录K线对应的RSI数值，只保留inputRsiLen*8
 
         self.lowRsi = 30            # RSI的最低线
         self.highRsi = 70           # RSI的最高线
 
-        self.lineRsiTop = []        # 记录RSI的最高峰，只保留 inputRsiLen个
-        self.lineRsiButtom = []     # 记录RSI的最低谷，只保留 inputRsiLen个
+        self.lineRsiTop = None      # 记录RSI的最高峰，只保留 inputRsiLen个
+        self.lineRsiButtom = None   # 记录RSI的最低谷，只保留 inputRsiLen个
         self.lastRsiTopButtom = None # 最近的一个波峰/波谷
 
          # K线的CMI计算数据
         self.inputCmiLen = EMPTY_INT
-        self.lineCmi = []           # 记录K线对应的Cmi数值，只保留inputCmiLen*8
+        self.lineCmi = None         # 记录K线对应的Cmi数值，只保留inputCmiLen*8
 
         # K线的布林特计算数据
         self.inputBollLen = EMPTY_INT  # K线周期
@@ -171,6 +175,108 @@ class CtaLineBar(object):
         if setting:
             self.setParam(setting)
 
+        # K线和指标序列保存在固定容量的环形缓冲区中
+        self.__initSeries()
+
+        # 增量计算的指标，只保存已完成K线的中间状态
+        self.__initIndicator()
+
+    def __initSeries(self):
+        """根据参数创建保存K线和指标序列的环形缓冲区"""
+        self.lineBar = RingBuffer(LINEBAR_CAPACITY, object)
+
+        self.preHigh = RingBuffer(max(self.inputPreLen, 0)*8 + 1)
+        self.preLow = RingBuffer(max(self.inputPreLen, 0)*8 + 1)
+
+        self.lineEma1 = RingBuffer(max(self.inputEma1Len, 0)*8 + 1)
+        self.lineEma2 = RingBuffer(max(self.inputEma2Len, 0)*8 + 1)
+
+        dmiCapacity = max(self.inputDmiLen, 0) + 2
+        self.linePdi = RingBuffer(dmiCapacity)
+        self.lineMdi = RingBuffer(dmiCapacity)
+        self.lineDx = RingBuffer(dmiCapacity)
+        self.lineAdx = RingBuffer(dmiCapacity)
+        self.lineAdxr = RingBuffer(dmiCapacity)
+
+        self.lineAtr1 = RingBuffer(max(self.inputAtr1Len, 0) + 2)
+        self.lineAtr2 = RingBuffer(max(self.inputAtr2Len, 0) + 2)
+        self.lineAtr3 = RingBuffer(max(self.inputAtr3Len, 0) + 2)
+
+        self.lineRsi = RingBuffer(max(self.inputRsiLen, 0)*8 + 1)
+        self.lineRsiTop = RingBuffer(max(self.inputRsiLen, 0) + 1, object)
+        self.lineRsiButtom = RingBuffer(max(self.inputRsiLen, 0) + 1, object)
+
+        self.lineCmi = RingBuffer(max(self.inputCmiLen, 0) + 1)
+
+    def __initIndicator(self):
+        """根据参数创建增量计算的指标"""
+        self.highMax = None
+        self.lowMin = None
+        self.ema1Sum = None
+        self.ema2Sum = None
+        self.dmi = None
+        self.adx = None
+        self.volSum = None
+        self.rsi = None
+        self.boll = None
+        self.closeMax = None
+        self.closeMin = None
+
+        if self.inputPreLen > 0:
+            self.highMax = RollingMax(self.inputPreLen)
+            self.lowMin = RollingMin(self.inputPreLen)
+
+        # talib.EMA只传入N个数据时，结果就是N个数据的简单平均
+        if self.inputEma1Len > 0:
+            self.ema1Sum = RollingSum(self.inputEma1Len)
+        if self.inputEma2Len > 0:
+            self.ema2Sum = RollingSum(self.inputEma2Len)
+
+        # lineDx最多保留inputDmiLen+2个，ADX为在其上调用talib.EMA的结果
+        if self.inputDmiLen > 0:
+            self.dmi = Dmi(self.inputDmiLen)
+            self.adx = WindowEma(self.inputDmiLen, 2)
+
+        if self.inputVolLen > 0:
+            self.volSum = RollingSum(self.inputVolLen)
+
+        if self.inputRsiLen > 0:
+            self.rsi = WindowRsi(self.inputRsiLen)
+
+        if self.inputBollLen > 0:
+            self.boll = Boll(self.inputBollLen, self.inputBollStdRate)
+
+        # CMI的窗口包含当前K线，已完成的K线只需要inputCmiLen-1根
+        if self.inputCmiLen > 1:
+            self.closeMax = RollingMax(self.inputCmiLen-1)
+            self.closeMin = RollingMin(self.inputCmiLen-1)
+
+    def __updateIndicator(self):
+        """将最近一根已完成的K线更新到指标中"""
+        if len(self.lineBar) < 2:
+            return
+
+        bar = self.lineBar[-2]
+
+        if self.highMax:
+            self.highMax.update(bar.high)
+            self.lowMin.update(bar.low)
+        if self.ema1Sum:
+            self.ema1Sum.update(bar.close)
+        if self.ema2Sum:
+            self.ema2Sum.update(bar.close)
+        if self.dmi:
+            self.dmi.update(bar.high, bar.low, bar.close)
+        if self.volSum:
+            self.volSum.update(bar.volume)
+        if self.rsi:
+            self.rsi.update(bar.close)
+        if self.boll:
+            self.boll.update(bar.close)
+        if self.closeMax:
+            self.closeMax.update(bar.close)
+            self.closeMin.update(bar.close)
+
     def setParam(self, setting):
         """设置参数"""
         d = self.__dict__
@@ -223,6 +329,9 @@ class CtaLineBar(object):
 
     def onBar(self, bar):
         """OnBar事件"""
+        # 更新增量计算的指标
+        self.__updateIndicator()
+
         # 计算相关数据
         self.__recountPreHighLow()
         self.__recountEma()
@@ -275,9 +384,7 @@ class CtaLineBar(object):
             self.onBar(self.bar)
             return
 
-        # 清除8交易小时前的数据，
-        if l1 > 60 * 8:
-            del self.lineBar[0]
+        # 超过8交易小时的数据由环形缓冲区自动覆盖
 
         # 与最后一个BAR的时间比对，判断是否超过5分钟
         lastBar = self.lineBar[-1]
@@ -396,25 +503,18 @@ class CtaLineBar(object):
             return
 
         # 2.计算前inputPreLen周期内(不包含当前周期）的Bar高点和低点
-        preHigh = EMPTY_FLOAT
-        preLow = EMPTY_FLOAT
-
-        for i in range(len(self.lineBar)-2, len(self.lineBar)-2-self.inputPreLen, -1):
-
-            if self.lineBar[i].high > preHigh or preHigh == EMPTY_FLOAT:
-                preHigh = self.lineBar[i].high    # 前InputPreLen周期高点
-
-            if self.lineBar[i].low < preLow or preLow == EMPTY_FLOAT:
-                preLow = self.lineBar[i].low     # 前InputPreLen周期低点
+        if self.highMax.isFull():
+            preHigh = self.highMax.getValue()    # 前InputPreLen周期高点
+            preLow = self.lowMin.getValue()      # 前InputPreLen周期低点
+        else:
+            # 首次计算时已完成的Bar不足inputPreLen根，和原有算法一致，计入当前Bar
+            preHigh = self.highMax.getValue(self.lineBar[-1].high)
+            preLow = self.lowMin.getValue(self.lineBar[-1].low)
 
         # 保存
-        if len(self.preHigh) > self.inputPreLen * 8:
-            del self.preHigh[0]
         self.preHigh.append(preHigh)
 
         # 保存
-        if len(self.preLow)> self.inputPreLen * 8:
-            del self.preLow[0]
         self.preLow.append(preLow)
 
     #----------------------------------------------------------------------
@@ -422,8 +522,6 @@ class CtaLineBar(object):
 
     def __recountEma(self):
         """计算K线的EMA1 和EMA2"""
-        l = len(self.lineBar)
-
         # 1、lineBar满足长度才执行计算
         if len(self.lineBar) < max(7, self.inputEma1Len, self.inputEma2Len)+2:
             self.debugCtaLog(u'数据未充分,当前Bar数据数量：{0}，计算EMA需要：{1}'.
@@ -433,38 +531,17 @@ class CtaLineBar(object):
         # 计算第一条EMA均线
         if self.inputEma1Len > 0:
 
-            if self.inputEma1Len > l:
-                ema1Len = l
-            else:
-                ema1Len = self.inputEma1Len
-
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            listClose=[x.close for x in self.lineBar[-ema1Len - 1:-1]]
-
-            barEma1 = ta.EMA(numpy.array(listClose, dtype=float), ema1Len)[-1]
-
-            barEma1 = round(float(barEma1), 3)
+            barEma1 = round(self.ema1Sum.mean(), 3)
 
-            if len(self.lineEma1) > self.inputEma1Len*8:
-                del self.lineEma1[0]
             self.lineEma1.append(barEma1)
 
         # 计算第二条EMA均线
         if self.inputEma2Len > 0:
 
-            if self.inputEma2Len > l:
-                ema2Len = l
-            else:
-                ema2Len = self.inputEma2Len
-
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            listClose=[x.close for x in self.lineBar[-ema2Len - 1:-1]]
-            barEma2 = ta.EMA(numpy.array(listClose, dtype=float), ema2Len)[-1]
-
-            barEma2 = round(float(barEma2), 3)
+            barEma2 = round(self.ema2Sum.mean(), 3)
 
-            if len(self.lineEma2) > self.inputEma1Len*8:
-                del self.lineEma2[0]
             self.lineEma2.append(barEma2)
 
 
@@ -480,80 +557,34 @@ class CtaLineBar(object):
             return
 
 
-        # 2、根据当前High，Low，(不包含当前周期）重新计算TR1，PDM，MDM和ATR
-        barTr1 = EMPTY_FLOAT      # 获取InputP周期内的价差最大值之和
-        barPdm = EMPTY_FLOAT      # InputP周期内的做多价差之和
-        barMdm = EMPTY_FLOAT      # InputP周期内的做空价差之和
-
-        for i in range(len(self.lineBar)-2, len(self.lineBar)-2-self.inputDmiLen, -1):  # 周期 inputDmiLen
-            # 3.1、计算TR1
-
-            # 当前周期最高与最低的价差
-            high_low_spread = self.lineBar[i].high - self.lineBar[i].low
-            # 当前周期最高与昨收价的价差
-            high_preclose_spread = abs(self.lineBar[i].high - self.lineBar[i - 1].close)
-            # 当前周期最低与昨收价的价差
-            low_preclose_spread = abs(self.lineBar[i].low - self.lineBar[i - 1].close)
-
-            # 最大价差
-            max_spread = max(high_low_spread, high_preclose_spread, low_preclose_spread)
-            barTr1 = barTr1 + float(max_spread)
-
-            # 今高与昨高的价差
-            high_prehigh_spread = self.lineBar[i].high - self.lineBar[i - 1].high
-            # 昨低与今低的价差
-            low_prelow_spread = self.lineBar[i - 1].low - self.lineBar[i].low
-
-            # 3.2、计算周期内的做多价差之和
-            if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
-                barPdm = barPdm + high_prehigh_spread
-
-            # 3.3、计算周期内的做空价差之和
-            if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
-                barMdm = barMdm + low_prelow_spread
-
-        # 6、计算上升动向指标，即做多的比率
-        if barTr1 == 0:
-            self.barPdi = 0
+        # 2、根据当前High，Low，(不包含当前周期）的TR1，PDM，MDM滚动求和计算动向指标
+        if self.dmi.trSum.isFull():
+            self.barPdi, self.barMdi, dx = self.dmi.getValue()
         else:
-            self.barPdi = barPdm * 100 / barTr1
+            # 首次计算时窗口中最早的K线没有前一根K线，和原有算法一致，使用当前K线的数据计算
+            firstBar = self.lineBar[-self.inputDmiLen-1]
+            lastBar = self.lineBar[-1]
+            tr = getTrueRange(firstBar.high, firstBar.low, lastBar.close)
+            pdm, mdm = getDirectionalMove(firstBar.high, firstBar.low, lastBar.high, lastBar.low)
+            self.barPdi, self.barMdi, dx = self.dmi.getValue(tr, pdm, mdm)
 
-        if len(self.linePdi) > self.inputDmiLen+1:
-            del self.linePdi[0]
 
         self.linePdi.append(self.barPdi)
 
-        # 7、计算下降动向指标，即做空的比率
-        if barTr1 == 0:
-            self.barMdi = 0
-        else:
-            self.barMdi = barMdm * 100 / barTr1
-
-        # 8、计算平均趋向指标 Adx，Adxr
-        if self.barMdi + self.barPdi == 0:
-            dx = 0
-        else:
-            dx = 100 * abs(self.barMdi - self.barPdi) / (self.barMdi + self.barPdi)
-
-        if len(self.lineMdi) > self.inputDmiLen+1:
-            del self.lineMdi[0]
 
         self.lineMdi.append(self.barMdi)
 
-        if len(self.lineDx) > self.inputDmiLen+1:
-            del self.lineDx[0]
 
         self.lineDx.append(dx)
+        self.adx.update(dx)
 
         # 平均趋向指标，MA计算
         if len(self.lineDx) < self.inputDmiLen+1:
             self.barAdx = dx
         else:
-            self.barAdx = ta.EMA(numpy.array(self.lineDx, dtype=float), self.inputDmiLen)[-1]
+            self.barAdx = self.adx.getValue()
 
         # 保存Adx值
-        if len(self.lineAdx) > self.inputDmiLen+1:
-            del self.lineAdx[0]
 
         self.lineAdx.append(self.barAdx)
 
@@ -564,8 +595,6 @@ class CtaLineBar(object):
             self.barAdxr = (self.lineAdx[-1] + self.lineAdx[-2]) / 2
 
         # 保存Adxr值
-        if len(self.lineAdxr) > self.inputDmiLen+1:
-            del self.lineAdxr[0]
         self.lineAdxr.append(self.barAdxr)
 
         # 7、计算A，ADX值持续高于前一周期时，市场行情将维持原趋势
@@ -669,8 +698,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr1 = round((self.lineAtr1[-1]*(self.inputAtr1Len -1) + barTr1) / self.inputAtr1Len, 3)
 
-            if len(self.lineAtr1) > self. inputAtr1Len+1 :
-                del self.lineAtr1[0]
             self.lineAtr1.append(self.barAtr1)
 
         if self.inputAtr2Len > 0:
@@ -679,8 +706,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr2 = round((self.lineAtr2[-1]*(self.inputAtr2Len -1) + barTr2) / self.inputAtr2Len, 3)
 
-            if len(self.lineAtr2) > self. inputAtr2Len+1:
-                del self.lineAtr2[0]
             self.lineAtr2.append(self.barAtr2)
 
         if self.inputAtr3Len > 0:
@@ -689,8 +714,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr3 = round((self.lineAtr3[-1]*(self.inputAtr3Len -1) + barTr3) / self.inputAtr3Len, 3)
 
-            if len(self.lineAtr3) > self. inputAtr3Len+1:
-                del self.lineAtr3[0]
 
             self.lineAtr3.append(self.barAtr3)
 
@@ -707,9 +730,7 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputVolLen+1))
             return
 
-        listVol = [x.volume for x in self.lineBar[-self.inputVolLen-1: -1]]
-
-        sumVol = ta.SUM(numpy.array(listVol, dtype=float), timeperiod=self.inputVolLen)[-1]
+        sumVol = self.volSum.sum
 
         avgVol = round(sumVol/self.inputVolLen, 0)
 
@@ -728,13 +749,10 @@ class CtaLineBar(object):
             return
 
         # 3、inputRsiLen(包含当前周期）的相对强弱
-        listClose=[x.close for x in self.lineBar[-self.inputRsiLen - 2:]]
-        barRsi = ta.RSI(numpy.array(listClose, dtype=float), self.inputRsiLen)[-1]
+        barRsi = self.rsi.getValue(self.lineBar[-1].close)
         barRsi = round(float(barRsi), 3)
 
         l = len(self.lineRsi)
-        if l > self.inputRsiLen*8:
-            del self.lineRsi[0]
 
         self.lineRsi.append(barRsi)
 
@@ -748,8 +766,6 @@ class CtaLineBar(object):
                 t["Close"] = self.lineBar[-2].close
 
 
-                if len(self.lineRsiTop) > self.inputRsiLen:
-                    del self.lineRsiTop[0]
 
                 self.lineRsiTop.append( t )
                 self.lastRsiTopButtom = self.lineRsiTop[-1]
@@ -762,8 +778,6 @@ class CtaLineBar(object):
                 b["RSI"] = self.lineRsi[-2]
                 b["Close"] = self.lineBar[-2].close
 
-                if len(self.lineRsiButtom) > self.inputRsiLen:
-                    del self.lineRsiButtom[0]
                 self.lineRsiButtom.append(b)
                 self.lastRsiTopButtom = self.lineRsiButtom[-1]
 
@@ -787,9 +801,14 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputCmiLen))
             return
 
-        listClose =[x.close for x in self.lineBar[-self.inputCmiLen:]]
-        hhv = max(listClose)
-        llv = min(listClose)
+        # 最近inputCmiLen根Bar（包含当前Bar）收盘价的最高和最低
+        close = self.lineBar[-1].close
+        if self.closeMax:
+            hhv = self.closeMax.getValue(close)
+            llv = self.closeMin.getValue(close)
+        else:
+            hhv = close
+            llv = close
 
         if hhv==llv:
             cmi = 100
@@ -798,14 +817,12 @@ class CtaLineBar(object):
 
         cmi = round(cmi, 2)
 
-        if len(self.lineCmi) > self.inputCmiLen:
-            del self.lineCmi[0]
 
         self.lineCmi.append(cmi)
 
     def __recountBoll(self):
         """布林特线"""
-        if self.inputBollLen < EMPTY_INT: return
+        if self.inputBollLen <= EMPTY_INT: return
 
         l = len(self.lineBar)
 
@@ -814,21 +831,12 @@ class CtaLineBar(object):
                              format(len(self.lineBar), min(7, self.inputBollLen)+1))
             return
 
-        if l < self.inputBollLen+2:
-            bollLen = l-1
-        else:
-            bollLen = self.inputBollLen
-
-        # 不包含当前最新的Bar
-        listClose=[x.close for x in self.lineBar[-bollLen - 1:-1]]
-        #
-        upper, middle, lower = ta.BBANDS(numpy.array(listClose, dtype=float),
-                                         timeperiod=bollLen, nbdevup=self.inputBollStdRate,
-                                         nbdevdn=self.inputBollStdRate, matype=0)
-
-        self.lineUpperBand.append(upper[-1])
-        self.lineMiddleBand.append(middle[-1])
-        self.lineLowerBand.append(lower[-1])
+        # 不包含当前最新的Bar，数据不足inputBollLen时使用全部已完成的Bar
+        upper, middle, lower = self.boll.getValue()
+
+        self.lineUpperBand.append(upper)
+        self.lineMiddleBand.append(middle)
+        self.lineLowerBand.append(lower)
 
 
     # ----------------------------------------------------------------------
@@ -64,7 +64,7 @@ class BacktestEngineMultiTF(BacktestingEngine):
 
         for d in self.initCursor:
             data = self.dataClass()
-            data.__dict__ = d
+            data.fromDict(d)
             self.initData.append(data)
 
     # ----------------------------------------------------------------------
@@ -142,7 +142,7 @@ class BacktestEngineMultiTF(BacktestingEngine):
         func = self.func
         for d in self.dbCursor:
             data = dataClass()
-            data.__dict__ = d
+            data.fromDict(d)
             func(data)
 
         self.output("No more historical data")
@@ -170,7 +170,7 @@ class BacktestEngineMultiTF(BacktestingEngine):
 
                 try:
                     temp[info_symbol] = CtaBarData()
-                    temp[info_symbol].__dict__ = data
+                    temp[info_symbol].fromDict(data)
                     self.infobar[info_symbol] = next(self.InfoCursor[info_symbol])
                 except StopIteration:
                     self.infobar[info_symbol] = None
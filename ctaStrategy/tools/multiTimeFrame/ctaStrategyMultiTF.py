@@ -232,7 +232,7 @@ class Prototype(AtrRsiStrategy):
             if data['datetime'] <= bar.datetime:
                 try:
                     temp[info_symbol] = CtaBarData()
-                    temp[info_symbol].__dict__ = data
+                    temp[info_symbol].fromDict(data)
                     self.initInfobar[info_symbol] = next(initInfoCursorDict[info_symbol])
                 except StopIteration:
                     self.ctaEngine.output("No more data for initializing %s." % (info_symbol,))
@@ -131,7 +131,7 @@ class BreakOut(CtaTemplate):
 
                 try:
                     temp[info_symbol] = CtaBarData()
-                    temp[info_symbol].__dict__ = data
+                    temp[info_symbol].fromDict(data)
                     self.initInfobar[info_symbol] = next(initInfoCursorDict[info_symbol])
                 except StopIteration:
                     self.initInfobar[info_symbol] = None
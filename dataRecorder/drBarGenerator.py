@@ -0,0 +1,162 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了行情记录引擎使用的多周期K线合成器。
+
+每个合约一个合成器，收到Tick时一次性更新该合约所有周期的K线：
+1. 分钟周期（1、5、15、60等）：按交易日内的交易分钟数对齐（每收到一个新的分钟
+   计数加1），午休、小节休息等非交易时间不占用K线，例如60分钟线包含60个交易分钟，
+   不会出现13:00这根K线只包含13:30之后半小时数据的情况；没有任何Tick的分钟不计数
+2. 日线（INTERVAL_DAILY）：按交易日合成，切换时间（默认17点）之后的夜盘
+   属于下一个交易日，周五夜盘属于下周一（节假日需要用户自行处理）
+某个周期的键变化时，之前的K线完成并通过回调函数推送。
+交易日结束时（需要定时调用closeSession）以及停止记录时（调用flush），
+所有尚未完成的K线立即推送，不用等待下一个交易日的第一个Tick。
+
+K线的成交量为K线内的成交量（由Tick的累计成交量计算差值）。为了和已有的
+1分钟线数据库兼容，1分钟线默认沿用原有的定义：K线开始时Tick的累计成交量。
+'''
+
+from datetime import datetime, timedelta
+
+from drBase import DrBarData
+from drJournal import getSession, DEFAULT_SESSION_HOUR
+
+
+# 日线周期
+INTERVAL_DAILY = 'd'
+
+
+########################################################################
+class BarGenerator(object):
+    """多周期K线合成器"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, intervals, onBar, sessionHour=DEFAULT_SESSION_HOUR, minuteDeltaVolume=False):
+        """
+        intervals：周期列表，整数为分钟数，INTERVAL_DAILY为日线
+        onBar：K线完成时的回调函数，参数为(周期, K线)
+        sessionHour：交易日切换的时间（点）
+        minuteDeltaVolume：1分钟线是否也使用K线内的成交量，默认使用K线开始时的累计成交量
+        """
+        self.onBar = onBar
+        self.sessionHour = sessionHour
+        self.minuteDeltaVolume = minuteDeltaVolume
+
+        self.minuteIntervals = sorted(set([n for n in intervals if n != INTERVAL_DAILY]))
+        self.daily = INTERVAL_DAILY in intervals
+
+        self.barDict = {}           # 正在合成的K线，key为周期
+        self.keyDict = {}           # 正在合成的K线的键，key为周期
+
+        self.lastVolume = None      # 上一个Tick的累计成交量
+        self.tradingDay = ''        # 当前交易日
+        self.sessionEnd = 0         # 当前交易日结束的纳秒时间戳
+        self.minuteIndex = -1       # 当前交易日内的交易分钟序号
+        self.lastMinute = None      # 最近一个交易分钟的开始时间
+
+    #----------------------------------------------------------------------
+    def updateTick(self, tick):
+        """更新Tick，需要tick.datetime和tick.epochNs已经赋值"""
+        # 进入新的交易日，接口的累计成交量从0开始计算（程序启动后的第一个交易日除外）
+        if tick.epochNs >= self.sessionEnd:
+            if self.sessionEnd:
+                self.lastVolume = 0
+            self.updateSession(tick.epochNs)
+
+        # 计算Tick之间的成交量，无法计算（启动后的第一个Tick、累计成交量变小）时记为0
+        if self.lastVolume is None or tick.volume < self.lastVolume:
+            volumeChange = 0
+        else:
+            volumeChange = tick.volume - self.lastVolume
+        self.lastVolume = tick.volume
+
+        # 新的分钟，交易分钟序号加1
+        minute = tick.datetime.replace(second=0, microsecond=0)
+        if self.lastMinute is None or minute > self.lastMinute:
+            self.minuteIndex += 1
+            self.lastMinute = minute
+
+        tradingDay = self.tradingDay
+        for n in self.minuteIntervals:
+            self.updateBar(n, (tradingDay, self.minuteIndex // n), tick, volumeChange)
+
+        if self.daily:
+            self.updateBar(INTERVAL_DAILY, tradingDay, tick, volumeChange)
+
+    #----------------------------------------------------------------------
+    def updateSession(self, epochNs):
+        """根据时间戳更新交易日，周六和周日顺延到下周一"""
+        date, sessionStart, self.sessionEnd = getSession(epochNs, self.sessionHour)
+
+        dt = datetime.strptime(date, '%Y%m%d')
+        if dt.weekday() >= 5:
+            dt += timedelta(7 - dt.weekday())
+        self.tradingDay = dt.strftime('%Y%m%d')
+
+        self.minuteIndex = -1
+        self.lastMinute = None
+
+    #----------------------------------------------------------------------
+    def closeSession(self, epochNs):
+        """到达交易日结束时间时推送所有尚未完成的K线，需要定时调用"""
+        if self.barDict and epochNs >= self.sessionEnd:
+            self.flush()
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """推送所有尚未完成的K线（交易日结束或者停止记录时调用）"""
+        for interval, bar in self.barDict.items():
+            self.onBar(interval, bar)
+
+        self.barDict.clear()
+        self.keyDict.clear()
+
+    #----------------------------------------------------------------------
+    def updateBar(self, interval, key, tick, volumeChange):
+        """更新单个周期的K线"""
+        bar = self.barDict.get(interval)
+
+        # 新的K线周期，推送之前完成的K线
+        if bar is None or key != self.keyDict[interval]:
+            if bar is not None:
+                self.onBar(interval, bar)
+
+            bar = DrBarData()
+            bar.vtSymbol = tick.vtSymbol
+            bar.symbol = tick.symbol
+            bar.exchange = tick.exchange
+
+            bar.open = tick.lastPrice
+            bar.high = tick.lastPrice
+            bar.low = tick.lastPrice
+            bar.close = tick.lastPrice
+
+            # 日线的日期使用交易日
+            if interval == INTERVAL_DAILY:
+                bar.date = self.tradingDay
+            else:
+                bar.date = tick.date
+            bar.time = tick.time
+            bar.datetime = tick.datetime
+
+            # 1分钟线默认沿用原有的成交量定义
+            if interval == 1 and not self.minuteDeltaVolume:
+                bar.volume = tick.volume
+            else:
+                bar.volume = volumeChange
+            bar.openInterest = tick.openInterest
+
+            self.barDict[interval] = bar
+            self.keyDict[interval] = key
+        # 否则继续累加新的K线
+        else:
+            if tick.lastPrice > bar.high:
+                bar.high = tick.lastPrice
+            elif tick.lastPrice < bar.low:
+                bar.low = tick.lastPrice
+            bar.close = tick.lastPrice
+
+            if interval != 1 or self.minuteDeltaVolume:
+                bar.volume += volumeChange
+            bar.openInterest = tick.openInterest
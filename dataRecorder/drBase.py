@@ -19,13 +19,26 @@ DAILY_DB_NAME = 'VnTrader_Daily_Db'
 MINUTE_DB_NAME = 'VnTrader_1Min_Db'
 
 
+#----------------------------------------------------------------------
+def getBarDbName(interval):
+    """获取K线周期对应的数据库名称，interval为分钟数，'d'为日线"""
+    if interval == 'd':
+        return DAILY_DB_NAME
+    if interval == 1:
+        return MINUTE_DB_NAME
+    return 'VnTrader_%sMin_Db' %interval
+
+
 # CTA引擎中涉及的数据类定义
 from vtConstant import EMPTY_UNICODE, EMPTY_STRING, EMPTY_FLOAT, EMPTY_INT
+from vtFunction import SlotsData
 
 
 ########################################################################
-class DrBarData(object):
+class DrBarData(SlotsData):
     """K线数据"""
+    __slots__ = ('vtSymbol', 'symbol', 'exchange', 'open', 'high', 'low', 'close', 'date',
+                 'time', 'datetime', 'volume', 'openInterest')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -48,8 +61,14 @@ class DrBarData(object):
 
 
 ########################################################################
-class DrTickData(object):
+class DrTickData(SlotsData):
     """Tick数据"""
+    __slots__ = ('vtSymbol', 'symbol', 'exchange', 'lastPrice', 'volume', 'openInterest',
+                 'upperLimit', 'lowerLimit', 'date', 'time', 'datetime', 'bidPrice1',
+                 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5', 'askPrice1', 'askPrice2',
+                 'askPrice3', 'askPrice4', 'askPrice5', 'bidVolume1', 'bidVolume2', 'bidVolume3',
+                 'bidVolume4', 'bidVolume5', 'askVolume1', 'askVolume2', 'askVolume3',
+                 'askVolume4', 'askVolume5')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -94,4 +113,8 @@ class DrTickData(object):
         self.askVolume2 = EMPTY_INT
         self.askVolume3 = EMPTY_INT
         self.askVolume4 = EMPTY_INT
-        self.askVolume5 = EMPTY_INT    
\ No newline at end of file
+        self.askVolume5 = EMPTY_INT
+
+
+# 写入数据库的Tick字段
+DR_TICK_FIELDS = DrTickData.getFieldNames()    
\ No newline at end of file
@@ -6,21 +6,30 @@
 使用DR_setting.json来配置需要收集的合约，以及主力合约代码。
 '''
 
+from __future__ import division
+
 import json
 import os
-import copy
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from Queue import Queue
 from threading import Thread
+from time import time as getTime
 
 from eventEngine import *
 from vtGateway import VtSubscribeReq, VtLogData
 from drBase import *
+from drJournal import TickJournal
+from drBarGenerator import BarGenerator
+from drShard import ShardedRecorder
 from vtFunction import todayDate
 from language import text
 
 
+# 默认的统计日志输出间隔（秒）
+DR_STATS_INTERVAL = 60
+
+
 ########################################################################
 class DrEngine(object):
     """数据记录引擎"""
@@ -44,7 +53,7 @@ class DrEngine(object):
         # Tick对象字典
         self.tickDict = {}
         
-        # K线对象字典
+        # K线合成器字典，key为vtSymbol，value为BarGenerator对象
         self.barDict = {}
         
         # 负责执行数据库插入的单独线程相关
@@ -52,6 +61,21 @@ class DrEngine(object):
         self.queue = Queue()                    # 队列
         self.thread = Thread(target=self.run)   # 线程
         
+        # Tick二进制日志，启用后Tick写入日志文件，时段结束后再批量导入数据库
+        self.journal = None
+        
+        # 多进程分片记录，启用后Tick转发到记录进程中写入数据库和合成K线
+        self.shardRecorder = None
+        
+        # 记录统计，key为vtSymbol，value为字典：
+        # tick：本周期内的Tick数量，bar：累计写入的K线数量，time：最新的Tick时间
+        self.statsDict = {}
+        self.statsInterval = DR_STATS_INTERVAL  # 输出统计日志的间隔（秒）
+        self.statsCount = 0                     # 距离上次输出统计日志的秒数
+        
+        # 是否每个Tick和K线都输出日志（只用于调试，会大幅增加事件引擎的负担）
+        self.logTick = False
+        
         # 载入设置，订阅行情
         self.loadSetting()
         
@@ -94,6 +118,13 @@ class DrEngine(object):
             if 'bar' in drSetting:
                 l = drSetting['bar']
                 
+                # 每个合约需要合成的K线周期（分钟数，'d'为日线），1分钟线总是合成
+                intervalDict = drSetting.get('barInterval', {})
+                barIntervalDict = {}
+                
+                # 1分钟线是否使用K线内的成交量（默认沿用原有的K线开始时的累计成交量）
+                minuteDeltaVolume = drSetting.get('minuteDeltaVolume', False)
+                
                 for setting in l:
                     symbol = setting[0]
                     vtSymbol = symbol
@@ -111,8 +142,10 @@ class DrEngine(object):
                     
                     self.mainEngine.subscribe(req, setting[1])  
                     
-                    bar = DrBarData() 
-                    self.barDict[vtSymbol] = bar
+                    intervals = [1] + intervalDict.get(vtSymbol, [])
+                    barIntervalDict[vtSymbol] = intervals
+                    self.barDict[vtSymbol] = BarGenerator(intervals, self.onBar, 
+                                                          minuteDeltaVolume=minuteDeltaVolume)
                     
             if 'active' in drSetting:
                 d = drSetting['active']
@@ -121,6 +154,33 @@ class DrEngine(object):
                 for activeSymbol, vtSymbol in d.items():
                     self.activeSymbolDict[vtSymbol] = activeSymbol
             
+            # 统计日志的间隔和逐条日志的开关
+            self.statsInterval = drSetting.get('statsInterval', DR_STATS_INTERVAL)
+            self.logTick = drSetting.get('logTick', False)
+            
+            for vtSymbol in self.tickDict.keys() + self.barDict.keys():
+                self.statsDict[vtSymbol] = {'tick': 0, 'bar': 0, 'time': ''}
+            
+            # 启用多进程分片记录，K线在记录进程中合成
+            workerCount = drSetting.get('workerCount', 0)
+            if workerCount:
+                self.shardRecorder = ShardedRecorder(workerCount, self.tickDict.keys(), 
+                                                     barIntervalDict, self.activeSymbolDict,
+                                                     self.writeDrLog, 
+                                                     minuteDeltaVolume=minuteDeltaVolume)
+                
+            # 启用Tick二进制日志
+            elif drSetting.get('journal', False):
+                journalPath = drSetting.get('journalPath') or os.path.join(self.path, 'journal')
+                
+                if drSetting.get('journalLoad', True):
+                    loadFunc = self.loadJournalData
+                else:
+                    loadFunc = None
+                    
+                self.journal = TickJournal(journalPath, loadFunc, self.writeDrLog, 
+                                           self.isDbConnected)
+            
             # 启动数据插入线程
             self.start()
             
@@ -132,80 +192,178 @@ class DrEngine(object):
         """处理行情推送"""
         tick = event.dict_['data']
         vtSymbol = tick.vtSymbol
+        
+        # 只处理需要记录的合约
+        stats = self.statsDict.get(vtSymbol)
+        if stats is None:
+            return
+        stats['tick'] += 1
+        stats['time'] = tick.time
 
-        # 转化Tick格式
-        drTick = DrTickData()
-        d = drTick.__dict__
-        for key in d.keys():
-            if key != 'datetime':
-                d[key] = tick.__getattribute__(key)
-        drTick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')            
+        # 直接使用接口推送的只读tick对象，不再转化为DrTickData，写入数据库时只保存DrTickData中的字段
+        # 不是由接口推送的tick在这里解析时间并设为只读
+        tick.freeze()
+        
+        # 分片模式下只转发给记录进程
+        if self.shardRecorder:
+            self.shardRecorder.put(tick)
+            return
         
         # 更新Tick数据
         if vtSymbol in self.tickDict:
-            self.insertData(TICK_DB_NAME, vtSymbol, drTick)
-            
-            if vtSymbol in self.activeSymbolDict:
-                activeSymbol = self.activeSymbolDict[vtSymbol]
-                self.insertData(TICK_DB_NAME, activeSymbol, drTick)
+            # 启用日志时只追加写入日志文件，主力合约的数据在导入数据库时再写入
+            if self.journal:
+                self.journal.write(tick)
+            else:
+                self.insertData(TICK_DB_NAME, vtSymbol, tick, DR_TICK_FIELDS)
+                
+                if vtSymbol in self.activeSymbolDict:
+                    activeSymbol = self.activeSymbolDict[vtSymbol]
+                    self.insertData(TICK_DB_NAME, activeSymbol, tick, DR_TICK_FIELDS)
             
-            # 发出日志
-            self.writeDrLog(text.TICK_LOGGING_MESSAGE.format(symbol=drTick.vtSymbol,
-                                                             time=drTick.time, 
-                                                             last=drTick.lastPrice, 
-                                                             bid=drTick.bidPrice1, 
-                                                             ask=drTick.askPrice1))
+            # 逐条日志只在调试时开启，正常运行时由定时统计代替
+            if self.logTick:
+                self.writeDrLog(text.TICK_LOGGING_MESSAGE.format(symbol=tick.vtSymbol,
+                                                                 time=tick.time, 
+                                                                 last=tick.lastPrice, 
+                                                                 bid=tick.bidPrice1, 
+                                                                 ask=tick.askPrice1))
             
-        # 更新分钟线数据
+        # 更新K线数据，一次更新该合约所有周期的K线
         if vtSymbol in self.barDict:
-            bar = self.barDict[vtSymbol]
+            self.barDict[vtSymbol].updateTick(tick)
             
-            # 如果第一个TICK或者新的一分钟
-            if not bar.datetime or bar.datetime.minute != drTick.datetime.minute:    
-                if bar.vtSymbol:
-                    newBar = copy.copy(bar)
-                    self.insertData(MINUTE_DB_NAME, vtSymbol, newBar)
-                    
-                    if vtSymbol in self.activeSymbolDict:
-                        activeSymbol = self.activeSymbolDict[vtSymbol]
-                        self.insertData(MINUTE_DB_NAME, activeSymbol, newBar)                    
-                    
-                    self.writeDrLog(text.BAR_LOGGING_MESSAGE.format(symbol=bar.vtSymbol, 
-                                                                    time=bar.time, 
-                                                                    open=bar.open, 
-                                                                    high=bar.high, 
-                                                                    low=bar.low, 
-                                                                    close=bar.close))
-                         
-                bar.vtSymbol = drTick.vtSymbol
-                bar.symbol = drTick.symbol
-                bar.exchange = drTick.exchange
-                
-                bar.open = drTick.lastPrice
-                bar.high = drTick.lastPrice
-                bar.low = drTick.lastPrice
-                bar.close = drTick.lastPrice
-                
-                bar.date = drTick.date
-                bar.time = drTick.time
-                bar.datetime = drTick.datetime
-                bar.volume = drTick.volume
-                bar.openInterest = drTick.openInterest        
-            # 否则继续累加新的K线
-            else:                               
-                bar.high = max(bar.high, drTick.lastPrice)
-                bar.low = min(bar.low, drTick.lastPrice)
-                bar.close = drTick.lastPrice            
+    #----------------------------------------------------------------------
+    def onBar(self, interval, bar):
+        """K线合成完成，插入对应周期的数据库"""
+        dbName = getBarDbName(interval)
+        self.insertData(dbName, bar.vtSymbol, bar)
+        
+        if bar.vtSymbol in self.activeSymbolDict:
+            activeSymbol = self.activeSymbolDict[bar.vtSymbol]
+            self.insertData(dbName, activeSymbol, bar)
+        
+        self.statsDict[bar.vtSymbol]['bar'] += 1
+        
+        if self.logTick:
+            self.writeDrLog(text.BAR_LOGGING_MESSAGE.format(symbol=bar.vtSymbol, 
+                                                            time=bar.time, 
+                                                            open=bar.open, 
+                                                            high=bar.high, 
+                                                            low=bar.low, 
+                                                            close=bar.close))
+            
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """定时输出记录统计"""
+        if self.shardRecorder:
+            self.shardRecorder.processTimer()
+        
+        # 到达交易日结束时间后推送所有尚未完成的K线
+        nowNs = int(getTime()) * 1000000000
+        for generator in self.barDict.values():
+            generator.closeSession(nowNs)
+        
+        self.statsCount += 1
+        if self.statsCount < self.statsInterval:
+            return
+        
+        queueSize = self.getQueueSize()
+        
+        for vtSymbol, stats in self.statsDict.items():
+            self.writeDrLog(text.STATS_LOGGING_MESSAGE.format(symbol=vtSymbol,
+                                                              rate=stats['tick'] / self.statsCount,
+                                                              bar=stats['bar'],
+                                                              time=stats['time'],
+                                                              queue=queueSize))
+            stats['tick'] = 0
+        
+        # 分片模式下输出每个记录进程的运行状态和延时
+        for shard, d in enumerate(self.getShardStats()):
+            self.writeDrLog(text.SHARD_STATS_MESSAGE.format(shard=shard, **d))
+            
+        self.statsCount = 0
+        
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取记录统计，返回字典，key为vtSymbol，value为字典：
+        tickRate：本周期内每秒的Tick数量，bar：累计写入的K线数量，
+        time：最新的Tick时间，queue：等待写入数据库的数据数量
+        """
+        queueSize = self.getQueueSize()
+        seconds = max(self.statsCount, 1)
+        
+        d = {}
+        for vtSymbol, stats in self.statsDict.items():
+            d[vtSymbol] = {
+                'tickRate': stats['tick'] / seconds,
+                'bar': stats['bar'],
+                'time': stats['time'],
+                'queue': queueSize
+            }
+        return d
+    
+    #----------------------------------------------------------------------
+    def getQueueSize(self):
+        """
+        等待写入数据库的数据数量：插入队列和主引擎批量写入服务中缓存的数据，
+        以及Tick日志中尚未导入数据库的数据（分片模式下各记录进程的数量见getShardStats）
+        """
+        queueSize = self.queue.qsize() + self.mainEngine.getDbStats()['depth']
+        
+        if self.journal:
+            queueSize += self.journal.getStats()['pending']
+        
+        return queueSize
+    
+    #----------------------------------------------------------------------
+    def getShardStats(self):
+        """获取分片模式下每个记录进程的统计，未启用分片时返回空列表"""
+        if self.shardRecorder:
+            return self.shardRecorder.getStats()
+        return []
 
     #----------------------------------------------------------------------
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_TICK, self.procecssTickEvent)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
  
     #----------------------------------------------------------------------
-    def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.queue.put((dbName, collectionName, data.__dict__))
+    def insertData(self, dbName, collectionName, data, fieldNames=None):
+        """
+        插入数据到数据库（这里的data可以是VtTickData、DrTickData或者DrBarData）
+        fieldNames：只写入指定的字段
+        """
+        self.queue.put((dbName, collectionName, data.toDict(fieldNames)))
+        
+    #----------------------------------------------------------------------
+    def loadJournalData(self, vtSymbol, l, resume=False):
+        """
+        把Tick日志中读取的一批数据导入数据库（在日志的导入线程中调用），返回是否写入成功
+        resume：这批数据可能已经部分写入过，按时间更新或插入以免重复
+        """
+        if resume:
+            upsertKey = 'datetime'
+        else:
+            upsertKey = ''
+        
+        if not self.mainEngine.dbInsertMany(TICK_DB_NAME, vtSymbol, 
+                                            [tick.toDict() for tick in l], upsertKey):
+            return False
+        
+        # insert_many会在字典中添加_id，主力合约需要重新生成字典
+        if vtSymbol in self.activeSymbolDict:
+            activeSymbol = self.activeSymbolDict[vtSymbol]
+            return self.mainEngine.dbInsertMany(TICK_DB_NAME, activeSymbol, 
+                                                [tick.toDict() for tick in l], upsertKey)
+        return True
+        
+    #----------------------------------------------------------------------
+    def isDbConnected(self):
+        """数据库是否已经连接"""
+        return self.mainEngine.dbClient is not None
         
     #----------------------------------------------------------------------
     def run(self):
@@ -213,7 +371,8 @@ class DrEngine(object):
         while self.active:
             try:
                 dbName, collectionName, d = self.queue.get(block=True, timeout=1)
-                self.mainEngine.dbInsert(dbName, collectionName, d)
+                # 交给主引擎的批量写入服务，由其合并后批量写入数据库
+                self.mainEngine.dbInsertAsync(dbName, collectionName, d)
             except Empty:
                 pass
             
@@ -223,12 +382,33 @@ class DrEngine(object):
         self.active = True
         self.thread.start()
         
+        if self.shardRecorder:
+            self.shardRecorder.start()
+        
+        if self.journal:
+            self.journal.start()
+        
     #----------------------------------------------------------------------
     def stop(self):
         """退出"""
         if self.active:
+            # 推送所有尚未完成的K线，交易时段中停止时会写入不完整的K线
+            for generator in self.barDict.values():
+                generator.flush()
+            
             self.active = False
             self.thread.join()
+            
+            # 插入线程退出后队列中剩余的数据
+            while not self.queue.empty():
+                dbName, collectionName, d = self.queue.get()
+                self.mainEngine.dbInsertAsync(dbName, collectionName, d)
+            
+            if self.shardRecorder:
+                self.shardRecorder.stop()
+            
+            if self.journal:
+                self.journal.stop()
         
     #----------------------------------------------------------------------
     def writeDrLog(self, content):
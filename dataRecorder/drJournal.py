@@ -0,0 +1,512 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了Tick数据的二进制日志（journal），作为行情记录引擎写入数据库之外的另一种记录方式。
+
+每个合约每个交易时段一个文件，文件头之后是固定长度的二进制记录，
+收到Tick时只需要struct打包后追加写入（带缓冲），不需要转换为字典，
+也不需要每个Tick一次数据库往返，记录全市场行情时也不会积压。
+
+后台线程负责：
+1. 定时把缓冲写入文件并fsync，保证进程崩溃时最多丢失一个周期的数据
+2. 到达时段切换时间后关闭当前时段的文件（即使没有新的Tick到来）
+3. 数据库连接后，把已经结束的时段文件批量导入数据库，导入完成后文件改名为.loaded，
+   导入进度（已导入的记录数）保存在.progress文件中，导入中断后从中断的位置继续，
+   中断时可能已经部分写入的那一批数据按时间更新或插入，不会重复
+
+时段切换时间默认为17点（日盘收盘之后、夜盘开盘之前），切换时间之后的Tick
+属于下一个自然日的时段，因此夜盘的数据和次日日盘的数据在同一个文件中。
+'''
+
+import os
+import struct
+from Queue import Queue, Empty
+from threading import Thread, Lock
+from datetime import datetime, timedelta
+from time import mktime, sleep
+from time import time as getTime
+
+from drBase import DrTickData
+from language import text
+
+
+# 文件格式
+JOURNAL_SUFFIX = '.tick'                # 日志文件后缀
+LOADED_SUFFIX = '.loaded'               # 导入数据库完成后添加的后缀
+PROGRESS_SUFFIX = '.progress'           # 导入进度文件的后缀
+JOURNAL_MAGIC = 'VTJ1'                  # 文件头标识
+
+# 文件头：标识、版本、记录长度、vtSymbol、代码、交易所
+HEADER_STRUCT = struct.Struct('<4sHH32s32s16s')
+JOURNAL_VERSION = 1
+
+# 记录：纳秒时间戳、最新价、成交量、持仓量、涨停价、跌停价、五档买价、五档卖价、五档买量、五档卖量
+RECORD_STRUCT = struct.Struct('<qdqddd5d5d5q5q')
+
+# 默认参数
+DEFAULT_SESSION_HOUR = 17               # 时段切换的时间（点）
+DEFAULT_SYNC_INTERVAL = 1.0             # 缓冲写入文件并fsync的间隔（秒）
+FILE_BUFFER_SIZE = 65536                # 文件写入缓冲大小
+LOAD_BATCH_SIZE = 5000                  # 导入数据库时每批的数据量
+LOAD_RETRY_INTERVAL = 10                # 导入失败后重试的间隔（秒）
+
+
+#----------------------------------------------------------------------
+def getSession(epochNs, sessionHour=DEFAULT_SESSION_HOUR):
+    """
+    获取时间戳所属的时段，返回(时段日期字符串, 开始纳秒时间戳, 结束纳秒时间戳)
+    时段从前一天的sessionHour点开始，到当天的sessionHour点结束，以结束的日期命名
+    """
+    dt = datetime.fromtimestamp(epochNs // 1000000000)
+    start = dt.replace(hour=sessionHour, minute=0, second=0, microsecond=0)
+    if dt < start:
+        start -= timedelta(1)
+    end = start + timedelta(1)
+
+    startNs = int(mktime(start.timetuple())) * 1000000000
+    endNs = int(mktime(end.timetuple())) * 1000000000
+    return end.strftime('%Y%m%d'), startNs, endNs
+
+#----------------------------------------------------------------------
+def packTick(tick):
+    """把Tick打包为二进制记录"""
+    return RECORD_STRUCT.pack(tick.epochNs, tick.lastPrice, int(tick.volume),
+                              tick.openInterest, tick.upperLimit, tick.lowerLimit,
+                              tick.bidPrice1, tick.bidPrice2, tick.bidPrice3,
+                              tick.bidPrice4, tick.bidPrice5,
+                              tick.askPrice1, tick.askPrice2, tick.askPrice3,
+                              tick.askPrice4, tick.askPrice5,
+                              int(tick.bidVolume1), int(tick.bidVolume2), int(tick.bidVolume3),
+                              int(tick.bidVolume4), int(tick.bidVolume5),
+                              int(tick.askVolume1), int(tick.askVolume2), int(tick.askVolume3),
+                              int(tick.askVolume4), int(tick.askVolume5))
+
+#----------------------------------------------------------------------
+def unpackTick(record, vtSymbol, symbol, exchange, dataClass=DrTickData):
+    """把二进制记录解包为Tick对象，dataClass为DrTickData或其子类"""
+    (epochNs, lastPrice, volume, openInterest, upperLimit, lowerLimit,
+     bidPrice1, bidPrice2, bidPrice3, bidPrice4, bidPrice5,
+     askPrice1, askPrice2, askPrice3, askPrice4, askPrice5,
+     bidVolume1, bidVolume2, bidVolume3, bidVolume4, bidVolume5,
+     askVolume1, askVolume2, askVolume3, askVolume4, askVolume5) = record
+
+    tick = dataClass()
+    tick.vtSymbol = vtSymbol
+    tick.symbol = symbol
+    tick.exchange = exchange
+
+    tick.lastPrice = lastPrice
+    tick.volume = volume
+    tick.openInterest = openInterest
+    tick.upperLimit = upperLimit
+    tick.lowerLimit = lowerLimit
+
+    # 由纳秒时间戳还原日期和时间字符串，小数部分去掉末尾的0（如.500000还原为.5）
+    dt = datetime.fromtimestamp(epochNs // 1000000000).replace(microsecond=epochNs // 1000 % 1000000)
+    tick.datetime = dt
+    tick.date = dt.strftime('%Y%m%d')
+    tick.time = '%02d:%02d:%02d.%s' %(dt.hour, dt.minute, dt.second,
+                                      ('%06d' %dt.microsecond).rstrip('0') or '0')
+
+    tick.bidPrice1 = bidPrice1
+    tick.bidPrice2 = bidPrice2
+    tick.bidPrice3 = bidPrice3
+    tick.bidPrice4 = bidPrice4
+    tick.bidPrice5 = bidPrice5
+
+    tick.askPrice1 = askPrice1
+    tick.askPrice2 = askPrice2
+    tick.askPrice3 = askPrice3
+    tick.askPrice4 = askPrice4
+    tick.askPrice5 = askPrice5
+
+    tick.bidVolume1 = bidVolume1
+    tick.bidVolume2 = bidVolume2
+    tick.bidVolume3 = bidVolume3
+    tick.bidVolume4 = bidVolume4
+    tick.bidVolume5 = bidVolume5
+
+    tick.askVolume1 = askVolume1
+    tick.askVolume2 = askVolume2
+    tick.askVolume3 = askVolume3
+    tick.askVolume4 = askVolume4
+    tick.askVolume5 = askVolume5
+
+    return tick
+
+#----------------------------------------------------------------------
+def readJournalHeader(f):
+    """读取文件头，返回(vtSymbol, 代码, 交易所)"""
+    data = f.read(HEADER_STRUCT.size)
+    if len(data) < HEADER_STRUCT.size:
+        raise ValueError(u'日志文件头不完整')
+
+    magic, version, recordSize, vtSymbol, symbol, exchange = HEADER_STRUCT.unpack(data)
+    if magic != JOURNAL_MAGIC or recordSize != RECORD_STRUCT.size:
+        raise ValueError(u'日志文件格式错误')
+
+    return vtSymbol.rstrip('\0'), symbol.rstrip('\0'), exchange.rstrip('\0')
+
+#----------------------------------------------------------------------
+def readJournal(fileName, batchSize=LOAD_BATCH_SIZE, start=0):
+    """
+    读取日志文件，返回生成器，每次返回一批DrTickData的列表
+    start：从第几条记录开始读取
+    文件末尾不完整的记录（写入过程中进程崩溃）会被忽略，重新打开文件追加之前会被截掉
+    """
+    size = RECORD_STRUCT.size
+    unpack = RECORD_STRUCT.unpack_from
+
+    with open(fileName, 'rb') as f:
+        vtSymbol, symbol, exchange = readJournalHeader(f)
+        f.seek(HEADER_STRUCT.size + start * size)
+
+        while True:
+            data = f.read(size * batchSize)
+            count = len(data) // size
+            if not count:
+                break
+
+            yield [unpackTick(unpack(data, i * size), vtSymbol, symbol, exchange)
+                   for i in xrange(count)]
+
+            if count < batchSize:
+                break
+
+
+########################################################################
+class JournalFile(object):
+    """单个合约单个时段的日志文件"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, fileName, tick):
+        """Constructor"""
+        self.fileName = fileName
+
+        # 已存在的文件（如程序崩溃后重启）继续追加，追加之前先截掉末尾不完整的记录，
+        # 否则之后写入的记录都会错位
+        if os.path.exists(fileName):
+            self.truncate(fileName)
+
+        self.file = open(fileName, 'ab', FILE_BUFFER_SIZE)
+
+        # 新文件写入文件头
+        if not os.path.getsize(fileName):
+            self.file.write(HEADER_STRUCT.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_STRUCT.size,
+                                               str(tick.vtSymbol), str(tick.symbol),
+                                               str(tick.exchange)))
+
+    #----------------------------------------------------------------------
+    def truncate(self, fileName):
+        """把文件截断到最后一条完整的记录，文件头不完整时清空文件"""
+        size = os.path.getsize(fileName)
+
+        if size < HEADER_STRUCT.size:
+            validSize = 0
+        else:
+            count = (size - HEADER_STRUCT.size) // RECORD_STRUCT.size
+            validSize = HEADER_STRUCT.size + count * RECORD_STRUCT.size
+
+        if validSize < size:
+            with open(fileName, 'r+b') as f:
+                f.truncate(validSize)
+
+    #----------------------------------------------------------------------
+    def write(self, tick):
+        """追加写入Tick"""
+        self.file.write(packTick(tick))
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """把缓冲写入操作系统，返回文件描述符用于fsync"""
+        self.file.flush()
+        return self.file.fileno()
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭文件"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+########################################################################
+class TickJournal(object):
+    """
+    Tick二进制日志
+
+    write在事件引擎线程中调用，只做打包和带缓冲的追加写入；
+    fsync、时段切换和导入数据库都在后台线程中完成。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, path, loadFunc=None, logFunc=None, readyFunc=None,
+                 sessionHour=DEFAULT_SESSION_HOUR, syncInterval=DEFAULT_SYNC_INTERVAL):
+        """
+        path：日志文件的根目录，每个时段一个子目录
+        loadFunc：导入数据库的函数，参数为(vtSymbol, DrTickData列表, 是否可能已经部分写入)，
+                  返回是否写入成功，为空时不导入
+        logFunc：输出日志的函数
+        readyFunc：返回数据库是否已经连接的函数，连接之前不导入
+        sessionHour：时段切换的时间（点）
+        syncInterval：缓冲写入文件并fsync的间隔（秒）
+        """
+        self.path = path
+        self.loadFunc = loadFunc
+        self.logFunc = logFunc
+        self.readyFunc = readyFunc
+        self.sessionHour = sessionHour
+        self.syncInterval = syncInterval
+
+        self.fileDict = {}          # 当前时段打开的文件，key为vtSymbol
+        self.sessionDate = ''       # 当前时段的日期
+        self.sessionEnd = 0         # 当前时段结束的纳秒时间戳
+        self.lock = Lock()          # 保护fileDict和文件写入
+
+        # 统计数据
+        self.writeCount = 0         # 写入的Tick数量
+        self.loadCount = 0          # 导入数据库的Tick数量
+        self.pendingDict = {}       # 等待导入数据库的Tick数量，key为文件名
+
+        self.active = False
+        self.loadQueue = Queue()    # 等待导入数据库的文件
+        self.syncThread = Thread(target=self.runSync)
+        self.syncThread.setDaemon(True)
+        self.loadThread = Thread(target=self.runLoad)
+        self.loadThread.setDaemon(True)
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    #----------------------------------------------------------------------
+    def write(self, tick):
+        """写入Tick，需要tick.epochNs已经赋值"""
+        with self.lock:
+            # 进入新的时段时关闭上一个时段的所有文件
+            if tick.epochNs >= self.sessionEnd:
+                self.rotate(tick.epochNs)
+
+            journalFile = self.fileDict.get(tick.vtSymbol)
+            if not journalFile:
+                fileName = os.path.join(self.path, self.sessionDate, tick.vtSymbol + JOURNAL_SUFFIX)
+                journalFile = JournalFile(fileName, tick)
+                self.fileDict[tick.vtSymbol] = journalFile
+
+            journalFile.write(tick)
+            self.writeCount += 1
+
+    #----------------------------------------------------------------------
+    def rotate(self, epochNs):
+        """切换到epochNs所在的时段（调用时需持有锁）"""
+        self.closeFiles()
+
+        self.sessionDate, sessionStart, self.sessionEnd = getSession(epochNs, self.sessionHour)
+
+        sessionPath = os.path.join(self.path, self.sessionDate)
+        if not os.path.exists(sessionPath):
+            os.makedirs(sessionPath)
+
+    #----------------------------------------------------------------------
+    def closeFiles(self):
+        """关闭当前时段的所有文件，并加入导入队列（调用时需持有锁）"""
+        for journalFile in self.fileDict.values():
+            journalFile.close()
+            if self.loadFunc:
+                self.queueFile(journalFile.fileName)
+
+        self.fileDict.clear()
+
+    #----------------------------------------------------------------------
+    def sync(self):
+        """把所有文件的缓冲写入磁盘，到达时段结束时间时关闭所有文件"""
+        with self.lock:
+            # 到达时段结束时间后直接切换到下一个时段，
+            # 之后到达的时间戳稍早的Tick写入新时段的文件，不会重新打开已结束的文件
+            nowNs = int(getTime()) * 1000000000
+            if self.fileDict and nowNs >= self.sessionEnd:
+                self.rotate(nowNs)
+                return
+
+            fdList = [journalFile.flush() for journalFile in self.fileDict.values()]
+
+        # fsync较慢，在锁之外执行，不阻塞写入
+        for fd in fdList:
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass        # 文件已经在切换时段时被关闭
+
+    #----------------------------------------------------------------------
+    def runSync(self):
+        """定时同步线程"""
+        while self.active:
+            startTime = getTime()
+            self.sync()
+
+            remaining = self.syncInterval - (getTime() - startTime)
+            if remaining > 0:
+                sleep(remaining)
+
+    #----------------------------------------------------------------------
+    def scanUnloaded(self):
+        """扫描之前时段中已经结束但尚未导入数据库的文件（如程序在导入前退出）"""
+        if not self.loadFunc:
+            return
+
+        today = getSession(int(getTime()) * 1000000000, self.sessionHour)[0]
+
+        for sessionDate in sorted(os.listdir(self.path)):
+            sessionPath = os.path.join(self.path, sessionDate)
+            if sessionDate >= today or not os.path.isdir(sessionPath):
+                continue
+
+            for name in sorted(os.listdir(sessionPath)):
+                if name.endswith(JOURNAL_SUFFIX):
+                    self.queueFile(os.path.join(sessionPath, name))
+
+    #----------------------------------------------------------------------
+    def queueFile(self, fileName):
+        """把文件加入导入队列，并根据文件大小和导入进度统计等待导入的Tick数量"""
+        count = max(os.path.getsize(fileName) - HEADER_STRUCT.size, 0) // RECORD_STRUCT.size
+
+        progressFileName = fileName + PROGRESS_SUFFIX
+        if os.path.exists(progressFileName):
+            try:
+                count -= self.readProgress(progressFileName)
+            except (IOError, ValueError):
+                pass
+
+        self.pendingDict[fileName] = max(count, 0)
+        self.loadQueue.put(fileName)
+
+    #----------------------------------------------------------------------
+    def loadFile(self, fileName):
+        """
+        把日志文件导入数据库，完成后文件改名
+        每批写入成功后保存进度，中断后从进度位置继续，进度之后的第一批数据
+        可能已经部分写入，通知导入函数按更新或插入的方式写入
+        """
+        progressFileName = fileName + PROGRESS_SUFFIX
+
+        # 有进度文件说明之前导入过（可能在第一批写入时就中断了）
+        resume = os.path.exists(progressFileName)
+        if resume:
+            start = self.readProgress(progressFileName)
+        else:
+            start = 0
+            self.writeProgress(progressFileName, 0)
+
+        count = start
+        for l in readJournal(fileName, start=start):
+            if not self.loadFunc(l[0].vtSymbol, l, resume):
+                raise IOError(text.JOURNAL_DATABASE_UNAVAILABLE)
+            resume = False
+
+            count += len(l)
+            self.writeProgress(progressFileName, count)
+            self.loadCount += len(l)
+            self.pendingDict[fileName] = max(self.pendingDict.get(fileName, 0) - len(l), 0)
+
+        os.rename(fileName, fileName + LOADED_SUFFIX)
+        os.remove(progressFileName)
+        self.pendingDict.pop(fileName, None)
+        return count
+
+    #----------------------------------------------------------------------
+    def readProgress(self, progressFileName):
+        """读取导入进度"""
+        with open(progressFileName) as f:
+            return int(f.read() or 0)
+
+    #----------------------------------------------------------------------
+    def writeProgress(self, progressFileName, count):
+        """保存导入进度，先写入临时文件再重命名"""
+        tmpFileName = progressFileName + '.tmp'
+        with open(tmpFileName, 'w') as f:
+            f.write(str(count))
+            f.flush()
+            os.fsync(f.fileno())
+
+        if os.path.exists(progressFileName):
+            os.remove(progressFileName)
+        os.rename(tmpFileName, progressFileName)
+
+    #----------------------------------------------------------------------
+    def runLoad(self):
+        """导入数据库线程"""
+        while self.active:
+            # 数据库连接之前不导入
+            if self.readyFunc and not self.readyFunc():
+                self.wait(1)
+                continue
+
+            try:
+                fileName = self.loadQueue.get(block=True, timeout=1)
+            except Empty:
+                continue
+
+            try:
+                count = self.loadFile(fileName)
+                self.writeLog(text.JOURNAL_LOAD_COMPLETED.format(file=fileName, count=count))
+            except ValueError as e:
+                # 文件格式错误，重试也无法导入
+                self.writeLog(text.JOURNAL_LOAD_FAILED.format(file=fileName, error=e))
+                self.pendingDict.pop(fileName, None)
+            except Exception as e:
+                # 数据库写入失败，稍后从保存的进度继续导入
+                self.writeLog(text.JOURNAL_LOAD_FAILED.format(file=fileName, error=e))
+                self.loadQueue.put(fileName)
+                self.wait(LOAD_RETRY_INTERVAL)
+
+    #----------------------------------------------------------------------
+    def wait(self, seconds):
+        """等待一段时间，停止时立即返回"""
+        endTime = getTime() + seconds
+        while self.active and getTime() < endTime:
+            sleep(max(0, min(1, endTime - getTime())))
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content):
+        """输出日志"""
+        if self.logFunc:
+            self.logFunc(content)
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动后台线程"""
+        self.active = True
+        self.scanUnloaded()
+        self.syncThread.start()
+        self.loadThread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，关闭所有文件（当前时段的文件留到时段结束后再导入）"""
+        if not self.active:
+            return
+
+        self.active = False
+        self.syncThread.join()
+        self.loadThread.join()
+
+        with self.lock:
+            for journalFile in self.fileDict.values():
+                journalFile.close()
+            self.fileDict.clear()
+            self.sessionEnd = 0
+
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取统计数据，返回字典：
+        session：当前时段，files：当前打开的文件数量，written/loaded：写入/导入数据库的Tick数量，
+        loadQueue：等待导入的文件数量，pending：等待导入的文件中尚未导入的Tick数量
+        """
+        return {
+            'session': self.sessionDate,
+            'files': len(self.fileDict),
+            'written': self.writeCount,
+            'loaded': self.loadCount,
+            'loadQueue': self.loadQueue.qsize(),
+            'pending': sum(self.pendingDict.values())
+        }
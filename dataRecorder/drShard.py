@@ -0,0 +1,540 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了多进程分片的行情记录，用于记录全市场数千个合约的行情。
+
+单个行情记录引擎只有一个写入线程，并且K线合成和数据转换都在主进程中完成，
+受GIL的限制无法利用多核。分片模式下需要记录的合约按顺序轮流分配到N个
+记录进程（worker）中，主进程只负责把Tick打包为固定长度的二进制记录，
+按分片缓存后通过管道批量发送，每个记录进程独立完成K线合成和数据库批量写入。
+
+管道写入可能阻塞（记录进程处理过慢或者卡住），因此每个分片由单独的发送线程
+写入管道，事件引擎线程只把消息放入有上限的发送队列，队列已满或者记录进程
+已经退出时丢弃Tick并计数，不会阻塞事件引擎（交易相关的事件也在该线程中处理）。
+
+管道中的消息（recv_bytes/send_bytes，不使用pickle）：
+'S' + 合约定义：本地编号、vtSymbol、代码、交易所，合约第一次出现时发送
+'T' + 发送时间、记录数量 + 若干条(本地编号, Tick记录)
+空消息：通知记录进程退出
+记录进程每秒通过同一个管道（pickle）返回统计数据和日志。
+'''
+
+from __future__ import division
+
+import struct
+from multiprocessing import Process, Pipe
+from threading import Thread
+from Queue import Queue, Full
+from time import time as getTime
+
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+
+from vtFunction import loadMongoSetting
+from vtDbWriter import DbWriter
+from drBase import *
+from drJournal import RECORD_STRUCT, packTick, unpackTick
+from drBarGenerator import BarGenerator
+from language import text
+
+
+# 消息格式
+MSG_SYMBOL = 'S'
+MSG_TICK = 'T'
+SYMBOL_STRUCT = struct.Struct('<H32s32s16s')        # 本地编号、vtSymbol、代码、交易所
+TICK_HEADER_STRUCT = struct.Struct('<dI')           # 发送时间、记录数量
+INDEX_STRUCT = struct.Struct('<H')                  # 每条记录前的本地编号
+ITEM_SIZE = INDEX_STRUCT.size + RECORD_STRUCT.size
+
+# 默认参数
+DEFAULT_BATCH_SIZE = 100        # 每个分片缓存的Tick数量达到该值时立即发送
+DEFAULT_QUEUE_SIZE = 1000       # 每个分片发送队列中最多的消息数量
+STOP_TIMEOUT = 10               # 停止时等待发送和记录进程退出的时间（秒）
+STATS_INTERVAL = 1.0            # 记录进程返回统计数据的间隔（秒）
+
+
+########################################################################
+class WorkerTickData(DrTickData):
+    """记录进程中使用的Tick数据，增加纳秒时间戳用于K线合成（不写入数据库）"""
+    __slots__ = ('epochNs',)
+
+
+#----------------------------------------------------------------------
+def runWorker(conn, shardIndex, tickSymbols, barIntervalDict, activeSymbolDict, minuteDeltaVolume):
+    """记录进程的入口函数"""
+    worker = RecorderWorker(conn, shardIndex, tickSymbols, barIntervalDict, activeSymbolDict,
+                            minuteDeltaVolume)
+    worker.run()
+
+
+########################################################################
+class RecorderWorker(object):
+    """
+    记录进程，在子进程中运行
+
+    为了复用DbWriter，本对象提供了DbWriter需要的dbClient和writeLog
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, conn, shardIndex, tickSymbols, barIntervalDict, activeSymbolDict,
+                 minuteDeltaVolume=False):
+        """Constructor"""
+        self.conn = conn
+        self.shardIndex = shardIndex
+        self.tickSet = set(tickSymbols)             # 需要记录Tick的合约
+        self.activeSymbolDict = activeSymbolDict    # 主力合约代码映射
+
+        self.symbolDict = {}        # 合约定义，key为本地编号，value为(vtSymbol, 代码, 交易所)
+        self.barDict = {}           # K线合成器，key为vtSymbol
+        for vtSymbol, intervals in barIntervalDict.items():
+            self.barDict[vtSymbol] = BarGenerator(intervals, self.onBar,
+                                                  minuteDeltaVolume=minuteDeltaVolume)
+
+        self.dbClient = None
+        self.dbWriter = None
+
+        # 统计数据，每次返回后清零的为周期数据
+        self.receivedCount = 0      # 收到的Tick数量
+        self.barCount = 0           # 写入的K线数量
+        self.batchCount = 0         # 本周期收到的消息数量
+        self.totalLag = 0           # 本周期消息从发送到收到的累计时间
+        self.maxLag = 0             # 本周期消息从发送到收到的最长时间
+        self.lastTime = ''          # 最新的Tick时间
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """运行"""
+        # 数据库连接必须在子进程中创建
+        host, port, logging = loadMongoSetting()
+        try:
+            self.dbClient = MongoClient(host, port, connectTimeoutMS=500, serverSelectionTimeoutMS=500)
+            self.dbClient.server_info()
+        except ConnectionFailure:
+            self.dbClient = None
+            self.writeLog(text.WORKER_DATABASE_FAILED.format(shard=self.shardIndex))
+
+        self.dbWriter = DbWriter(self)
+        self.dbWriter.start()
+
+        conn = self.conn
+        nextStats = getTime() + STATS_INTERVAL
+
+        while True:
+            if conn.poll(STATS_INTERVAL):
+                try:
+                    data = conn.recv_bytes()
+                except EOFError:
+                    break       # 主进程已经退出
+
+                if not data:
+                    break
+                self.processMessage(data)
+
+            now = getTime()
+            if now >= nextStats:
+                # 到达交易日结束时间后推送所有尚未完成的K线
+                nowNs = int(now) * 1000000000
+                for generator in self.barDict.values():
+                    generator.closeSession(nowNs)
+
+                self.sendStats()
+                nextStats = now + STATS_INTERVAL
+
+        # 退出前推送所有尚未完成的K线
+        for generator in self.barDict.values():
+            generator.flush()
+
+        self.dbWriter.stop()
+        self.sendStats()
+
+    #----------------------------------------------------------------------
+    def processMessage(self, data):
+        """处理主进程发送的消息"""
+        msgType = data[0]
+
+        if msgType == MSG_SYMBOL:
+            index, vtSymbol, symbol, exchange = SYMBOL_STRUCT.unpack_from(data, 1)
+            self.symbolDict[index] = (vtSymbol.rstrip('\0'), symbol.rstrip('\0'),
+                                      exchange.rstrip('\0'))
+
+        elif msgType == MSG_TICK:
+            sentTime, count = TICK_HEADER_STRUCT.unpack_from(data, 1)
+
+            lag = getTime() - sentTime
+            self.batchCount += 1
+            self.totalLag += lag
+            if lag > self.maxLag:
+                self.maxLag = lag
+
+            offset = 1 + TICK_HEADER_STRUCT.size
+            unpackIndex = INDEX_STRUCT.unpack_from
+            unpackRecord = RECORD_STRUCT.unpack_from
+
+            for i in xrange(count):
+                index = unpackIndex(data, offset)[0]
+                record = unpackRecord(data, offset + INDEX_STRUCT.size)
+                offset += ITEM_SIZE
+
+                vtSymbol, symbol, exchange = self.symbolDict[index]
+                tick = unpackTick(record, vtSymbol, symbol, exchange, WorkerTickData)
+                tick.epochNs = record[0]
+                self.processTick(tick)
+
+            self.receivedCount += count
+
+    #----------------------------------------------------------------------
+    def processTick(self, tick):
+        """处理Tick，和行情记录引擎相同：写入Tick并更新K线"""
+        vtSymbol = tick.vtSymbol
+
+        if vtSymbol in self.tickSet:
+            self.dbWriter.insert(TICK_DB_NAME, vtSymbol, tick.toDict(DR_TICK_FIELDS))
+
+            if vtSymbol in self.activeSymbolDict:
+                activeSymbol = self.activeSymbolDict[vtSymbol]
+                self.dbWriter.insert(TICK_DB_NAME, activeSymbol, tick.toDict(DR_TICK_FIELDS))
+
+        if vtSymbol in self.barDict:
+            self.barDict[vtSymbol].updateTick(tick)
+
+        self.lastTime = tick.time
+
+    #----------------------------------------------------------------------
+    def onBar(self, interval, bar):
+        """K线合成完成，插入对应周期的数据库"""
+        dbName = getBarDbName(interval)
+        self.dbWriter.insert(dbName, bar.vtSymbol, bar.toDict())
+
+        if bar.vtSymbol in self.activeSymbolDict:
+            activeSymbol = self.activeSymbolDict[bar.vtSymbol]
+            self.dbWriter.insert(dbName, activeSymbol, bar.toDict())
+
+        self.barCount += 1
+
+    #----------------------------------------------------------------------
+    def sendStats(self):
+        """返回统计数据"""
+        if self.batchCount:
+            avgLag = self.totalLag / self.batchCount
+        else:
+            avgLag = 0
+
+        dbStats = self.dbWriter.getStats()
+        stats = {
+            'received': self.receivedCount,
+            'bar': self.barCount,
+            'avgLag': avgLag,
+            'maxLag': self.maxLag,
+            'time': self.lastTime,
+            'dbDepth': dbStats['depth'],
+            'dbError': dbStats['errorCount']
+        }
+
+        self.batchCount = 0
+        self.totalLag = 0
+        self.maxLag = 0
+
+        try:
+            self.conn.send(('stats', stats))
+        except IOError:
+            pass        # 主进程已经退出
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content, persistent=True):
+        """发送日志到主进程（作为行情记录日志显示，不会写入数据库日志）"""
+        try:
+            self.conn.send(('log', content))
+        except IOError:
+            pass
+
+
+########################################################################
+class ShardedRecorder(object):
+    """
+    多进程分片的行情记录，在主进程中运行
+
+    put在事件引擎线程中调用，只做打包和缓存；
+    processTimer需要每秒调用一次，负责发送缓存的数据、接收统计数据和检查记录进程的状态。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, workerCount, tickSymbols, barIntervalDict, activeSymbolDict,
+                 logFunc=None, batchSize=DEFAULT_BATCH_SIZE, queueSize=DEFAULT_QUEUE_SIZE,
+                 minuteDeltaVolume=False):
+        """
+        workerCount：记录进程的数量
+        tickSymbols：需要记录Tick的vtSymbol列表
+        barIntervalDict：需要合成K线的合约，key为vtSymbol，value为周期列表
+        activeSymbolDict：主力合约代码映射，key为vtSymbol，value为主力合约代码
+        logFunc：输出日志的函数
+        batchSize：每个分片缓存的Tick数量达到该值时立即发送
+        queueSize：每个分片发送队列中最多的消息数量，超过时丢弃Tick
+        minuteDeltaVolume：1分钟线是否使用K线内的成交量
+        """
+        self.workerCount = workerCount
+        self.logFunc = logFunc
+        self.batchSize = batchSize
+        self.queueSize = queueSize
+
+        # 合约按顺序轮流分配到各个分片
+        symbols = sorted(set(tickSymbols) | set(barIntervalDict.keys()))
+        self.routeDict = {}         # key为vtSymbol，value为(分片编号, 本地编号)
+        self.workerArgs = []        # 每个分片的记录进程参数
+        self.symbolCountList = []   # 每个分片的合约数量
+
+        for shard in range(workerCount):
+            shardSymbols = symbols[shard::workerCount]
+            self.symbolCountList.append(len(shardSymbols))
+            for index, vtSymbol in enumerate(shardSymbols):
+                self.routeDict[vtSymbol] = (shard, index)
+
+            self.workerArgs.append((shard,
+                                    [s for s in shardSymbols if s in tickSymbols],
+                                    dict([(s, barIntervalDict[s]) for s in shardSymbols
+                                          if s in barIntervalDict]),
+                                    dict([(s, activeSymbolDict[s]) for s in shardSymbols
+                                          if s in activeSymbolDict]),
+                                    minuteDeltaVolume))
+
+        self.connList = [None] * workerCount        # 主进程一端的管道
+        self.processList = [None] * workerCount     # 记录进程
+        self.queueList = [None] * workerCount       # 发送队列，元素为(消息, Tick数量)
+        self.threadList = [None] * workerCount      # 发送线程
+        self.downList = [False] * workerCount       # 管道是否已经断开（等待定时处理时重启）
+        self.bufferList = [[] for i in range(workerCount)]     # 缓存的Tick记录
+        self.definedSet = set()                     # 已经发送过定义的合约
+
+        # 统计数据
+        self.sentList = [0] * workerCount           # 发送的Tick数量
+        self.droppedList = [0] * workerCount        # 丢弃的Tick数量
+        self.statsList = [{} for i in range(workerCount)]      # 记录进程返回的统计数据
+        self.heartbeatList = [0] * workerCount      # 最近一次收到统计数据的时间
+        self.restartList = [0] * workerCount        # 记录进程重启次数
+
+    #----------------------------------------------------------------------
+    def startWorker(self, shard):
+        """启动单个记录进程"""
+        parentConn, childConn = Pipe()
+        process = Process(target=runWorker, args=(childConn,) + self.workerArgs[shard])
+        process.daemon = True
+        process.start()
+        childConn.close()
+
+        # 每个记录进程使用新的发送队列和发送线程
+        queue = Queue(self.queueSize)
+        thread = Thread(target=self.runSender, args=(shard, parentConn, queue))
+        thread.setDaemon(True)
+        thread.start()
+
+        self.connList[shard] = parentConn
+        self.processList[shard] = process
+        self.queueList[shard] = queue
+        self.threadList[shard] = thread
+        self.downList[shard] = False
+        self.heartbeatList[shard] = getTime()
+
+        # 新的记录进程需要重新发送合约定义，之前缓存在管道中的数据已经丢失
+        self.definedSet = set([vtSymbol for vtSymbol in self.definedSet
+                               if self.routeDict[vtSymbol][0] != shard])
+        self.bufferList[shard] = []
+        self.sentList[shard] = 0
+        self.statsList[shard] = {}
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动所有记录进程"""
+        for shard in range(self.workerCount):
+            self.startWorker(shard)
+
+    #----------------------------------------------------------------------
+    def stopWorker(self, shard):
+        """停止单个记录进程：通知发送线程发送退出消息，等待记录进程退出"""
+        process = self.processList[shard]
+        queue = self.queueList[shard]
+
+        # 停止时可以等待发送队列，等待超时则放弃
+        try:
+            queue.put(('', 0), timeout=STOP_TIMEOUT)
+            queue.put((None, 0), timeout=STOP_TIMEOUT)
+        except Full:
+            pass
+
+        process.join(STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+        self.threadList[shard].join(STOP_TIMEOUT)
+        self.receive(shard)
+        self.connList[shard].close()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """通知所有记录进程写入剩余的数据后退出"""
+        for shard in range(self.workerCount):
+            if not self.processList[shard]:
+                continue
+
+            self.send(shard)
+            self.stopWorker(shard)
+            self.processList[shard] = None
+
+    #----------------------------------------------------------------------
+    def put(self, tick):
+        """缓存Tick，需要tick.epochNs已经赋值"""
+        vtSymbol = tick.vtSymbol
+        shard, index = self.routeDict[vtSymbol]
+
+        # 管道已经断开，等待定时处理时重启记录进程
+        if self.downList[shard]:
+            self.droppedList[shard] += 1
+            return
+
+        # 合约第一次出现时发送定义，发送失败时丢弃Tick，下一个Tick再次发送定义
+        if vtSymbol not in self.definedSet:
+            msg = MSG_SYMBOL + SYMBOL_STRUCT.pack(index, str(vtSymbol), str(tick.symbol),
+                                                  str(tick.exchange))
+            if not self.enqueue(shard, msg, 0):
+                self.droppedList[shard] += 1
+                return
+            self.definedSet.add(vtSymbol)
+
+        buf = self.bufferList[shard]
+        buf.append(INDEX_STRUCT.pack(index) + packTick(tick))
+
+        if len(buf) >= self.batchSize:
+            self.send(shard)
+
+    #----------------------------------------------------------------------
+    def send(self, shard):
+        """把分片缓存的Tick放入发送队列，队列已满时丢弃"""
+        buf = self.bufferList[shard]
+        if not buf:
+            return
+
+        header = MSG_TICK + TICK_HEADER_STRUCT.pack(getTime(), len(buf))
+        if not self.enqueue(shard, header + ''.join(buf), len(buf)):
+            self.droppedList[shard] += len(buf)
+        del buf[:]
+
+    #----------------------------------------------------------------------
+    def enqueue(self, shard, msg, count):
+        """把消息放入发送队列（不阻塞），返回是否成功"""
+        if self.downList[shard]:
+            return False
+
+        try:
+            self.queueList[shard].put_nowait((msg, count))
+            return True
+        except Full:
+            return False
+
+    #----------------------------------------------------------------------
+    def runSender(self, shard, conn, queue):
+        """发送线程：把发送队列中的消息写入管道，管道断开时标记分片并退出"""
+        while True:
+            msg, count = queue.get()
+            if msg is None:
+                break
+
+            try:
+                conn.send_bytes(msg)
+            except (IOError, OSError):
+                # 记录进程已经退出，由定时处理重启
+                if conn is self.connList[shard]:
+                    self.downList[shard] = True
+                break
+
+            self.sentList[shard] += count
+
+    #----------------------------------------------------------------------
+    def receive(self, shard):
+        """接收记录进程返回的统计数据和日志"""
+        conn = self.connList[shard]
+
+        try:
+            while conn.poll():
+                msgType, content = conn.recv()
+
+                if msgType == 'stats':
+                    self.statsList[shard] = content
+                    self.heartbeatList[shard] = getTime()
+                elif msgType == 'log':
+                    self.writeLog(content)
+        except (EOFError, IOError):
+            pass
+
+    #----------------------------------------------------------------------
+    def processTimer(self):
+        """定时处理：发送缓存的数据，接收统计数据，重启已经退出的记录进程"""
+        for shard in range(self.workerCount):
+            process = self.processList[shard]
+
+            # 记录进程已经退出，或者管道已经断开
+            if not process.is_alive() or self.downList[shard]:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+                self.writeLog(text.WORKER_RESTARTED.format(shard=shard, code=process.exitcode))
+                self.restartList[shard] += 1
+
+                # 通知旧的发送线程退出（管道断开后发送线程已经退出时不会阻塞）
+                try:
+                    self.queueList[shard].put_nowait((None, 0))
+                except Full:
+                    pass
+                self.threadList[shard].join(1)
+                self.connList[shard].close()
+
+                self.startWorker(shard)
+                continue
+
+            self.send(shard)
+            self.receive(shard)
+
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取每个分片的统计数据，返回列表，每个分片一个字典：
+        alive：记录进程是否运行，restart：重启次数，symbols：合约数量，
+        sent/received：发送/已处理的Tick数量，backlog：管道中尚未处理的Tick数量，
+        pending：主进程中缓存尚未发送的Tick数量，queue：发送队列中的消息数量，
+        dropped：发送队列已满或者记录进程退出时丢弃的Tick数量，
+        avgLag/maxLag：最近一个统计周期内消息从发送到收到的平均/最长时间（秒），
+        heartbeat：距离最近一次收到统计数据的时间（秒），
+        bar：写入的K线数量，time：最新的Tick时间，dbDepth：等待写入数据库的数据数量
+        """
+        now = getTime()
+
+        l = []
+        for shard in range(self.workerCount):
+            process = self.processList[shard]
+            stats = self.statsList[shard]
+            received = stats.get('received', 0)
+
+            l.append({
+                'alive': bool(process and process.is_alive()),
+                'restart': self.restartList[shard],
+                'symbols': self.symbolCountList[shard],
+                'sent': self.sentList[shard],
+                'received': received,
+                'backlog': max(self.sentList[shard] - received, 0),
+                'pending': len(self.bufferList[shard]),
+                'queue': self.queueList[shard].qsize() if self.queueList[shard] else 0,
+                'dropped': self.droppedList[shard],
+                'avgLag': stats.get('avgLag', 0),
+                'maxLag': stats.get('maxLag', 0),
+                'heartbeat': now - self.heartbeatList[shard],
+                'bar': stats.get('bar', 0),
+                'time': stats.get('time', ''),
+                'dbDepth': stats.get('dbDepth', 0)
+            })
+
+        return l
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content):
+        """输出日志"""
+        if self.logFunc:
+            self.logFunc(content)
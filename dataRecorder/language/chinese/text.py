@@ -13,4 +13,14 @@ DOMINANT_CONTRACT = u'主力合约'
 DOMINANT_SYMBOL = u'主力代码'
 
 TICK_LOGGING_MESSAGE = u'记录Tick数据{symbol}，时间:{time}, last:{last}, bid:{bid}, ask:{ask}'
-BAR_LOGGING_MESSAGE = u'记录分钟线数据{symbol}，时间:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
\ No newline at end of file
+BAR_LOGGING_MESSAGE = u'记录分钟线数据{symbol}，时间:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
+STATS_LOGGING_MESSAGE = u'行情记录统计{symbol}：Tick {rate:.1f}个/秒，累计K线{bar}根，最新Tick时间:{time}，待写入数据{queue}条'
+SHARD_STATS_MESSAGE = u'记录进程{shard}：运行{alive}，重启{restart}次，合约{symbols}个，发送{sent}，已处理{received}，积压{backlog}，丢弃{dropped}，延时{avgLag:.4f}/{maxLag:.4f}秒，心跳{heartbeat:.1f}秒前，待写入数据{dbDepth}条'
+
+JOURNAL_LOAD_COMPLETED = u'Tick日志导入数据库完成：{file}，数据量{count}'
+JOURNAL_LOAD_FAILED = u'Tick日志导入数据库失败：{file}，{error}'
+
+WORKER_DATABASE_FAILED = u'记录进程{shard}：MongoDB连接失败'
+WORKER_RESTARTED = u'记录进程{shard}已退出（退出码{code}），重新启动'
+
+JOURNAL_DATABASE_UNAVAILABLE = u'数据库未连接'
@@ -12,4 +12,14 @@ DOMINANT_CONTRACT = u'Dominant Contract'
 DOMINANT_SYMBOL = u'Dominant Symbol'
 
 TICK_LOGGING_MESSAGE = u'Record Tick Data {symbol}, Time:{time}, last:{last}, bid:{bid}, ask:{ask}'
-BAR_LOGGING_MESSAGE = u'Record Bar Data {symbol}, Time:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
\ No newline at end of file
+BAR_LOGGING_MESSAGE = u'Record Bar Data {symbol}, Time:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
+STATS_LOGGING_MESSAGE = u'Recording stats {symbol}: Tick {rate:.1f}/s, bars written:{bar}, last tick time:{time}, queue:{queue}'
+SHARD_STATS_MESSAGE = u'Recorder worker {shard}: alive {alive}, restarts {restart}, symbols {symbols}, sent {sent}, received {received}, backlog {backlog}, dropped {dropped}, lag {avgLag:.4f}/{maxLag:.4f}s, heartbeat {heartbeat:.1f}s ago, db queue {dbDepth}'
+
+JOURNAL_LOAD_COMPLETED = u'Tick journal loaded into database: {file}, count: {count}'
+JOURNAL_LOAD_FAILED = u'Tick journal loading failed: {file}, {error}'
+
+WORKER_DATABASE_FAILED = u'Recorder worker {shard}: failed to connect to MongoDB'
+WORKER_RESTARTED = u'Recorder worker {shard} exited (code {code}), restarting'
+
+JOURNAL_DATABASE_UNAVAILABLE = u'Database not connected'
\ No newline at end of file
@@ -0,0 +1,85 @@
+# encoding: UTF-8
+
+'''
+Tick二进制日志的测试，在dataRecorder目录下运行：python testDrJournal.py
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vtGateway import VtTickData
+from drJournal import JournalFile, readJournal, HEADER_STRUCT, RECORD_STRUCT
+
+
+#----------------------------------------------------------------------
+def makeTick(price):
+    """生成测试用的Tick"""
+    tick = VtTickData()
+    tick.vtSymbol = tick.symbol = 'IF1706'
+    tick.exchange = 'CFFEX'
+    tick.epochNs = int(price * 1000000000)
+    tick.lastPrice = price
+    return tick
+
+
+########################################################################
+class JournalFileTest(unittest.TestCase):
+    """日志文件的测试"""
+
+    #----------------------------------------------------------------------
+    def setUp(self):
+        """创建临时目录"""
+        self.path = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.path, 'IF1706.tick')
+
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        """删除临时目录"""
+        shutil.rmtree(self.path)
+
+    #----------------------------------------------------------------------
+    def readPrices(self):
+        """读取日志文件中所有Tick的价格"""
+        return [tick.lastPrice for l in readJournal(self.fileName) for tick in l]
+
+    #----------------------------------------------------------------------
+    def testReopenAfterPartialRecord(self):
+        """崩溃时写入了不完整的记录，重新打开后追加的记录不会错位"""
+        journal = JournalFile(self.fileName, makeTick(1.0))
+        journal.write(makeTick(1.0))
+        journal.write(makeTick(2.0))
+        journal.close()
+
+        # 模拟写入第3条记录的过程中进程崩溃
+        with open(self.fileName, 'ab') as f:
+            f.write(RECORD_STRUCT.pack(*([3] * 26))[:RECORD_STRUCT.size // 2])
+
+        journal = JournalFile(self.fileName, makeTick(4.0))
+        journal.write(makeTick(4.0))
+        journal.write(makeTick(5.0))
+        journal.close()
+
+        self.assertEqual(self.readPrices(), [1.0, 2.0, 4.0, 5.0])
+        self.assertEqual(os.path.getsize(self.fileName), HEADER_STRUCT.size + 4 * RECORD_STRUCT.size)
+
+    #----------------------------------------------------------------------
+    def testReopenAfterPartialHeader(self):
+        """崩溃时文件头不完整，重新打开后重写文件头"""
+        with open(self.fileName, 'wb') as f:
+            f.write('VT')
+
+        journal = JournalFile(self.fileName, makeTick(1.0))
+        journal.write(makeTick(1.0))
+        journal.close()
+
+        self.assertEqual(self.readPrices(), [1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# encoding: UTF-8
+
+'''
+本文件中包含了事件驱动引擎的吞吐量测试，直接运行本文件即可进行测试。
+
+测试方法：模拟多个合约的行情事件，处理函数中用sleep模拟数据库写入等
+会释放GIL的耗时操作，统计全部事件处理完成所需的时间。
+'''
+
+from __future__ import division
+
+import time
+import threading
+
+from eventEngine import *
+from vtGateway import VtTickData
+
+
+########################################################################
+class BenchmarkHandler(object):
+    """测试用的事件处理函数，统计处理数量并检查单个合约的事件顺序"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, total, delay):
+        """Constructor"""
+        self.total = total          # 需要处理的事件总数
+        self.delay = delay          # 每个事件模拟的耗时（秒）
+        
+        self.count = 0
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        
+        self.lastDict = {}          # 每个合约最近处理的序号
+        self.disorder = 0           # 顺序错误的事件数量
+
+    #----------------------------------------------------------------------
+    def onTick(self, event):
+        """处理行情事件"""
+        tick = event.dict_['data']
+        
+        if self.delay:
+            time.sleep(self.delay)
+        
+        with self.lock:
+            if tick.volume <= self.lastDict.get(tick.vtSymbol, -1):
+                self.disorder += 1
+            self.lastDict[tick.vtSymbol] = tick.volume
+            
+            self.count += 1
+            if self.count >= self.total:
+                self.finished.set()
+
+
+#----------------------------------------------------------------------
+def createEvents(symbolCount, tickCount):
+    """生成测试用的行情事件，按时间顺序轮流生成每个合约的行情"""
+    symbols = ['symbol%s' %i for i in range(symbolCount)]
+    
+    l = []
+    for i in range(tickCount):
+        for symbol in symbols:
+            tick = VtTickData()
+            tick.symbol = symbol
+            tick.vtSymbol = symbol
+            tick.volume = i             # 用成交量字段保存序号
+            
+            event = Event(type_=EVENT_TICK)
+            event.dict_['data'] = tick
+            l.append(event)
+    return l
+
+
+#----------------------------------------------------------------------
+def runBenchmark(name, engine, events, delay):
+    """测试单个引擎的吞吐量"""
+    handler = BenchmarkHandler(len(events), delay)
+    engine.register(EVENT_TICK, handler.onTick)
+    engine.start(timer=False)
+    
+    start = time.time()
+    for event in events:
+        engine.put(event)
+    handler.finished.wait()
+    cost = time.time() - start
+    
+    engine.stop()
+    
+    print u'%s：耗时%.3f秒，每秒%.0f个事件，顺序错误%s个' %(name, cost, len(events)/cost, 
+                                                       handler.disorder)
+
+
+#----------------------------------------------------------------------
+def benchmarkSharding(symbolCount=300, tickCount=10, delay=0.0005):
+    """比较单线程引擎和分片引擎的吞吐量"""
+    events = createEvents(symbolCount, tickCount)
+    print u'合约数量%s，事件数量%s，单个事件耗时%s秒' %(symbolCount, len(events), delay)
+    
+    runBenchmark(u'EventEngine2', EventEngine2(), events, delay)
+    
+    for shardCount in [1, 2, 4, 8, 16]:
+        runBenchmark(u'ShardedEventEngine(%s)' %shardCount, 
+                     ShardedEventEngine(shardCount), events, delay)
+    
+
+########################################################################
+class CountHandler(object):
+    """测试用的计数处理函数，处理完指定数量的事件后发出通知"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, total):
+        """Constructor"""
+        self.total = total
+        self.count = 0
+        self.finished = threading.Event()
+
+    #----------------------------------------------------------------------
+    def onEvent(self, event):
+        """处理事件"""
+        self.count += 1
+        if self.count >= self.total:
+            self.finished.set()
+
+
+#----------------------------------------------------------------------
+def runDispatch(name, engine, eventCount, handlerCount):
+    """测试单个引擎在指定处理函数数量下每秒处理的事件数量"""
+    counter = CountHandler(eventCount)
+    
+    # 每个处理函数需要是不同的对象才能重复注册
+    for i in range(handlerCount-1):
+        engine.register(EVENT_TICK, lambda event: None)
+    engine.register(EVENT_TICK, counter.onEvent)
+    engine.start(timer=False)
+    
+    event = Event(type_=EVENT_TICK)
+    
+    start = time.time()
+    for i in xrange(eventCount):
+        engine.put(event)
+    counter.finished.wait()
+    cost = time.time() - start
+    
+    engine.stop()
+    
+    print u'%s，处理函数%s个：耗时%.3f秒，每秒%.0f个事件' %(name, handlerCount, cost, 
+                                                      eventCount/cost)
+
+
+#----------------------------------------------------------------------
+def benchmarkDispatch(eventCount=100000):
+    """比较逐个处理和批量处理两种模式的事件分发速度"""
+    for handlerCount in [1, 10, 100]:
+        # 处理函数较多时减少事件数量，控制测试时间
+        count = eventCount // handlerCount * 10 if handlerCount > 10 else eventCount
+        
+        runDispatch(u'EventEngine2', EventEngine2(), count, handlerCount)
+        runDispatch(u'EventEngine2批量模式', EventEngine2(batchMode=True), count, handlerCount)
+    
+
+if __name__ == '__main__':
+    benchmarkSharding(delay=0)
+    benchmarkSharding()
+    benchmarkDispatch()
@@ -1,10 +1,15 @@
 # encoding: UTF-8
 
 # 系统模块
-from Queue import Queue, Empty
-from threading import Thread
+from __future__ import division
+
+import traceback
+from Queue import Empty
+from threading import Thread, Condition, Lock
 from time import sleep
-from collections import defaultdict
+from timeit import default_timer    # Windows下精度高于time.time
+from collections import defaultdict, deque, OrderedDict
+from bisect import bisect_right
 
 # 第三方模块
 from PyQt4.QtCore import QTimer
@@ -13,228 +18,607 @@ from PyQt4.QtCore import QTimer
 from eventType import *
 
 
+# 事件优先级，数值越小越先处理
+PRIORITY_HIGH = 0           # 交易相关事件：委托、成交、持仓、资金、错误
+PRIORITY_NORMAL = 1         # 行情、计时器等普通事件
+PRIORITY_LOW = 2            # 日志事件
+
+LANE_NAMES = ['high', 'normal', 'low']
+
+# 批量模式下每次最多取出的事件数量
+BATCH_MAX_SIZE = 1000
+
+# 默认的事件优先级，没有列出的事件类型为PRIORITY_NORMAL
+# 带有后缀的事件类型（如EVENT_TICK + vtSymbol）使用前缀对应的优先级
+EVENT_PRIORITY = {
+    EVENT_ORDER: PRIORITY_HIGH,
+    EVENT_TRADE: PRIORITY_HIGH,
+    EVENT_POSITION: PRIORITY_HIGH,
+    EVENT_ACCOUNT: PRIORITY_HIGH,
+    EVENT_ERROR: PRIORITY_HIGH,
+    EVENT_LOG: PRIORITY_LOW,
+    EVENT_CTA_LOG: PRIORITY_LOW,
+    EVENT_DATARECORDER_LOG: PRIORITY_LOW
+}
+
+
 ########################################################################
-class EventEngine(object):
+class LaneQueue(object):
     """
-    事件驱动引擎
-    事件驱动引擎中所有的变量都设置为了私有，这是为了防止不小心
-    从外部修改了这些变量的值或状态，导致bug。
-    
-    变量说明
-    __queue：私有变量，事件队列
-    __active：私有变量，事件引擎开关
-    __thread：私有变量，事件处理线程
-    __timer：私有变量，计时器
-    __handlers：私有变量，事件处理函数字典
-    
-    
-    方法说明
-    __run: 私有方法，事件处理线程连续运行用
-    __process: 私有方法，处理事件，调用注册在引擎中的监听函数
-    __onTimer：私有方法，计时器固定事件间隔触发后，向事件队列中存入计时器事件
-    start: 公共方法，启动引擎
-    stop：公共方法，停止引擎
-    register：公共方法，向引擎中注册监听函数
-    unregister：公共方法，向引擎中注销监听函数
-    put：公共方法，向事件队列中存入新的事件
+    按优先级分道的事件队列
     
-    事件监听函数必须定义为输入参数仅为一个event对象，即：
-    
-    函数
-    def func(event)
-        ...
+    每个优先级对应一条FIFO通道，取出事件时总是先取优先级高的通道，
+    同一通道内保持存入的顺序，因此委托、成交回报不会排在大量行情和日志之后。
+    接口和Queue.Queue相同（put、get、qsize），同时统计每条通道的
+    队列深度和事件从存入到取出的等待时间。
     
-    对象方法
-    def method(self, event)
-        ...
-        
+    注意：优先级高的事件会越过之前存入的低优先级事件，
+    不同优先级的事件之间不再保证先后顺序。
     """
 
     #----------------------------------------------------------------------
     def __init__(self):
-        """初始化事件引擎"""
-        # 事件队列
-        self.__queue = Queue()
+        """Constructor"""
+        self.__lanes = [deque() for name in LANE_NAMES]
+        self.__condition = Condition(Lock())
         
-        # 事件引擎开关
-        self.__active = False
+        # 事件类型对应的优先级，__priorityCache缓存带后缀事件类型的查询结果
+        self.__priorityDict = dict(EVENT_PRIORITY)
+        self.__priorityCache = {}
         
-        # 事件处理线程
-        self.__thread = Thread(target = self.__run)
+        # 统计数据
+        self.__countList = [0] * len(LANE_NAMES)        # 已取出的事件数量
+        self.__waitList = [0.0] * len(LANE_NAMES)       # 累计等待时间
+        self.__maxWaitList = [0.0] * len(LANE_NAMES)    # 最长等待时间
         
-        # 计时器，用于触发计时器事件
-        self.__timer = QTimer()
-        self.__timer.timeout.connect(self.__onTimer)
+        # 性能统计对象，不为None时按事件类型记录等待时间
+        self.__profiler = None
         
-        # 这里的__handlers是一个字典，用来保存对应的事件调用关系
-        # 其中每个键对应的值是一个列表，列表中保存了对该事件进行监听的函数功能
-        self.__handlers = defaultdict(list)
+    #----------------------------------------------------------------------
+    def setProfiler(self, profiler):
+        """设置性能统计对象，None表示关闭"""
+        self.__profiler = profiler
         
-        # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
-        self.__generalHandlers = []
+    #----------------------------------------------------------------------
+    def setPriority(self, type_, priority):
+        """设置事件类型的优先级"""
+        self.__priorityDict[type_] = priority
+        self.__priorityCache = {}
         
     #----------------------------------------------------------------------
-    def __run(self):
-        """引擎运行"""
-        while self.__active == True:
-            try:
-                event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
-                self.__process(event)
-            except Empty:
-                pass
+    def getPriority(self, type_):
+        """获取事件类型的优先级"""
+        try:
+            return self.__priorityCache[type_]
+        except KeyError:
+            pass
+        
+        priority = self.__priorityDict.get(type_)
+        if priority is None:
+            # 尝试使用前缀（到第一个.为止）查找，如eTick.IF1705查找eTick.
+            n = type_.find('.')
+            if n >= 0:
+                priority = self.__priorityDict.get(type_[:n+1])
+        if priority is None:
+            priority = PRIORITY_NORMAL
             
+        self.__priorityCache[type_] = priority
+        return priority
+        
     #----------------------------------------------------------------------
-    def __process(self, event):
-        """处理事件"""
-        # 检查是否存在对该事件进行监听的处理函数
-        if event.type_ in self.__handlers:
-            # 若存在，则按顺序将事件传递给处理函数执行
-            [handler(event) for handler in self.__handlers[event.type_]]
+    def put(self, event):
+        """存入事件"""
+        lane = self.__lanes[self.getPriority(event.type_)]
+        
+        with self.__condition:
+            lane.append((default_timer(), event))
+            self.__condition.notify()
             
-            # 以上语句为Python列表解析方式的写法，对应的常规循环写法为：
-            #for handler in self.__handlers[event.type_]:
-                #handler(event) 
+    #----------------------------------------------------------------------
+    def __wait(self, block, timeout):
+        """等待队列中有事件，需要在持有锁时调用，超时则抛出Queue.Empty"""
+        if self.qsize():
+            return
+        
+        if not block:
+            raise Empty
+        
+        if timeout is None:
+            while not self.qsize():
+                self.__condition.wait()
+        else:
+            endTime = default_timer() + timeout
+            while not self.qsize():
+                remaining = endTime - default_timer()
+                if remaining <= 0:
+                    raise Empty
+                self.__condition.wait(remaining)
         
-        # 调用通用处理函数进行处理
-        if self.__generalHandlers:
-            [handler(event) for handler in self.__generalHandlers]
-               
     #----------------------------------------------------------------------
-    def __onTimer(self):
-        """向事件队列中存入计时器事件"""
-        # 创建计时器事件
-        event = Event(type_=EVENT_TIMER)
+    def get(self, block=True, timeout=None):
+        """取出优先级最高的事件，没有事件时抛出Queue.Empty"""
+        with self.__condition:
+            self.__wait(block, timeout)
+                        
+            for priority, lane in enumerate(self.__lanes):
+                if lane:
+                    putTime, event = lane.popleft()
+                    wait = default_timer() - putTime
+                    self.__record(priority, wait)
+                    
+                    if self.__profiler:
+                        self.__profiler.recordWait(event.type_, wait)
+                    return event
+                
+    #----------------------------------------------------------------------
+    def getAll(self, block=True, timeout=None, maxCount=BATCH_MAX_SIZE):
+        """
+        一次取出队列中的事件（最多maxCount个），按优先级从高到低排列（同一优先级内保持先后顺序），
+        只需要获取一次锁，没有事件时抛出Queue.Empty
         
-        # 向队列中存入计时器事件
-        self.put(event)    
+        注意：处理这批事件期间新到达的高优先级事件需要通过getHighPriority及时取出，
+        否则会排在这批事件之后
+        """
+        with self.__condition:
+            self.__wait(block, timeout)
+            
+            events = []
+            for priority in range(len(self.__lanes)):
+                remaining = maxCount - len(events)
+                if remaining <= 0:
+                    break
+                self.__take(priority, remaining, events)
+                
+            return events
+        
+    #----------------------------------------------------------------------
+    def hasHighPriority(self):
+        """是否有等待处理的高优先级事件（不加锁，供批量处理时在事件之间快速检查）"""
+        return bool(self.__lanes[PRIORITY_HIGH])
+    
+    #----------------------------------------------------------------------
+    def getHighPriority(self):
+        """取出所有高优先级事件，返回列表"""
+        events = []
+        with self.__condition:
+            self.__take(PRIORITY_HIGH, len(self.__lanes[PRIORITY_HIGH]), events)
+        return events
+        
+    #----------------------------------------------------------------------
+    def __take(self, priority, count, events):
+        """从某条通道中取出最多count个事件添加到events中，并记录等待时间（调用时需持有锁）"""
+        lane = self.__lanes[priority]
+        count = min(count, len(lane))
+        if not count:
+            return
+        
+        now = default_timer()
+        profiler = self.__profiler
+        popleft = lane.popleft
+        append = events.append
+        
+        wait = 0.0
+        maxWait = 0.0
+        for i in xrange(count):
+            putTime, event = popleft()
+            append(event)
+            
+            w = now - putTime
+            wait += w
+            if w > maxWait:
+                maxWait = w
+                
+            if profiler:
+                profiler.recordWait(event.type_, w)
+        
+        self.__countList[priority] += count
+        self.__waitList[priority] += wait
+        if maxWait > self.__maxWaitList[priority]:
+            self.__maxWaitList[priority] = maxWait
+                
+    #----------------------------------------------------------------------
+    def __record(self, priority, wait):
+        """记录事件的等待时间"""
+        self.__countList[priority] += 1
+        self.__waitList[priority] += wait
+        if wait > self.__maxWaitList[priority]:
+            self.__maxWaitList[priority] = wait
+                
+    #----------------------------------------------------------------------
+    def qsize(self):
+        """队列中的事件数量"""
+        return sum([len(lane) for lane in self.__lanes])
+    
+    #----------------------------------------------------------------------
+    def empty(self):
+        """队列是否为空"""
+        return not self.qsize()
+    
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取每条通道的统计数据，返回字典，key为通道名，value为字典：
+        depth：当前队列深度，count：已处理事件数量，
+        avgWait/maxWait：平均/最长等待时间（秒）
+        """
+        d = OrderedDict()
+        
+        with self.__condition:
+            for priority, name in enumerate(LANE_NAMES):
+                count = self.__countList[priority]
+                if count:
+                    avgWait = self.__waitList[priority] / count
+                else:
+                    avgWait = 0
+                    
+                d[name] = {
+                    'depth': len(self.__lanes[priority]),
+                    'count': count,
+                    'avgWait': avgWait,
+                    'maxWait': self.__maxWaitList[priority]
+                }
+            
+        return d
+    
+    #----------------------------------------------------------------------
+    def resetStats(self):
+        """清空统计数据"""
+        with self.__condition:
+            self.__countList = [0] * len(LANE_NAMES)
+            self.__waitList = [0.0] * len(LANE_NAMES)
+            self.__maxWaitList = [0.0] * len(LANE_NAMES)
+
+
+#----------------------------------------------------------------------
+def getConflationKey(event):
+    """合并订阅默认使用的键：事件数据中的vtSymbol，没有则使用事件类型"""
+    data = event.dict_.get('data')
+    return getattr(data, 'vtSymbol', None) or event.type_
+
+
+########################################################################
+class ConflatingHandler(object):
+    """
+    合并订阅的事件处理函数包装
+    
+    事件引擎的线程调用时只把事件按键保存到待处理字典中，同一个键的新事件
+    直接覆盖尚未处理的旧事件（旧事件被丢弃），由包装内部的线程按照处理
+    函数自身的速度，每次取出所有键的最新事件进行处理。
+    适用于界面刷新、行情转发等只关心最新数据的慢速消费者，
+    不能用于委托、成交等每个事件都必须处理的场合。
+    处理函数抛出的异常会被打印并计数，不会导致处理线程退出。
+    """
 
     #----------------------------------------------------------------------
-    def start(self, timer=True):
+    def __init__(self, handler, keyFunc=None, interval=0):
         """
-        引擎启动
-        timer：是否要启动计时器
+        handler：处理函数
+        keyFunc：计算事件键的函数，默认为getConflationKey
+        interval：每轮处理之后的等待时间（秒），用于限制刷新频率
         """
-        # 将引擎设为启动
+        self.handler = handler
+        self.keyFunc = keyFunc or getConflationKey
+        self.interval = interval
+        
+        self.__pending = OrderedDict()      # 待处理的事件，key为事件键
+        self.__condition = Condition(Lock())
         self.__active = True
         
-        # 启动事件处理线程
+        # 统计数据
+        self.receivedCount = 0      # 收到的事件数量
+        self.droppedCount = 0       # 被覆盖丢弃的事件数量
+        self.processedCount = 0     # 已处理的事件数量
+        self.errorCount = 0         # 处理函数抛出异常的次数
+        self.lastError = ''         # 最近一次的异常信息
+        
+        self.__thread = Thread(target=self.__run)
+        self.__thread.setDaemon(True)
         self.__thread.start()
         
-        # 启动计时器，计时器事件间隔默认设定为1秒
-        if timer:
-            self.__timer.start(1000)
-    
     #----------------------------------------------------------------------
-    def stop(self):
-        """停止引擎"""
-        # 将引擎设为停止
-        self.__active = False
-        
-        # 停止计时器
-        self.__timer.stop()
+    def __call__(self, event):
+        """收到事件，覆盖同一个键尚未处理的旧事件"""
+        key = self.keyFunc(event)
         
-        # 等待事件处理线程退出
-        self.__thread.join()
+        with self.__condition:
+            self.receivedCount += 1
+            if key in self.__pending:
+                self.droppedCount += 1
+            self.__pending[key] = event
+            self.__condition.notify()
             
     #----------------------------------------------------------------------
-    def register(self, type_, handler):
-        """注册事件处理函数监听"""
-        # 尝试获取该事件类型对应的处理函数列表，若无defaultDict会自动创建新的list
-        handlerList = self.__handlers[type_]
-        
-        # 若要注册的处理器不在该事件的处理器列表中，则注册该事件
-        if handler not in handlerList:
-            handlerList.append(handler)
+    def __run(self):
+        """处理线程运行"""
+        while self.__active:
+            with self.__condition:
+                # 不使用超时等待，Python 2中带超时的wait为轮询方式，会增加延时
+                while self.__active and not self.__pending:
+                    self.__condition.wait()
+                    
+                events = self.__pending.values()
+                self.__pending = OrderedDict()
+                
+            errorCount = 0
+            for event in events:
+                try:
+                    self.handler(event)
+                except Exception:
+                    # 处理函数出错时只打印异常，继续处理之后的事件
+                    errorCount += 1
+                    self.lastError = traceback.format_exc()
+                    traceback.print_exc()
             
+            with self.__condition:
+                self.processedCount += len(events)
+                self.errorCount += errorCount
+                
+            if self.interval:
+                sleep(self.interval)
+                
     #----------------------------------------------------------------------
-    def unregister(self, type_, handler):
-        """注销事件处理函数监听"""
-        # 尝试获取该事件类型对应的处理函数列表，若无则忽略该次注销请求   
-        handlerList = self.__handlers[type_]
+    def stop(self):
+        """停止处理线程，尚未处理的事件被丢弃"""
+        with self.__condition:
+            self.__active = False
+            self.__condition.notify()
             
-        # 如果该函数存在于列表中，则移除
-        if handler in handlerList:
-            handlerList.remove(handler)
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """获取统计数据"""
+        with self.__condition:
+            return {
+                'handler': repr(self.handler),
+                'received': self.receivedCount,
+                'dropped': self.droppedCount,
+                'processed': self.processedCount,
+                'pending': len(self.__pending),
+                'errors': self.errorCount,
+                'lastError': self.lastError
+            }
 
-        # 如果函数列表为空，则从引擎中移除该事件类型
-        if not handlerList:
-            del self.__handlers[type_]
+
+# 处理函数耗时直方图的分档上限（秒），最后一档为超过1秒
+LATENCY_BUCKETS = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1]
+LATENCY_LABELS = ['<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '>=1s']
+
+
+########################################################################
+class EventProfiler(object):
+    """
+    事件处理性能统计
+    
+    按照(事件类型, 处理函数)统计调用次数、累计耗时、最长耗时和耗时直方图，
+    按照事件类型统计事件从存入队列到开始处理的等待时间。
+    只在事件引擎开启性能统计时创建，关闭时引擎中只多一次属性判断。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.__lock = Lock()            # 分片引擎中会被多个线程同时调用
+        
+        self.__handlerStats = {}        # key为(事件类型, 处理函数名)，value为[次数, 累计耗时, 最长耗时, 直方图]
+        self.__waitStats = {}           # key为事件类型，value为[次数, 累计等待时间, 最长等待时间]
+        self.__nameCache = {}           # 处理函数名的缓存
+        
+    #----------------------------------------------------------------------
+    def getHandlerName(self, handler):
+        """获取处理函数的名称，对象方法为类名.方法名"""
+        try:
+            return self.__nameCache[handler]
+        except KeyError:
+            pass
+        
+        if isinstance(handler, ConflatingHandler):
+            name = 'Conflated(%s)' %self.getHandlerName(handler.handler)
+        else:
+            obj = getattr(handler, '__self__', None)
+            funcName = getattr(handler, '__name__', None)
+            if obj is not None and funcName:
+                name = '%s.%s' %(obj.__class__.__name__, funcName)
+            elif funcName:
+                name = funcName
+            else:
+                name = repr(handler)
             
+        self.__nameCache[handler] = name
+        return name
+    
     #----------------------------------------------------------------------
-    def put(self, event):
-        """向事件队列中存入事件"""
-        self.__queue.put(event)
+    def process(self, event, handlerList, generalHandlerList):
+        """调用处理函数并统计耗时"""
+        type_ = event.type_
+        
+        if handlerList:
+            for handler in handlerList:
+                self.call(type_, handler, event)
+                
+        if generalHandlerList:
+            for handler in generalHandlerList:
+                self.call(type_, handler, event)
         
     #----------------------------------------------------------------------
-    def registerGeneralHandler(self, handler):
-        """注册通用事件处理函数监听"""
-        if handler not in self.__generalHandlers:
-            self.__generalHandlers.append(handler)
+    def call(self, type_, handler, event):
+        """调用单个处理函数并统计耗时"""
+        start = default_timer()
+        try:
+            handler(event)
+        finally:
+            self.record(type_, handler, default_timer() - start)
             
     #----------------------------------------------------------------------
-    def unregisterGeneralHandler(self, handler):
-        """注销通用事件处理函数监听"""
-        if handler in self.__generalHandlers:
-            self.__generalHandlers.remove(handler)
+    def record(self, type_, handler, cost):
+        """记录处理函数的耗时"""
+        key = (type_, self.getHandlerName(handler))
         
+        with self.__lock:
+            stats = self.__handlerStats.get(key)
+            if not stats:
+                stats = [0, 0.0, 0.0, [0] * len(LATENCY_LABELS)]
+                self.__handlerStats[key] = stats
+            
+            stats[0] += 1
+            stats[1] += cost
+            if cost > stats[2]:
+                stats[2] = cost
+            stats[3][bisect_right(LATENCY_BUCKETS, cost)] += 1
+    
+    #----------------------------------------------------------------------
+    def recordWait(self, type_, wait):
+        """记录事件在队列中的等待时间"""
+        with self.__lock:
+            stats = self.__waitStats.get(type_)
+            if not stats:
+                stats = [0, 0.0, 0.0]
+                self.__waitStats[type_] = stats
+                
+            stats[0] += 1
+            stats[1] += wait
+            if wait > stats[2]:
+                stats[2] = wait
+                
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取统计数据，返回字典：
+        handler：处理函数统计的列表，按累计耗时从大到小排列
+        wait：字典，key为事件类型，value为等待时间统计
+        buckets：直方图每一档的名称
+        """
+        with self.__lock:
+            handlerList = []
+            for (type_, name), (count, total, maxCost, histogram) in self.__handlerStats.items():
+                handlerList.append({
+                    'type': type_,
+                    'handler': name,
+                    'count': count,
+                    'totalTime': total,
+                    'avgTime': total / count,
+                    'maxTime': maxCost,
+                    'histogram': list(histogram)
+                })
+            handlerList.sort(key=lambda d: d['totalTime'], reverse=True)
+            
+            waitDict = {}
+            for type_, (count, total, maxWait) in self.__waitStats.items():
+                waitDict[type_] = {
+                    'count': count,
+                    'avgWait': total / count,
+                    'maxWait': maxWait
+                }
+                
+        return {
+            'handler': handlerList,
+            'wait': waitDict,
+            'buckets': LATENCY_LABELS
+        }
+    
+    #----------------------------------------------------------------------
+    def reset(self):
+        """清空统计数据"""
+        with self.__lock:
+            self.__handlerStats = {}
+            self.__waitStats = {}
 
 
 ########################################################################
-class EventEngine2(object):
+class BasicEventEngine(object):
     """
-    计时器使用python线程的事件驱动引擎        
+    事件驱动引擎的基类，实现处理函数的注册、事件分发、合并订阅和性能统计，
+    子类只需决定事件队列的数量、事件放入哪个队列以及计时器的实现
+    
+    每个事件队列由一个工作线程处理，计时器默认使用python线程实现
     """
 
     #----------------------------------------------------------------------
-    def __init__(self):
-        """初始化事件引擎"""
-        # 事件队列
-        self.__queue = Queue()
+    def __init__(self, queues, batchMode=False):
+        """
+        Constructor
+        queues：事件队列（LaneQueue）列表，每个队列对应一个工作线程
+        batchMode：是否使用批量模式，每次唤醒时取出队列中的事件（最多BATCH_MAX_SIZE个）依次处理，
+        减少获取锁的次数，适合事件密集的场合
+        """
+        # 事件队列，按优先级分道
+        self.__queues = queues
         
         # 事件引擎开关
         self.__active = False
         
         # 事件处理线程
-        self.__thread = Thread(target = self.__run)
+        if batchMode:
+            target = self.__runBatch
+        else:
+            target = self.__run
+        self.__threads = [Thread(target=target, args=(queue,)) for queue in queues]
         
         # 计时器，用于触发计时器事件
         self.__timer = Thread(target = self.__runTimer)
         self.__timerActive = False                      # 计时器工作状态
-        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）        
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）
         
         # 这里的__handlers是一个字典，用来保存对应的事件调用关系
         # 其中每个键对应的值是一个列表，列表中保存了对该事件进行监听的函数功能
         self.__handlers = defaultdict(list)
         
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
-        self.__generalHandlers = []        
+        self.__generalHandlers = []
+        
+        # 合并订阅模式的处理函数包装，key为(事件类型, 处理函数)
+        self.__conflatedDict = {}
+        
+        # 性能统计对象，为None时表示关闭
+        self.__profiler = None
         
     #----------------------------------------------------------------------
-    def __run(self):
-        """引擎运行"""
+    def __run(self, queue):
+        """工作线程运行"""
         while self.__active == True:
             try:
-                event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+                event = queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
                 self.__process(event)
             except Empty:
                 pass
             
+    #----------------------------------------------------------------------
+    def __runBatch(self, queue):
+        """工作线程运行（批量模式）"""
+        process = self.__process
+        
+        while self.__active == True:
+            try:
+                events = queue.getAll(block = True, timeout = 1)
+            except Empty:
+                continue
+            
+            for event in events:
+                # 处理这批事件期间到达的委托、成交等高优先级事件先处理
+                if queue.hasHighPriority():
+                    for highEvent in queue.getHighPriority():
+                        process(highEvent)
+                process(event)
+            
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
-        # 检查是否存在对该事件进行监听的处理函数
-        if event.type_ in self.__handlers:
-            # 若存在，则按顺序将事件传递给处理函数执行
-            [handler(event) for handler in self.__handlers[event.type_]]
-            
-            # 以上语句为Python列表解析方式的写法，对应的常规循环写法为：
-            #for handler in self.__handlers[event.type_]:
-                #handler(event) 
+        # 检查是否存在对该事件进行监听的处理函数，若存在，则按顺序将事件传递给处理函数执行
+        # 使用普通循环而不是列表解析，避免每个事件创建一个无用的列表
+        handlerList = self.__handlers.get(event.type_)
+        
+        # 开启性能统计时，由统计对象调用处理函数并记录耗时
+        if self.__profiler:
+            self.__profiler.process(event, handlerList, self.__generalHandlers)
+            return
+        
+        if handlerList:
+            for handler in handlerList:
+                handler(event)
                 
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
-            [handler(event) for handler in self.__generalHandlers]        
-               
+            for handler in self.__generalHandlers:
+                handler(event)
+            
     #----------------------------------------------------------------------
     def __runTimer(self):
         """运行在计时器线程中的循环函数"""
@@ -247,6 +631,20 @@ class EventEngine2(object):
             
             # 等待
             sleep(self.__timerSleep)
+            
+    #----------------------------------------------------------------------
+    def startTimer(self):
+        """启动计时器，可以在子类中重载"""
+        self.__timerActive = True
+        self.__timer.start()
+        
+    #----------------------------------------------------------------------
+    def stopTimer(self):
+        """停止计时器，可以在子类中重载"""
+        # 未启动计时器时不能join
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
 
     #----------------------------------------------------------------------
     def start(self, timer=True):
@@ -258,12 +656,12 @@ class EventEngine2(object):
         self.__active = True
         
         # 启动事件处理线程
-        self.__thread.start()
+        for thread in self.__threads:
+            thread.start()
         
         # 启动计时器，计时器事件间隔默认设定为1秒
         if timer:
-            self.__timerActive = True
-            self.__timer.start()
+            self.startTimer()
     
     #----------------------------------------------------------------------
     def stop(self):
@@ -272,11 +670,15 @@ class EventEngine2(object):
         self.__active = False
         
         # 停止计时器
-        self.__timerActive = False
-        self.__timer.join()
+        self.stopTimer()
         
         # 等待事件处理线程退出
-        self.__thread.join()
+        for thread in self.__threads:
+            thread.join()
+            
+        # 停止合并订阅的处理线程
+        for conflatingHandler in self.__conflatedDict.values():
+            conflatingHandler.stop()
             
     #----------------------------------------------------------------------
     def register(self, type_, handler):
@@ -300,12 +702,81 @@ class EventEngine2(object):
 
         # 如果函数列表为空，则从引擎中移除该事件类型
         if not handlerList:
-            del self.__handlers[type_]  
+            del self.__handlers[type_]
+            
+    #----------------------------------------------------------------------
+    def hasHandler(self, type_):
+        """是否有处理函数监听该类型的事件，注册了通用处理函数时总是返回True"""
+        return bool(self.__generalHandlers) or type_ in self.__handlers
         
     #----------------------------------------------------------------------
     def put(self, event):
-        """向事件队列中存入事件"""
-        self.__queue.put(event)
+        """向事件队列中存入事件，多个队列时需要在子类中重载"""
+        self.__queues[0].put(event)
+        
+    #----------------------------------------------------------------------
+    def setEventPriority(self, type_, priority):
+        """设置事件类型的优先级"""
+        for queue in self.__queues:
+            queue.setPriority(type_, priority)
+        
+    #----------------------------------------------------------------------
+    def getQueueStats(self):
+        """
+        获取事件队列每条通道的深度和等待时间统计，
+        单个队列时返回字典，多个队列时返回每个队列统计数据的列表
+        """
+        if len(self.__queues) == 1:
+            return self.__queues[0].getStats()
+        return [queue.getStats() for queue in self.__queues]
+
+    #----------------------------------------------------------------------
+    def registerConflated(self, type_, handler, keyFunc=None, interval=0):
+        """
+        以合并订阅模式注册事件处理函数，handler只处理每个键的最新事件，
+        keyFunc和interval的含义见ConflatingHandler
+        """
+        if (type_, handler) in self.__conflatedDict:
+            return
+        
+        conflatingHandler = ConflatingHandler(handler, keyFunc, interval)
+        self.__conflatedDict[(type_, handler)] = conflatingHandler
+        self.register(type_, conflatingHandler)
+        
+    #----------------------------------------------------------------------
+    def unregisterConflated(self, type_, handler):
+        """注销合并订阅模式的事件处理函数"""
+        conflatingHandler = self.__conflatedDict.pop((type_, handler), None)
+        if conflatingHandler:
+            self.unregister(type_, conflatingHandler)
+            conflatingHandler.stop()
+            
+    #----------------------------------------------------------------------
+    def getConflationStats(self):
+        """获取合并订阅的统计数据，返回字典，key为事件类型，value为统计数据列表"""
+        d = defaultdict(list)
+        for (type_, handler), conflatingHandler in self.__conflatedDict.items():
+            d[type_].append(conflatingHandler.getStats())
+        return dict(d)
+
+    #----------------------------------------------------------------------
+    def enableProfiling(self, enabled=True):
+        """开启或关闭性能统计，关闭时清空统计数据"""
+        if enabled:
+            if not self.__profiler:
+                self.__profiler = EventProfiler()
+        else:
+            self.__profiler = None
+        
+        for queue in self.__queues:
+            queue.setProfiler(self.__profiler)
+        
+    #----------------------------------------------------------------------
+    def getProfilingStats(self):
+        """获取性能统计数据，未开启时返回空字典"""
+        if self.__profiler:
+            return self.__profiler.getStats()
+        return {}
 
     #----------------------------------------------------------------------
     def registerGeneralHandler(self, handler):
@@ -320,6 +791,168 @@ class EventEngine2(object):
             self.__generalHandlers.remove(handler)
 
 
+########################################################################
+class EventEngine(BasicEventEngine):
+    """
+    事件驱动引擎
+    事件驱动引擎中所有的变量都设置为了私有，这是为了防止不小心
+    从外部修改了这些变量的值或状态，导致bug。
+    
+    变量说明
+    __queue：私有变量，事件队列
+    __timer：私有变量，计时器
+    
+    
+    方法说明
+    __onTimer：私有方法，计时器固定事件间隔触发后，向事件队列中存入计时器事件
+    start: 公共方法，启动引擎
+    stop：公共方法，停止引擎
+    register：公共方法，向引擎中注册监听函数
+    unregister：公共方法，向引擎中注销监听函数
+    put：公共方法，向事件队列中存入新的事件
+    
+    事件的处理线程、处理函数的注册和分发由BasicEventEngine实现
+    
+    事件监听函数必须定义为输入参数仅为一个event对象，即：
+    
+    函数
+    def func(event)
+        ...
+    
+    对象方法
+    def method(self, event)
+        ...
+        
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, batchMode=False):
+        """
+        初始化事件引擎
+        batchMode：是否使用批量模式，含义见BasicEventEngine
+        """
+        # 事件队列，按优先级分道
+        self.__queue = LaneQueue()
+        
+        super(EventEngine, self).__init__([self.__queue], batchMode)
+        
+        # 计时器，用于触发计时器事件
+        self.__timer = QTimer()
+        self.__timer.timeout.connect(self.__onTimer)
+        
+    #----------------------------------------------------------------------
+    def __onTimer(self):
+        """向事件队列中存入计时器事件"""
+        # 创建计时器事件
+        event = Event(type_=EVENT_TIMER)
+        
+        # 向队列中存入计时器事件
+        self.put(event)    
+
+    #----------------------------------------------------------------------
+    def startTimer(self):
+        """启动计时器，计时器事件间隔设定为1秒"""
+        self.__timer.start(1000)
+        
+    #----------------------------------------------------------------------
+    def stopTimer(self):
+        """停止计时器"""
+        self.__timer.stop()
+        
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件队列中存入事件"""
+        self.__queue.put(event)
+        
+
+########################################################################
+class EventEngine2(BasicEventEngine):
+    """
+    计时器使用python线程的事件驱动引擎        
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, batchMode=False):
+        """
+        初始化事件引擎
+        batchMode：是否使用批量模式，含义见BasicEventEngine
+        """
+        # 事件队列，按优先级分道
+        self.__queue = LaneQueue()
+        
+        super(EventEngine2, self).__init__([self.__queue], batchMode)
+        
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件队列中存入事件"""
+        self.__queue.put(event)
+
+
+########################################################################
+class ShardedEventEngine(BasicEventEngine):
+    """
+    多线程分片的事件驱动引擎
+    
+    事件按照键（默认为事件数据中的vtSymbol）分配到多个工作线程中处理，
+    同一个键的事件总是由同一个线程按照存入的顺序处理，因此单个合约的
+    行情、委托、成交回报的先后顺序保持不变，而不同合约之间不再互相等待。
+    
+    没有键的事件（计时器、日志、账户等全局事件）统一由0号线程处理，
+    每个事件只会被处理一次，因此注册的处理函数和单线程引擎完全相同。
+    
+    注意：同一个处理函数可能在多个线程中同时被调用（处理不同合约的事件），
+    处理函数中修改共享状态时需要自行考虑线程安全。
+    由于GIL的存在，纯Python计算无法真正并行，分片的收益主要来自
+    数据库写入、网络请求等会释放GIL的耗时操作不再阻塞其他合约的事件。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, shardCount=4, batchMode=False):
+        """
+        Constructor
+        shardCount：工作线程数量
+        batchMode：是否使用批量模式，含义见BasicEventEngine
+        """
+        if shardCount <= 0:
+            raise ValueError(u'工作线程数量必须大于0')
+        
+        self.shardCount = shardCount
+        
+        # 每个工作线程对应一个事件队列
+        self.__queues = [LaneQueue() for i in range(shardCount)]
+        
+        super(ShardedEventEngine, self).__init__(self.__queues, batchMode)
+            
+    #----------------------------------------------------------------------
+    def getEventKey(self, event):
+        """获取事件的分片键，没有则返回None，可以在子类中重载"""
+        data = event.dict_.get('data')
+        return getattr(data, 'vtSymbol', None) or None
+    
+    #----------------------------------------------------------------------
+    def getShard(self, event):
+        """计算事件分配到的工作线程编号"""
+        key = self.getEventKey(event)
+        if key is None:
+            return 0
+        return hash(key) % self.shardCount
+        
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件所属分片的队列中存入事件"""
+        self.__queues[self.getShard(event)].put(event)
+        
+    #----------------------------------------------------------------------
+    def getQueueSize(self):
+        """获取每个工作线程队列中等待处理的事件数量"""
+        return [queue.qsize() for queue in self.__queues]
+
+    #----------------------------------------------------------------------
+    def getQueueStats(self):
+        """获取每个工作线程事件队列的深度和等待时间统计，返回列表"""
+        return [queue.getStats() for queue in self.__queues]
+
+
 ########################################################################
 class Event:
     """事件对象"""
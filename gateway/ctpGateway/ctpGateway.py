@@ -17,6 +17,7 @@ from vnctpmd import MdApi
 from vnctptd import TdApi
 from ctpDataType import *
 from vtGateway import *
+from vtFunction import getTodayString, parseTickTime
 from language import text
 
 
@@ -350,7 +351,10 @@ class CtpMdApi(MdApi):
         
         # 这里由于交易所夜盘时段的交易日数据有误，所以选择本地获取
         #tick.date = data['TradingDay']
-        tick.date = datetime.now().strftime('%Y%m%d')   
+        tick.date = getTodayString()
+        
+        # 在接口中解析一次时间，之后的CTA策略、行情记录等模块直接使用
+        tick.datetime, tick.epochNs = parseTickTime(tick.date, tick.time)
         
         tick.openPrice = data['OpenPrice']
         tick.highPrice = data['HighestPrice']
@@ -131,3 +131,4 @@ DATABASE_CONNECTING_FAILED = u'MongoDB连接失败'
 DATA_INSERT_FAILED = u'数据插入失败，MongoDB没有连接'
 DATA_QUERY_FAILED = u'数据查询失败，MongoDB没有连接'
 DATA_UPDATE_FAILED = u'数据更新失败，MongoDB没有连接'
+DATA_WRITE_FAILED = u'数据批量写入失败，集合：{collection}，错误：{error}'
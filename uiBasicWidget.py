@@ -32,6 +32,9 @@ def loadFont():
 
 BASIC_FONT = loadFont()
 
+# 行情类组件合并订阅的刷新间隔（秒），界面只显示每个合约的最新行情
+UI_CONFLATE_INTERVAL = 0.1
+
 
 ########################################################################
 class BasicCell(QtGui.QTableWidgetItem):
@@ -211,6 +214,9 @@ class BasicMonitor(QtGui.QTableWidget):
         # 默认不允许根据表头进行排序，需要的组件可以开启
         self.sorting = False
 
+        # 合并订阅的刷新间隔，为None时逐个处理所有事件
+        self.conflateInterval = None
+
         # 初始化右键菜单
         self.initMenu()
 
@@ -235,6 +241,11 @@ class BasicMonitor(QtGui.QTableWidget):
         """设置字体"""
         self.font = font
 
+    #----------------------------------------------------------------------
+    def setConflateInterval(self, interval):
+        """设置合并订阅的刷新间隔，只适用于只关心最新数据的组件"""
+        self.conflateInterval = interval
+
     #----------------------------------------------------------------------
     def setSaveData(self, saveData):
         """设置是否要保存数据到单元格"""
@@ -267,7 +278,11 @@ class BasicMonitor(QtGui.QTableWidget):
     def registerEvent(self):
         """注册GUI更新相关的事件监听"""
         self.signal.connect(self.updateEvent)
-        self.eventEngine.register(self.eventType, self.signal.emit)
+        if self.conflateInterval is None:
+            self.eventEngine.register(self.eventType, self.signal.emit)
+        else:
+            self.eventEngine.registerConflated(self.eventType, self.signal.emit,
+                                               interval=self.conflateInterval)
 
     #----------------------------------------------------------------------
     def updateEvent(self, event):
@@ -434,6 +449,9 @@ class MarketMonitor(BasicMonitor):
         # 设置允许排序
         self.setSorting(True)
 
+        # 只显示每个合约的最新行情
+        self.setConflateInterval(UI_CONFLATE_INTERVAL)
+
         # 初始化表格
         self.initTable()
 
@@ -931,8 +949,9 @@ class TradingWidget(QtGui.QFrame):
         self.labelReturn.setText('')
 
         # 重新注册事件监听
-        self.eventEngine.unregister(EVENT_TICK + self.symbol, self.signal.emit)
-        self.eventEngine.register(EVENT_TICK + vtSymbol, self.signal.emit)
+        self.eventEngine.unregisterConflated(EVENT_TICK + self.symbol, self.signal.emit)
+        self.eventEngine.registerConflated(EVENT_TICK + vtSymbol, self.signal.emit,
+                                           interval=UI_CONFLATE_INTERVAL)
 
         # 订阅合约
         req = VtSubscribeReq()
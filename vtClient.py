@@ -10,6 +10,7 @@ from uiMainWindow import *
 
 from eventEngine import *
 from vnrpc import RpcClient
+from vtFunction import DB_QUERY_BATCH_SIZE
 
 from ctaStrategy.ctaEngine import CtaEngine
 from dataRecorder.drEngine import DrEngine
@@ -117,16 +118,107 @@ class ClientEngine(object):
         """向MongoDB中插入数据，d是具体数据"""
         self.client.dbInsert(dbName, collectionName, d)
     
+    #----------------------------------------------------------------------
+    def dbInsertMany(self, dbName, collectionName, l, upsertKey=''):
+        """向MongoDB中批量插入数据，l是数据列表，返回是否写入成功"""
+        return self.client.dbInsertMany(dbName, collectionName, l, upsertKey)
+    
     #----------------------------------------------------------------------
     def dbQuery(self, dbName, collectionName, d):
         """从MongoDB中读取数据，d是查询要求，返回的是数据库查询的数据列表"""
         return self.client.dbQuery(dbName, collectionName, d)
+    
+    #----------------------------------------------------------------------
+    def dbQueryIter(self, dbName, collectionName, d, projection=None, sort=None, 
+                    batchSize=DB_QUERY_BATCH_SIZE, dataClass=None):
+        """
+        从MongoDB中流式读取数据，返回生成器，每次通过RPC从服务端读取一页数据
+        按排序字段的值分页（下一页从上一页最后一条数据之后开始），不使用skip，
+        服务端每页只需要从索引中的位置开始读取，不会重复扫描之前的数据
+        sort：排序方式，默认按datetime排序（和CTA策略读取历史数据的顺序一致）
+        """
+        if dataClass and projection is None:
+            projection = dataClass.getProjection()
+        
+        # 分页需要稳定的顺序，排序字段最后加上_id，保证时间相同的数据也有确定的顺序
+        if not sort:
+            sort = [('datetime', 1)]
+        sort = list(sort)
+        keys = [key for key, direction in sort]
+        if '_id' not in keys:
+            sort.append(('_id', 1))
+            keys.append('_id')
+        
+        # 分页需要读取排序字段，不在原有projection中的字段返回前再删除
+        pageProjection = projection
+        removeKeys = []
+        if projection is not None:
+            pageProjection = dict(projection)
+            inclusion = any(projection.values())
+            for key in keys:
+                if inclusion and not projection.get(key):
+                    pageProjection[key] = True
+                    removeKeys.append(key)
+                elif not inclusion and key in projection:
+                    del pageProjection[key]
+                    removeKeys.append(key)
+        
+        flt = d
+        while True:
+            l = self.client.dbQueryPage(dbName, collectionName, flt, pageProjection, sort, 
+                                        batchSize)
+            if not l:
+                break
+            
+            # 下一页的查询条件：排序字段的值在上一页最后一条数据之后
+            last = l[-1]
+            flt = {'$and': [d, self.getPageFilter(sort, last)]}
+            
+            for data in l:
+                for key in removeKeys:
+                    data.pop(key, None)
+                
+                if dataClass:
+                    yield dataClass().fromDict(data)
+                else:
+                    yield data
+            
+            if len(l) < batchSize:
+                break
+    
+    #----------------------------------------------------------------------
+    def getPageFilter(self, sort, last):
+        """生成分页查询条件：按sort的顺序排在last这条数据之后"""
+        orList = []
+        for i, (key, direction) in enumerate(sort):
+            condition = dict([(k, last.get(k)) for k, dr in sort[:i]])
+            if direction > 0:
+                condition[key] = {'$gt': last.get(key)}
+            else:
+                condition[key] = {'$lt': last.get(key)}
+            orList.append(condition)
+        return {'$or': orList}
         
     #----------------------------------------------------------------------
     def dbUpdate(self, dbName, collectionName, d, flt, upsert=False):
         """向MongoDB中更新数据，d是具体数据，flt是过滤条件，upsert代表若无是否要插入"""
         self.client.dbUpdate(dbName, collectionName, d, flt, upsert)
     
+    #----------------------------------------------------------------------
+    def dbInsertAsync(self, dbName, collectionName, d):
+        """向MongoDB中插入数据（服务端缓存后批量写入，不等待写入完成）"""
+        self.client.dbInsertAsync(dbName, collectionName, d)
+    
+    #----------------------------------------------------------------------
+    def dbUpdateAsync(self, dbName, collectionName, d, flt, upsert=False):
+        """向MongoDB中更新数据（服务端缓存后批量写入，不等待写入完成）"""
+        self.client.dbUpdateAsync(dbName, collectionName, d, flt, upsert)
+    
+    #----------------------------------------------------------------------
+    def getDbStats(self):
+        """查询服务端数据库批量写入服务的统计"""
+        return self.client.getDbStats()
+    
     #----------------------------------------------------------------------
     def getContract(self, vtSymbol):
         """查询合约"""
@@ -151,6 +243,16 @@ class ClientEngine(object):
     def getAllGatewayNames(self):
         """查询所有的接口名称"""
         return self.client.getAllGatewayNames()
+    
+    #----------------------------------------------------------------------
+    def enableEventProfiling(self, enabled=True):
+        """开启或关闭服务器端事件引擎的性能统计"""
+        self.client.enableEventProfiling(enabled)
+        
+    #----------------------------------------------------------------------
+    def getEventStats(self):
+        """查询服务器端事件引擎的运行统计"""
+        return self.client.getEventStats()
 
 
 #----------------------------------------------------------------------
@@ -0,0 +1,292 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了MongoDB的批量写入服务（write-behind），供主引擎的各个模块共用。
+
+逐条调用insert_one写入时，每条数据都需要一次和数据库的网络往返，
+行情记录、日志等高频写入场合下数据库写入会成为瓶颈。
+批量写入服务把数据按(数据库, 集合)缓存，由单独的线程在缓存数量达到上限
+或者距离第一条缓存数据超过一定时间后，使用insert_many（无序）和
+bulk_write批量写入，写入失败时只记录错误，不会阻塞调用方。
+数据库尚未连接（或者连接断开）时，缓存的数据保留在内存中，每隔一个周期重试，
+缓存数量达到上限后新的数据被丢弃并计数，防止内存无限增长。
+
+注意：写入是异步的，调用返回时数据不一定已经写入数据库，
+需要立即读取写入结果的场合请使用主引擎的同步写入函数。
+'''
+
+from __future__ import division
+
+from collections import OrderedDict
+from threading import Thread, Condition, Lock
+from timeit import default_timer
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError, BulkWriteError
+
+from language import text
+
+
+# 默认的批量写入参数
+DEFAULT_BATCH_SIZE = 1000       # 缓存的数据数量达到该值时立即写入
+DEFAULT_INTERVAL = 1.0          # 缓存的数据最长等待时间（秒）
+DEFAULT_MAX_PENDING = 1000000   # 数据库未连接时最多保留的数据数量
+
+
+########################################################################
+class DbWriter(object):
+    """MongoDB批量写入服务"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine, batchSize=DEFAULT_BATCH_SIZE, interval=DEFAULT_INTERVAL,
+                 maxPending=DEFAULT_MAX_PENDING):
+        """
+        mainEngine：主引擎，写入时使用主引擎的数据库连接
+        batchSize：缓存的数据数量达到该值时立即写入
+        interval：缓存的数据最长等待时间（秒），也是数据库未连接时重试的间隔
+        maxPending：数据库未连接时最多保留的数据数量
+        """
+        self.mainEngine = mainEngine
+        self.batchSize = batchSize
+        self.interval = interval
+        self.maxPending = maxPending
+        self.dbDown = False             # 数据库是否未连接（用于只输出一次日志）
+
+        # 缓存的数据，key为(数据库名, 集合名)，value为[插入数据列表, 更新操作列表]
+        self.__pending = OrderedDict()
+        self.__pendingCount = 0         # 缓存的数据数量
+        self.__deadline = 0             # 缓存的数据最晚的写入时间
+
+        self.__condition = Condition(Lock())
+        self.__writeLock = Lock()       # 保证后台线程和flush的写入不会交错
+        self.__active = False
+        self.__thread = Thread(target=self.__run)
+        self.__thread.setDaemon(True)
+
+        # 统计数据
+        self.resetStats()
+
+    #----------------------------------------------------------------------
+    def insert(self, dbName, collectionName, d):
+        """缓存一条插入数据"""
+        self.__add(dbName, collectionName, d, 0)
+
+    #----------------------------------------------------------------------
+    def update(self, dbName, collectionName, d, flt, upsert=False):
+        """缓存一条更新数据，d是具体数据，flt是过滤条件，upsert代表若无是否要插入"""
+        self.__add(dbName, collectionName, ReplaceOne(flt, d, upsert), 1)
+
+    #----------------------------------------------------------------------
+    def __add(self, dbName, collectionName, item, index):
+        """缓存数据，index为0时是插入数据，为1时是更新操作"""
+        key = (dbName, collectionName)
+
+        with self.__condition:
+            # 数据库未连接且缓存已满时丢弃
+            if self.dbDown and self.__pendingCount >= self.maxPending:
+                self.droppedCount += 1
+                return
+
+            if key not in self.__pending:
+                self.__pending[key] = [[], []]
+            self.__pending[key][index].append(item)
+
+            if not self.__pendingCount:
+                self.__deadline = default_timer() + self.interval
+            self.__pendingCount += 1
+            self.queuedCount += 1
+
+            if self.__pendingCount > self.maxDepth:
+                self.maxDepth = self.__pendingCount
+
+            # 第一条数据到来时唤醒线程开始计时，数量达到上限时唤醒线程立即写入
+            if self.__pendingCount == 1 or self.__pendingCount >= self.batchSize:
+                self.__condition.notify()
+
+    #----------------------------------------------------------------------
+    def __take(self):
+        """取出所有缓存的数据（调用时需持有锁）"""
+        pending = self.__pending
+        self.__pending = OrderedDict()
+        self.__pendingCount = 0
+        return pending
+
+    #----------------------------------------------------------------------
+    def __run(self):
+        """写入线程运行"""
+        while self.__active:
+            with self.__condition:
+                # 没有缓存数据时不使用超时等待，Python 2中带超时的wait为轮询方式
+                while self.__active and not self.__pendingCount:
+                    self.__condition.wait()
+
+                # 等待数据数量达到上限，或者到达写入时间
+                while self.__active and self.__pendingCount < self.batchSize:
+                    remaining = self.__deadline - default_timer()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+
+                pending = self.__take()
+
+            # 数据库未连接时数据已放回缓存，等待一个周期后重试
+            # （缓存数量超过上限时每次缓存数据都会唤醒线程，因此循环等待到重试时间）
+            if not self.__write(pending):
+                retryTime = default_timer() + self.interval
+                with self.__condition:
+                    while self.__active:
+                        remaining = retryTime - default_timer()
+                        if remaining <= 0:
+                            break
+                        self.__condition.wait(remaining)
+
+    #----------------------------------------------------------------------
+    def __write(self, pending):
+        """批量写入数据，数据库未连接时把数据放回缓存并返回False"""
+        if not pending:
+            return True
+
+        dbClient = self.mainEngine.dbClient
+        if not dbClient:
+            if not self.dbDown:
+                self.dbDown = True
+                self.mainEngine.writeLog(text.DATA_INSERT_FAILED, persistent=False)
+            self.__restore(pending)
+            return False
+        self.dbDown = False
+
+        with self.__writeLock:
+            start = default_timer()
+
+            for (dbName, collectionName), (insertList, updateList) in pending.items():
+                collection = dbClient[dbName][collectionName]
+
+                # 插入数据之间没有先后依赖，使用无序写入，单条失败不影响其他数据
+                if insertList:
+                    try:
+                        collection.insert_many(insertList, ordered=False)
+                        self.insertedCount += len(insertList)
+                    except BulkWriteError as e:
+                        self.insertedCount += e.details.get('nInserted', 0)
+                        self.onError(collectionName, e)
+                    except PyMongoError as e:
+                        self.onError(collectionName, e)
+
+                # 同一条数据可能被多次更新，需要按顺序执行
+                if updateList:
+                    try:
+                        collection.bulk_write(updateList, ordered=True)
+                        self.updatedCount += len(updateList)
+                    except BulkWriteError as e:
+                        self.updatedCount += e.details.get('nMatched', 0) + e.details.get('nUpserted', 0)
+                        self.onError(collectionName, e)
+                    except PyMongoError as e:
+                        self.onError(collectionName, e)
+
+            latency = default_timer() - start
+            self.flushCount += 1
+            self.totalLatency += latency
+            if latency > self.maxLatency:
+                self.maxLatency = latency
+
+        return True
+
+    #----------------------------------------------------------------------
+    def __restore(self, pending):
+        """把未能写入的数据放回缓存（排在之后缓存的数据之前）"""
+        count = sum([len(insertList) + len(updateList)
+                     for insertList, updateList in pending.values()])
+
+        with self.__condition:
+            for key, (insertList, updateList) in self.__pending.items():
+                if key not in pending:
+                    pending[key] = [[], []]
+                pending[key][0].extend(insertList)
+                pending[key][1].extend(updateList)
+
+            if not self.__pendingCount:
+                self.__deadline = default_timer() + self.interval
+            self.__pending = pending
+            self.__pendingCount += count
+
+    #----------------------------------------------------------------------
+    def onError(self, collectionName, e):
+        """
+        记录写入错误，BulkWriteError时只有部分数据写入失败，已写入的数量由调用方统计
+        错误日志不记录到数据库，防止日志集合本身无法写入时错误不断重复
+        """
+        self.errorCount += 1
+        self.lastError = str(e)
+        self.mainEngine.writeLog(text.DATA_WRITE_FAILED.format(collection=collectionName,
+                                                               error=self.lastError),
+                                 persistent=False)
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """立即写入所有缓存的数据（在调用线程中执行）"""
+        with self.__condition:
+            pending = self.__take()
+        self.__write(pending)
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.__active = True
+        self.__thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，写入所有缓存的数据"""
+        if self.__active:
+            with self.__condition:
+                self.__active = False
+                self.__condition.notify()
+            self.__thread.join()
+
+        self.flush()
+
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """
+        获取统计数据，返回字典：
+        depth/maxDepth：当前/最大缓存数据数量，queued：缓存过的数据总数，
+        inserted/updated：已写入的插入/更新数量，flushCount：批量写入次数，
+        avgLatency/maxLatency：每次批量写入的平均/最长耗时（秒），
+        errorCount/lastError：写入失败次数和最近一次的错误信息，
+        dropped：数据库未连接、缓存超过上限时丢弃的数据数量
+        """
+        with self.__condition:
+            depth = self.__pendingCount
+
+        if self.flushCount:
+            avgLatency = self.totalLatency / self.flushCount
+        else:
+            avgLatency = 0
+
+        return {
+            'depth': depth,
+            'maxDepth': self.maxDepth,
+            'queued': self.queuedCount,
+            'inserted': self.insertedCount,
+            'updated': self.updatedCount,
+            'flushCount': self.flushCount,
+            'avgLatency': avgLatency,
+            'maxLatency': self.maxLatency,
+            'errorCount': self.errorCount,
+            'lastError': self.lastError,
+            'dropped': self.droppedCount
+        }
+
+    #----------------------------------------------------------------------
+    def resetStats(self):
+        """清空统计数据"""
+        self.maxDepth = 0           # 最大缓存数据数量
+        self.queuedCount = 0        # 缓存过的数据总数
+        self.insertedCount = 0      # 已写入的插入数量
+        self.updatedCount = 0       # 已写入的更新数量
+        self.flushCount = 0         # 批量写入次数
+        self.totalLatency = 0       # 批量写入累计耗时
+        self.maxLatency = 0         # 批量写入最长耗时
+        self.errorCount = 0         # 写入失败次数
+        self.lastError = ''         # 最近一次的错误信息
+        self.droppedCount = 0       # 丢弃的数据数量
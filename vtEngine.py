@@ -4,12 +4,13 @@ import shelve
 from collections import OrderedDict
 from datetime import datetime
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, ASCENDING
 from pymongo.errors import ConnectionFailure
 
 from eventEngine import *
 from vtGateway import *
-from vtFunction import loadMongoSetting
+from vtFunction import loadMongoSetting, DB_QUERY_BATCH_SIZE
+from vtDbWriter import DbWriter
 from language import text
 
 from gateway import GATEWAY_DICT
@@ -37,6 +38,11 @@ class MainEngine(object):
         
         # MongoDB数据库相关
         self.dbClient = None    # MongoDB客户端对象
+        self.dbIndexSet = set() # 已经建立过索引的(数据库名, 集合名, 字段)
+        
+        # 数据库批量写入服务，供日志记录、行情记录等高频写入使用
+        self.dbWriter = DbWriter(self)
+        self.dbWriter.start()
         
         # 调用一个个初始化函数
         self.initGateway()
@@ -141,14 +147,22 @@ class MainEngine(object):
         # 停止数据记录引擎
         self.drEngine.stop()
         
+        # 写入所有缓存的数据库数据
+        self.dbWriter.stop()
+        
         # 保存数据引擎里的合约数据到硬盘
         self.dataEngine.saveContracts()
     
     #----------------------------------------------------------------------
-    def writeLog(self, content):
-        """快速发出日志事件"""
+    def writeLog(self, content, persistent=True):
+        """
+        快速发出日志事件
+        persistent：是否记录到数据库日志，数据库写入服务自身的错误日志不记录，
+        防止日志集合无法写入时错误日志不断重复写入失败
+        """
         log = VtLogData()
         log.logContent = content
+        log.persistent = persistent
         event = Event(type_=EVENT_LOG)
         event.dict_['data'] = log
         self.eventEngine.put(event)        
@@ -186,6 +200,36 @@ class MainEngine(object):
         else:
             self.writeLog(text.DATA_INSERT_FAILED)
     
+    #----------------------------------------------------------------------
+    def dbInsertMany(self, dbName, collectionName, l, upsertKey=''):
+        """
+        向MongoDB中批量插入数据（无序写入），l是数据列表，返回是否写入成功
+        upsertKey：不为空时按该字段的值更新或插入（重复执行不会产生重复数据，
+        会自动为该字段建立索引），用于可能已经部分写入过的数据
+        """
+        if not self.dbClient:
+            self.writeLog(text.DATA_INSERT_FAILED)
+            return False
+        
+        if not l:
+            return True
+        
+        db = self.dbClient[dbName]
+        collection = db[collectionName]
+        
+        if upsertKey:
+            # 每个集合只建立一次索引
+            key = (dbName, collectionName, upsertKey)
+            if key not in self.dbIndexSet:
+                collection.create_index([(upsertKey, ASCENDING)])
+                self.dbIndexSet.add(key)
+            
+            collection.bulk_write([ReplaceOne({upsertKey: d[upsertKey]}, d, upsert=True) for d in l],
+                                  ordered=False)
+        else:
+            collection.insert_many(l, ordered=False)
+        return True
+    
     #----------------------------------------------------------------------
     def dbQuery(self, dbName, collectionName, d):
         """从MongoDB中读取数据，d是查询要求，返回的是数据库查询的指针"""
@@ -201,6 +245,55 @@ class MainEngine(object):
             self.writeLog(text.DATA_QUERY_FAILED)   
             return []
         
+    #----------------------------------------------------------------------
+    def dbQueryIter(self, dbName, collectionName, d, projection=None, sort=None, 
+                    batchSize=DB_QUERY_BATCH_SIZE, dataClass=None):
+        """
+        从MongoDB中流式读取数据，返回生成器，遍历时才按批从数据库读取，
+        不会像dbQuery那样一次把所有数据读入内存
+        d：查询要求
+        projection：读取的字段，dataClass不为空时默认只读取数据类的字段
+        sort：排序方式，如[('datetime', ASCENDING)]
+        batchSize：每次从数据库读取的数据数量
+        dataClass：数据类（如CtaBarData），为空时返回字典，否则返回数据类对象
+        """
+        if not self.dbClient:
+            self.writeLog(text.DATA_QUERY_FAILED)
+            return
+        
+        if dataClass and projection is None:
+            projection = dataClass.getProjection()
+        
+        collection = self.dbClient[dbName][collectionName]
+        cursor = collection.find(d, projection)
+        if sort:
+            cursor.sort(sort)
+        cursor.batch_size(batchSize)
+        
+        if dataClass:
+            for data in cursor:
+                yield dataClass().fromDict(data)
+        else:
+            for data in cursor:
+                yield data
+    
+    #----------------------------------------------------------------------
+    def dbQueryPage(self, dbName, collectionName, d, projection=None, sort=None, 
+                    limit=DB_QUERY_BATCH_SIZE):
+        """
+        从MongoDB中读取一页数据（返回列表），用于客户端分页实现流式查询
+        客户端在查询条件d中指定从上一页最后一条数据之后开始（按排序字段的值分页）
+        """
+        if not self.dbClient:
+            self.writeLog(text.DATA_QUERY_FAILED)
+            return []
+        
+        collection = self.dbClient[dbName][collectionName]
+        cursor = collection.find(d, projection).limit(limit)
+        if sort:
+            cursor.sort(sort)
+        return list(cursor)
+        
     #----------------------------------------------------------------------
     def dbUpdate(self, dbName, collectionName, d, flt, upsert=False):
         """向MongoDB中更新数据，d是具体数据，flt是过滤条件，upsert代表若无是否要插入"""
@@ -210,17 +303,38 @@ class MainEngine(object):
             collection.replace_one(flt, d, upsert)
         else:
             self.writeLog(text.DATA_UPDATE_FAILED)        
+    
+    #----------------------------------------------------------------------
+    def dbInsertAsync(self, dbName, collectionName, d):
+        """
+        向MongoDB中插入数据（缓存后批量写入，不等待写入完成），d是具体数据
+        数据库尚未连接时数据保留在缓存中，连接后写入
+        """
+        self.dbWriter.insert(dbName, collectionName, d)
+    
+    #----------------------------------------------------------------------
+    def dbUpdateAsync(self, dbName, collectionName, d, flt, upsert=False):
+        """向MongoDB中更新数据（缓存后批量写入，不等待写入完成），数据库尚未连接时同上"""
+        self.dbWriter.update(dbName, collectionName, d, flt, upsert)
+    
+    #----------------------------------------------------------------------
+    def getDbStats(self):
+        """查询数据库批量写入服务的统计：缓存深度、写入数量、批量写入耗时"""
+        return self.dbWriter.getStats()
             
     #----------------------------------------------------------------------
     def dbLogging(self, event):
         """向MongoDB中插入日志"""
         log = event.dict_['data']
+        if not log.persistent:
+            return
+        
         d = {
             'content': log.logContent,
             'time': log.logTime,
             'gateway': log.gatewayName
         }
-        self.dbInsert(LOG_DB_NAME, self.todayDate, d)
+        self.dbInsertAsync(LOG_DB_NAME, self.todayDate, d)
     
     #----------------------------------------------------------------------
     def getContract(self, vtSymbol):
@@ -246,6 +360,20 @@ class MainEngine(object):
     def getAllGatewayNames(self):
         """查询引擎中所有可用接口的名称"""
         return self.gatewayDict.keys()
+    
+    #----------------------------------------------------------------------
+    def enableEventProfiling(self, enabled=True):
+        """开启或关闭事件引擎的处理函数性能统计"""
+        self.eventEngine.enableProfiling(enabled)
+        
+    #----------------------------------------------------------------------
+    def getEventStats(self):
+        """查询事件引擎的运行统计：队列深度和等待时间、处理函数耗时、合并订阅丢弃数量"""
+        return {
+            'queue': self.eventEngine.getQueueStats(),
+            'profiling': self.eventEngine.getProfilingStats(),
+            'conflation': self.eventEngine.getConflationStats()
+        }
         
     
 
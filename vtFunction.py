@@ -7,11 +7,15 @@
 import os
 import decimal
 import json
-from datetime import datetime
+from time import mktime
+from time import time as getTime
+from datetime import datetime, timedelta
 
 MAX_NUMBER = 10000000000000
 MAX_DECIMAL = 4
 
+DB_QUERY_BATCH_SIZE = 1000      # 流式查询时每次从数据库读取的数据数量
+
 #----------------------------------------------------------------------
 def safeUnicode(value):
     """检查接口数据潜在的错误，保证转化为的字符串正确"""
@@ -53,4 +57,155 @@ def todayDate():
     """获取当前本机电脑时间的日期"""
     return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)    
 
- 
+# 日期解析结果的缓存，key为日期字符串，value为(年, 月, 日, 当天零点的纳秒时间戳)
+DATE_CACHE = {}
+
+# 当前日期字符串的缓存，expire为缓存失效（下一个零点）的时间戳
+TODAY_CACHE = {'date': '', 'expire': 0.0}
+
+#----------------------------------------------------------------------
+def parseDate(dateStr):
+    """解析YYYYMMDD格式的日期，返回(年, 月, 日, 当天零点的纳秒时间戳)，结果按日期缓存"""
+    try:
+        return DATE_CACHE[dateStr]
+    except KeyError:
+        pass
+    
+    dt = datetime.strptime(dateStr, '%Y%m%d')
+    result = (dt.year, dt.month, dt.day, int(mktime(dt.timetuple())) * 1000000000)
+    DATE_CACHE[dateStr] = result
+    return result
+
+#----------------------------------------------------------------------
+def parseTickTime(dateStr, timeStr):
+    """
+    解析tick的日期和时间，返回(datetime对象, 纳秒时间戳)
+    dateStr格式为20151009，timeStr格式为11:20:56.5（小数部分可以为1-6位，也可以没有）
+    结果和datetime.strptime(dateStr + ' ' + timeStr, '%Y%m%d %H:%M:%S.%f')相同，
+    日期部分按天缓存，时间部分使用字符串切片和整数运算解析，速度远快于strptime
+    纳秒时间戳为本地时间对应的epoch纳秒数，整数比较的速度快于datetime
+    """
+    year, month, day, dayNs = parseDate(dateStr)
+    
+    if timeStr[2:3] != ':' or timeStr[5:6] != ':':
+        raise ValueError(u'时间格式错误：%s' %timeStr)
+    
+    hour = int(timeStr[0:2])
+    minute = int(timeStr[3:5])
+    second = int(timeStr[6:8])
+    
+    # 小数部分右侧补0到6位，如.5为500000微秒
+    fraction = timeStr[9:15]
+    if fraction:
+        microsecond = int(fraction) * 10 ** (6 - len(fraction))
+    else:
+        microsecond = 0
+    
+    dt = datetime(year, month, day, hour, minute, second, microsecond)
+    epochNs = dayNs + ((hour * 3600 + minute * 60 + second) * 1000000 + microsecond) * 1000
+    return dt, epochNs
+
+#----------------------------------------------------------------------
+def getTodayString():
+    """获取当前本机电脑时间的日期字符串（YYYYMMDD），结果缓存到下一个零点"""
+    if getTime() >= TODAY_CACHE['expire']:
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(1)
+        
+        TODAY_CACHE['date'] = now.strftime('%Y%m%d')
+        TODAY_CACHE['expire'] = mktime(midnight.timetuple())
+        
+    return TODAY_CACHE['date']
+
+
+# 各个数据类的字段名缓存，key为类
+FIELD_NAMES_DICT = {}
+
+
+########################################################################
+class SlotsData(object):
+    """
+    使用__slots__的数据类的基类
+    
+    数据类的实例数量巨大（每个Tick、K线、委托、成交各一个），使用__slots__
+    代替__dict__保存属性可以减少内存占用和创建对象的时间。
+    由于没有了__dict__，原先data.__dict__的用法需要改为：
+    data.toDict()：转换为字典，用于写入数据库或者RPC传输
+    data.fromDict(d)：从字典（如数据库中读取的数据）更新属性
+    同时提供了__getstate__和__setstate__，保证pickle（shelve、RPC）可以正常使用。
+    """
+    __slots__ = ()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def getFieldNames(cls):
+        """获取类的所有字段名（包括父类中定义的字段）"""
+        try:
+            return FIELD_NAMES_DICT[cls]
+        except KeyError:
+            pass
+        
+        l = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            for name in slots:
+                if name not in ('__dict__', '__weakref__') and name not in l:
+                    l.append(name)
+                    
+        fieldNames = tuple(l)
+        FIELD_NAMES_DICT[cls] = fieldNames
+        return fieldNames
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def getProjection(cls):
+        """获取数据库查询时只读取本类字段的projection（不读取_id）"""
+        projection = dict.fromkeys(cls.getFieldNames(), True)
+        projection['_id'] = False
+        return projection
+
+    #----------------------------------------------------------------------
+    def toDict(self, fieldNames=None):
+        """
+        转换为字典，未赋值的字段不包括在内
+        fieldNames：只转换指定的字段，如将VtTickData按照DrTickData的字段写入数据库
+        """
+        d = {}
+        for name in fieldNames or self.getFieldNames():
+            try:
+                d[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        
+        if fieldNames:
+            return d
+        
+        # 未定义__slots__的子类还会有__dict__
+        try:
+            d.update(self.__dict__)
+        except AttributeError:
+            pass
+        
+        return d
+    
+    #----------------------------------------------------------------------
+    def fromDict(self, d):
+        """从字典中更新属性，忽略类中不存在的字段（如数据库的_id），返回对象本身"""
+        for key, value in d.iteritems():
+            try:
+                setattr(self, key, value)
+            except AttributeError:
+                pass
+        return self
+    
+    #----------------------------------------------------------------------
+    def __getstate__(self):
+        """pickle时保存的数据"""
+        return self.toDict()
+    
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        """pickle载入时恢复数据，兼容使用__dict__时保存的旧数据"""
+        self.fromDict(state)
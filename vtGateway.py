@@ -5,6 +5,7 @@ import time
 from eventEngine import *
 
 from vtConstant import *
+from vtFunction import SlotsData, parseTickTime
 
 
 ########################################################################
@@ -20,15 +21,20 @@ class VtGateway(object):
     #----------------------------------------------------------------------
     def onTick(self, tick):
         """市场行情推送"""
+        # 同一个tick对象由所有策略和模块共享，推送之前设为只读
+        tick.freeze()
+        
         # 通用事件
         event1 = Event(type_=EVENT_TICK)
         event1.dict_['data'] = tick
         self.eventEngine.put(event1)
         
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_TICK+tick.vtSymbol)
-        event2.dict_['data'] = tick
-        self.eventEngine.put(event2)
+        # 特定合约代码的事件，只在有处理函数监听时才发出
+        type_ = EVENT_TICK+tick.vtSymbol
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = tick
+            self.eventEngine.put(event2)
     
     #----------------------------------------------------------------------
     def onTrade(self, trade):
@@ -38,10 +44,12 @@ class VtGateway(object):
         event1.dict_['data'] = trade
         self.eventEngine.put(event1)
         
-        # 特定合约的成交事件
-        event2 = Event(type_=EVENT_TRADE+trade.vtSymbol)
-        event2.dict_['data'] = trade
-        self.eventEngine.put(event2)        
+        # 特定合约的成交事件，只在有处理函数监听时才发出
+        type_ = EVENT_TRADE+trade.vtSymbol
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = trade
+            self.eventEngine.put(event2)        
     
     #----------------------------------------------------------------------
     def onOrder(self, order):
@@ -51,10 +59,12 @@ class VtGateway(object):
         event1.dict_['data'] = order
         self.eventEngine.put(event1)
         
-        # 特定订单编号的事件
-        event2 = Event(type_=EVENT_ORDER+order.vtOrderID)
-        event2.dict_['data'] = order
-        self.eventEngine.put(event2)
+        # 特定订单编号的事件，只在有处理函数监听时才发出
+        type_ = EVENT_ORDER+order.vtOrderID
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = order
+            self.eventEngine.put(event2)
     
     #----------------------------------------------------------------------
     def onPosition(self, position):
@@ -64,10 +74,12 @@ class VtGateway(object):
         event1.dict_['data'] = position
         self.eventEngine.put(event1)
         
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_POSITION+position.vtSymbol)
-        event2.dict_['data'] = position
-        self.eventEngine.put(event2)
+        # 特定合约代码的事件，只在有处理函数监听时才发出
+        type_ = EVENT_POSITION+position.vtSymbol
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = position
+            self.eventEngine.put(event2)
     
     #----------------------------------------------------------------------
     def onAccount(self, account):
@@ -77,10 +89,12 @@ class VtGateway(object):
         event1.dict_['data'] = account
         self.eventEngine.put(event1)
         
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_ACCOUNT+account.vtAccountID)
-        event2.dict_['data'] = account
-        self.eventEngine.put(event2)
+        # 特定合约代码的事件，只在有处理函数监听时才发出
+        type_ = EVENT_ACCOUNT+account.vtAccountID
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = account
+            self.eventEngine.put(event2)
     
     #----------------------------------------------------------------------
     def onError(self, error):
@@ -143,8 +157,9 @@ class VtGateway(object):
 
 
 ########################################################################
-class VtBaseData(object):
+class VtBaseData(SlotsData):
     """回调函数推送数据的基础类，其他数据类继承于此"""
+    __slots__ = ('gatewayName', 'rawData')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -156,6 +171,13 @@ class VtBaseData(object):
 ########################################################################
 class VtTickData(VtBaseData):
     """Tick行情数据类"""
+    __slots__ = ('symbol', 'exchange', 'vtSymbol', 'lastPrice', 'lastVolume', 'volume',
+                 'openInterest', 'time', 'date', 'datetime', 'epochNs', 'openPrice', 'highPrice',
+                 'lowPrice', 'preClosePrice', 'upperLimit', 'lowerLimit', 'bidPrice1',
+                 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5', 'askPrice1', 'askPrice2',
+                 'askPrice3', 'askPrice4', 'askPrice5', 'bidVolume1', 'bidVolume2', 'bidVolume3',
+                 'bidVolume4', 'bidVolume5', 'askVolume1', 'askVolume2', 'askVolume3',
+                 'askVolume4', 'askVolume5')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -174,6 +196,8 @@ class VtTickData(VtBaseData):
         self.openInterest = EMPTY_INT           # 持仓量
         self.time = EMPTY_STRING                # 时间 11:20:56.5
         self.date = EMPTY_STRING                # 日期 20151009
+        self.datetime = None                    # python的datetime时间对象，由接口在创建时解析
+        self.epochNs = EMPTY_INT                # 纳秒时间戳，用于快速比较时间先后
         
         # 常规行情
         self.openPrice = EMPTY_FLOAT            # 今日开盘价
@@ -209,10 +233,58 @@ class VtTickData(VtBaseData):
         self.askVolume4 = EMPTY_INT
         self.askVolume5 = EMPTY_INT         
     
+    #----------------------------------------------------------------------
+    def freeze(self):
+        """
+        设为只读（接口推送之前调用），之后任何修改都会抛出AttributeError
+        没有在创建时解析时间的接口，在这里解析一次
+        """
+        if not self.datetime:
+            self.datetime, self.epochNs = parseTickTime(self.date, self.time)
+        self.__class__ = FrozenTickData
+    
+    
+########################################################################
+class FrozenTickData(VtTickData):
+    """
+    只读的Tick行情数据，由接口推送给所有策略和模块共享，不需要逐个复制
+    
+    和VtTickData的内存布局相同，接口创建时使用VtTickData，推送前修改__class__即可只读，
+    创建时的属性赋值没有额外开销。需要修改时请先复制：VtTickData().fromDict(tick.toDict())
+    """
+    __slots__ = ()
+    
+    #----------------------------------------------------------------------
+    def __setattr__(self, name, value):
+        """禁止修改"""
+        raise AttributeError(u'共享的行情数据只读，不能修改%s' %name)
+    
+    #----------------------------------------------------------------------
+    def __delattr__(self, name):
+        """禁止删除"""
+        raise AttributeError(u'共享的行情数据只读，不能删除%s' %name)
+    
+    #----------------------------------------------------------------------
+    def freeze(self):
+        """已经是只读"""
+        pass
+    
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        """pickle（RPC）载入时恢复数据"""
+        for key, value in state.iteritems():
+            try:
+                object.__setattr__(self, key, value)
+            except AttributeError:
+                pass
+    
     
 ########################################################################
 class VtTradeData(VtBaseData):
     """成交数据类"""
+    __slots__ = ('symbol', 'exchange', 'vtSymbol', 'tradeID', 'vtTradeID', 'orderID',
+                 'vtOrderID', 'direction', 'offset', 'price', 'volume', 'tradeTime', 'dt')
+    # dt为回测引擎中记录的成交时间（datetime对象），只在回测时赋值
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -241,6 +313,9 @@ class VtTradeData(VtBaseData):
 ########################################################################
 class VtOrderData(VtBaseData):
     """订单数据类"""
+    __slots__ = ('symbol', 'exchange', 'vtSymbol', 'orderID', 'vtOrderID', 'direction', 'offset',
+                 'price', 'totalVolume', 'tradedVolume', 'status', 'orderTime', 'cancelTime',
+                 'frontID', 'sessionID')
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -345,6 +420,7 @@ class VtLogData(VtBaseData):
         
         self.logTime = time.strftime('%X', time.localtime())    # 日志生成时间
         self.logContent = EMPTY_UNICODE                         # 日志信息
+        self.persistent = True                                  # 是否记录到数据库日志
 
 
 ########################################################################
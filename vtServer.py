@@ -9,6 +9,7 @@ from threading import Thread
 
 import vtPath
 import eventType
+from eventEngine import Event
 from vnrpc import RpcServer
 from vtEngine import MainEngine
 
@@ -18,8 +19,12 @@ class VtServer(RpcServer):
     """vn.trader服务器"""
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
-        """Constructor"""
+    def __init__(self, repAddress, pubAddress, conflateTick=False):
+        """
+        Constructor
+        conflateTick：是否合并推送行情，开启后每个合约只推送处理时的最新行情，
+        只适用于客户端仅用于界面显示的场合（客户端运行CTA策略时不能开启）
+        """
         super(VtServer, self).__init__(repAddress, pubAddress)
         self.usePickle()
         
@@ -37,22 +42,47 @@ class VtServer(RpcServer):
         self.register(self.engine.writeLog)
         self.register(self.engine.dbConnect)
         self.register(self.engine.dbInsert)
+        self.register(self.engine.dbInsertMany)
         self.register(self.engine.dbQuery)
+        self.register(self.engine.dbQueryPage)
         self.register(self.engine.dbUpdate)
+        self.register(self.engine.dbInsertAsync)
+        self.register(self.engine.dbUpdateAsync)
+        self.register(self.engine.getDbStats)
         self.register(self.engine.getContract)
         self.register(self.engine.getAllContracts)
         self.register(self.engine.getOrder)
         self.register(self.engine.getAllWorkingOrders)
         self.register(self.engine.getAllGatewayNames)
+        self.register(self.engine.enableEventProfiling)
+        self.register(self.engine.getEventStats)
         
         # 注册事件引擎发送的事件处理监听
+        self.conflateTick = conflateTick
         self.engine.eventEngine.registerGeneralHandler(self.eventHandler)
         
+        if conflateTick:
+            self.engine.eventEngine.registerConflated(eventType.EVENT_TICK, self.tickHandler)
+        
     #----------------------------------------------------------------------
     def eventHandler(self, event):
         """事件处理"""
+        # 合并推送行情时，行情事件由tickHandler处理
+        if self.conflateTick and event.type_.startswith(eventType.EVENT_TICK):
+            return
+        
+        self.publish(event.type_, event)
+        
+    #----------------------------------------------------------------------
+    def tickHandler(self, event):
+        """合并推送行情，同时推送通用和特定合约的行情事件"""
         self.publish(event.type_, event)
         
+        tick = event.dict_['data']
+        symbolEvent = Event(type_=eventType.EVENT_TICK+tick.vtSymbol)
+        symbolEvent.dict_['data'] = tick
+        self.publish(symbolEvent.type_, symbolEvent)
+        
     #----------------------------------------------------------------------
     def stopServer(self):
         """停止服务器"""